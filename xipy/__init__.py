@@ -1,6 +1,8 @@
 __docformat__ = 'restructuredtext'
 import os
 from enthought.etsconfig.api import ETSConfig
-ETSConfig.toolkit = 'qt4'
+# the GUI toolkit is Qt4, unless ETS_TOOLKIT names another (such as 'null',
+# for headless batch tools)
+ETSConfig.toolkit = os.environ.get('ETS_TOOLKIT', 'qt4')
 TEMPLATE_MRI_PATH = os.path.join(os.path.dirname(__file__),
                                  'resources/template_T1_1mm_brain.nii.gz')
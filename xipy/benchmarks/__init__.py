@@ -0,0 +1,105 @@
+"""Performance benchmarks for the xipy data pipeline.
+
+Each bench_* function runs headless on synthetic data, and returns a
+dictionary of the best wall-clock times (in seconds) of its stages.
+
+The whole suite is run by run_benchmarks.py, which compares the timings
+with a stored table of baselines, to catch performance regressions.
+"""
+import os
+import time
+
+import numpy as np
+
+# the synthetic volume sizes of the suite
+sizes = dict(small=(32,32,32), medium=(64,64,64), large=(128,128,128))
+
+# the default table of baseline timings
+baseline_file = os.path.join(os.path.dirname(__file__), 'baselines.txt')
+
+def best_time(func, *args, **kwargs):
+    """Return the best of `repeat` wall-clock times of func(*args, **kwargs)
+    """
+    repeat = kwargs.pop('repeat', 3)
+    times = []
+    for n in xrange(repeat):
+        t0 = time.time()
+        func(*args, **kwargs)
+        times.append(time.time() - t0)
+    return min(times)
+
+def print_timings(title, timings):
+    print title
+    for name in sorted(timings.keys()):
+        print '    %-40s %8.2f ms'%(name, 1e3*timings[name])
+
+def synthetic_image(shape, oblique=False):
+    """Make a NIPY Image of smoothly varying random data, with 2mm voxels
+    centered on the origin. If oblique, then the voxel grid is rotated
+    by 30 degrees about the z axis.
+    """
+    from scipy import ndimage
+    import nipy.core.api as ni_api
+    from xipy.slicing import xipy_ras
+    data = ndimage.gaussian_filter(np.random.randn(*shape), 2)
+    aff = np.diag([2., 2., 2., 1.])
+    if oblique:
+        c = np.cos(np.pi/6); s = np.sin(np.pi/6)
+        aff[:3,:3] = np.dot(np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]]),
+                            aff[:3,:3])
+    aff[:3,3] = -np.dot(aff[:3,:3], np.array(shape)/2.)
+    cmap = ni_api.AffineTransform.from_params('ijk', xipy_ras, aff)
+    return ni_api.Image(data, cmap)
+
+def load_baselines(fname=baseline_file):
+    """Read a table of baseline timings (in seconds), keyed by
+    benchmark name. Returns an empty table if there is no file.
+    """
+    baselines = dict()
+    if not os.path.exists(fname):
+        return baselines
+    for line in open(fname):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, secs = line.rsplit(None, 1)
+        baselines[name] = float(secs)
+    return baselines
+
+def save_baselines(timings, fname=baseline_file):
+    """Write the timings (in seconds) as the new table of baselines,
+    keeping any baselines of benchmarks not in timings.
+    """
+    baselines = load_baselines(fname)
+    baselines.update(timings)
+    f = open(fname, 'w')
+    try:
+        f.write('# benchmark baselines (best wall-clock times in seconds)\n')
+        for name in sorted(baselines.keys()):
+            f.write('%-70s %.6f\n'%(name, baselines[name]))
+    finally:
+        f.close()
+
+def find_regressions(timings, baselines, tolerance=1.5):
+    """Compare timings with their baselines.
+
+    Parameters
+    ----------
+    timings, baselines : dicts
+        the timings and baseline timings, keyed by benchmark name
+    tolerance : float
+        a timing is a regression if it is slower than its baseline
+        by more than this factor
+
+    Returns
+    -------
+    a list of (name, time, baseline) for each regression
+    """
+    regressions = []
+    for name in sorted(timings.keys()):
+        base = baselines.get(name)
+        if base is None:
+            continue
+        if timings[name] > tolerance*base:
+            regressions.append( (name, timings[name], base) )
+    return regressions
@@ -0,0 +1,83 @@
+import numpy as np
+from matplotlib.colors import Normalize
+
+import xipy.colors.color_mapping as cm
+import xipy.volume_utils as vu
+from xipy.colors._blend_pix import resample_and_blend, \
+     blend_same_size_arrays, resize_lookup_array
+from xipy.benchmarks import best_time, print_timings, sizes
+
+def _random_rgba(shape):
+    return np.random.randint(0, 256, size=shape+(4,)).astype('B')
+
+def bench_color_mapping(shape=sizes['medium'], repeat=3):
+    """Time mapping a normalized volume to LUT indices, and looking up
+    the RGBA bytes of the indices.
+    """
+    timings = dict()
+    scalars = np.random.randn(*shape)
+    normed = Normalize()(np.ma.masked_array(scalars))
+    timings['lut_indices'] = best_time(
+        cm.MixedAlphaColormap.lut_indices, normed, repeat=repeat
+        )
+    idx = cm.MixedAlphaColormap.lut_indices(normed)
+    timings['fast_lookup'] = best_time(
+        cm.jet.fast_lookup, idx, bytes=True, repeat=repeat
+        )
+    alpha = np.linspace(0, 1, 256)
+    timings['fast_lookup, alpha table'] = best_time(
+        cm.jet.fast_lookup, idx, alpha=alpha, bytes=True, repeat=repeat
+        )
+    print_timings('color mapping: %s volume'%(shape,), timings)
+    return timings
+
+def bench_blending(shape=sizes['medium'], repeat=3):
+    """Time blending RGBA volumes of the same size, blending a half
+    resolution volume into a full resolution volume, and resizing a
+    half resolution LUT index volume onto the full resolution grid.
+    """
+    timings = dict()
+    base = _random_rgba(shape)
+    over = _random_rgba(shape)
+    # the blending functions work in-place, so blend into copies
+    def blend_copy():
+        b = base.copy()
+        blend_same_size_arrays(b.reshape(-1,4), over.reshape(-1,4))
+    timings['blend_same_size_arrays'] = best_time(blend_copy, repeat=repeat)
+
+    half_shape = tuple([n/2 for n in shape])
+    half_over = _random_rgba(half_shape)
+    dr = np.ones(3); r0 = np.zeros(3)
+    def resample_blend_copy():
+        b = base.copy()
+        resample_and_blend(b, dr, r0, half_over, 2*dr, r0)
+    timings['resample_and_blend'] = best_time(
+        resample_blend_copy, repeat=repeat
+        )
+
+    i_bad = cm.MixedAlphaColormap.i_bad
+    half_idx = np.random.randint(0, 256, size=half_shape).astype(np.int32)
+    scale = 0.5*np.ones(3); shift = np.zeros(3)
+    timings['resize_lookup_array'] = best_time(
+        resize_lookup_array, shape, i_bad, half_idx, scale, shift,
+        repeat=repeat
+        )
+    src_aff = np.diag([2., 2., 2., 1.])
+    dst_aff = np.eye(4)
+    vu.clear_grid_maps()
+    timings['grid_map, first overlay'] = best_time(
+        lambda: (vu.clear_grid_maps(),
+                 vu.grid_map(src_aff, half_shape, dst_aff, shape)
+                 .take(half_idx, cval=i_bad)),
+        repeat=repeat
+        )
+    gmap = vu.grid_map(src_aff, half_shape, dst_aff, shape)
+    timings['grid_map, later overlays'] = best_time(
+        gmap.take, half_idx, cval=i_bad, repeat=repeat
+        )
+    print_timings('blending: %s volume'%(shape,), timings)
+    return timings
+
+if __name__ == '__main__':
+    bench_color_mapping()
+    bench_blending()
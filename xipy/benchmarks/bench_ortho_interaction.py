@@ -0,0 +1,123 @@
+"""A headless model of the ortho viewer's crosshair interaction.
+
+Three SliceFigures are drawn on Agg canvases (no display is needed), and
+a scripted crosshair path is played through the same call sequence as
+the Qt viewer:
+
+OrthoFigures.coord_event_handling -> OrthoViewer.update_fig_data
+-> BlendedImages.cut_image -> SliceImage.set_data -> the coalesced paint
+
+Each frame is timed stage by stage.
+"""
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from xipy.slicing import SAG, COR, AXI, transverse_plane_lookup
+from xipy.vis import BLITTING
+from xipy.vis.ortho_figures import OrthoFigures
+from xipy.colors.rgba_blending import BlendedImages
+from xipy.benchmarks import print_timings, synthetic_image, sizes
+
+class PathEvent(object):
+    """A stand-in for a matplotlib mouse event on a figure canvas"""
+    def __init__(self, canvas, x, y):
+        self.canvas = canvas
+        self.inaxes = True
+        self.xdata = x
+        self.ydata = y
+
+class HeadlessOrthoFigures(OrthoFigures):
+    """The display logic of MplQT4OrthoSlicesWidget, on Agg canvases.
+    Frames are painted by calling paint_frame(), as the widget does when
+    its paint timer fires.
+    """
+
+    def __init__(self, limits, figsize=(3,3), dpi=100, blit=BLITTING):
+        self._full_fov_lims = limits
+        figures = []
+        for ax in (SAG, COR, AXI):
+            fig = Figure(figsize=figsize, dpi=dpi)
+            fig.canvas = FigureCanvasAgg(fig)
+            figures.append(fig)
+        self._init_figures(figures, blit=blit)
+
+def crosshair_path(limits, nframes):
+    """Make a scripted crosshair path: a circle traced in each of the
+    sagittal, coronal and axial figures in turn.
+
+    Returns
+    -------
+    a list of (figure index, u, v) events
+    """
+    path = []
+    per_fig = max(nframes/3, 1)
+    theta = np.linspace(0, 2*np.pi, per_fig, endpoint=False)
+    for fig_idx in (SAG, COR, AXI):
+        ui, vi = transverse_plane_lookup(fig_idx)
+        (u0, u1), (v0, v1) = limits[ui], limits[vi]
+        uc = (u0 + u1)/2.; vc = (v0 + v1)/2.
+        r = min(u1 - u0, v1 - v0)/3.
+        for t in theta:
+            path.append( (fig_idx, uc + r*np.cos(t), vc + r*np.sin(t)) )
+    return path
+
+def play_path(blender, figures, path):
+    """Play the crosshair path through the figures, returning the total
+    times of each stage, and the number of frames played
+    """
+    stages = dict(crosshairs=0.0, cut_image=0.0, set_data=0.0, paint=0.0)
+    for fig_idx, u, v in path:
+        canvas = figures.figs[fig_idx].canvas
+        t0 = time.time()
+        axes = figures.coord_event_handling(PathEvent(canvas, u, v))
+        t1 = time.time()
+        planes = blender.cut_image(figures.active_voxel, axes=axes)
+        t2 = time.time()
+        figures.update_main_plot_data(planes, fig_labels=axes)
+        t3 = time.time()
+        figures.paint_frame()
+        t4 = time.time()
+        stages['crosshairs'] += t1 - t0
+        stages['cut_image'] += t2 - t1
+        stages['set_data'] += t3 - t2
+        stages['paint'] += t4 - t3
+    return stages, len(path)
+
+def bench_ortho_interaction(shape=sizes['medium'], repeat=3, nframes=60,
+                            overlay=True):
+    """Time a scripted crosshair path through the headless ortho figures,
+    with an (oblique) overlay blended onto the main image if requested.
+    Returns the per-frame times of each stage of the best pass.
+    """
+    blender = BlendedImages(vtk_order=False)
+    blender.main = synthetic_image(shape)
+    if overlay:
+        blender.over = blender.make_over_slicer(
+            synthetic_image(shape, oblique=True)
+            )
+    limits = blender.bbox
+    figures = HeadlessOrthoFigures(limits)
+    figures.initialize_plots(blender.cut_image((0,0,0)), (0,0,0), limits,
+                             interpolation='nearest')
+    path = crosshair_path(limits, nframes)
+    best = None
+    for n in xrange(repeat):
+        stages, frames = play_path(blender, figures, path)
+        if best is None or sum(stages.values()) < sum(best.values()):
+            best = stages
+    timings = dict( [ (name, secs/frames) for name, secs in best.items() ] )
+    timings['frame'] = sum(best.values())/frames
+    print_timings('ortho interaction: %s volume, %d frames (per frame)'%
+                  (shape, frames), timings)
+    print '    %-40s %8.1f'%('frames per second', 1/timings['frame'])
+    return timings
+
+if __name__ == '__main__':
+    import sys
+    nframes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    bench_ortho_interaction(nframes=nframes)
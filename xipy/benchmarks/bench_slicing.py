@@ -0,0 +1,52 @@
+import numpy as np
+
+from xipy.slicing.image_slicers import SampledVolumeSlicer, \
+     ResampledVolumeSlicer
+from xipy.benchmarks import best_time, print_timings, synthetic_image, sizes
+
+def _cut_uncached(slicer, loc, **interp_kw):
+    slicer.clear_plane_cache()
+    slicer.cut_image(loc, **interp_kw)
+
+def bench_resampled_slicer(shape=sizes['medium'], repeat=3):
+    """Time making ResampledVolumeSlicers of aligned and oblique images,
+    and cutting their three planes.
+    """
+    timings = dict()
+    loc = (0.0, 0.0, 0.0)
+    for kind in ('aligned', 'oblique'):
+        img = synthetic_image(shape, oblique=(kind=='oblique'))
+        timings['%s construction'%kind] = best_time(
+            ResampledVolumeSlicer, img, repeat=repeat
+            )
+        slicer = ResampledVolumeSlicer(img)
+        timings['%s cut_image'%kind] = best_time(
+            slicer.cut_image, loc, repeat=repeat
+            )
+    print_timings('ResampledVolumeSlicer: %s volume'%(shape,), timings)
+    return timings
+
+def bench_sampled_slicer(shape=sizes['medium'], repeat=3):
+    """Time cutting the three planes of a SampledVolumeSlicer at the
+    full and preview spline orders, without the plane cache.
+    """
+    timings = dict()
+    loc = (0.0, 0.0, 0.0)
+    img = synthetic_image(shape, oblique=True)
+    slicer = SampledVolumeSlicer(img)
+    timings['cut_image'] = best_time(
+        _cut_uncached, slicer, loc, repeat=repeat
+        )
+    timings['cut_image preview'] = best_time(
+        _cut_uncached, slicer, loc, preview=True, repeat=repeat
+        )
+    slicer.cut_image(loc)
+    timings['cut_image cached'] = best_time(
+        slicer.cut_image, loc, repeat=repeat
+        )
+    print_timings('SampledVolumeSlicer: %s volume'%(shape,), timings)
+    return timings
+
+if __name__ == '__main__':
+    bench_resampled_slicer()
+    bench_sampled_slicer()
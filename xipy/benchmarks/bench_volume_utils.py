@@ -0,0 +1,55 @@
+import numpy as np
+
+import xipy.volume_utils as vu
+from xipy.benchmarks import best_time, print_timings, synthetic_image, sizes
+
+def _random_map(nvox, nmeasures, dtype='d'):
+    # a grid with twice as many points as the map has voxels
+    side = int(np.ceil((2*nvox)**(1/3.)))
+    grid = (side, side, side)
+    flat_idx = np.random.permutation(side**3)[:nvox]
+    vox_indices = np.array(np.unravel_index(flat_idx, grid)).T
+    sig = np.random.randn(nvox, nmeasures).astype(dtype)
+    return sig, vox_indices, grid
+
+def bench_signal_array_to_masked_vol(nvox=100000, nmeasures=100, repeat=3):
+    """Time scattering an nvox x nmeasures signal matrix into a masked
+    volume, into new arrays and into a reused output array.
+    """
+    sig, vox_indices, grid = _random_map(nvox, nmeasures)
+    timings = dict()
+    timings['new float64 volume'] = best_time(
+        vu.signal_array_to_masked_vol, sig, vox_indices,
+        grid_shape=grid, repeat=repeat
+        )
+    timings['new float32 volume'] = best_time(
+        vu.signal_array_to_masked_vol, sig, vox_indices,
+        grid_shape=grid, dtype=np.float32, repeat=repeat
+        )
+    out = vu.signal_array_to_masked_vol(sig, vox_indices, grid_shape=grid,
+                                        dtype=np.float32)
+    timings['reused float32 volume'] = best_time(
+        vu.signal_array_to_masked_vol, sig, vox_indices,
+        out=out, repeat=repeat
+        )
+    print_timings('signal_array_to_masked_vol: %d voxels x %d measures'%
+                  (nvox, nmeasures), timings)
+    return timings
+
+def bench_resample_to_world_grid(shape=sizes['medium'], repeat=3):
+    """Time resampling aligned and oblique images onto the world grid,
+    with nearest neighbor and cubic spline interpolation.
+    """
+    timings = dict()
+    for kind in ('aligned', 'oblique'):
+        img = synthetic_image(shape, oblique=(kind=='oblique'))
+        for order in (0, 3):
+            timings['%s, order %d'%(kind, order)] = best_time(
+                vu.resample_to_world_grid, img, order=order, repeat=repeat
+                )
+    print_timings('resample_to_world_grid: %s volume'%(shape,), timings)
+    return timings
+
+if __name__ == '__main__':
+    bench_signal_array_to_masked_vol()
+    bench_resample_to_world_grid()
@@ -0,0 +1,91 @@
+"""Run the benchmark suite on synthetic volumes, and compare the timings
+with the stored baselines.
+
+Usage: python run_benchmarks.py [options]
+
+With --save, the timings become the new baselines. Otherwise, the exit
+status is 1 if any timing is slower than its baseline by more than the
+tolerance factor, and 2 if there are no baselines to check against (no
+baselines are shipped, since the timings depend on the machine: run once
+with --save on the machine that checks for regressions).
+"""
+import sys
+from optparse import OptionParser
+
+# keep everything headless
+import matplotlib
+matplotlib.use('Agg')
+
+import xipy.benchmarks as bm
+from xipy.benchmarks.bench_volume_utils import \
+     bench_signal_array_to_masked_vol, bench_resample_to_world_grid
+from xipy.benchmarks.bench_slicing import bench_resampled_slicer, \
+     bench_sampled_slicer
+from xipy.benchmarks.bench_colors import bench_color_mapping, bench_blending
+from xipy.benchmarks.bench_ortho_interaction import bench_ortho_interaction
+
+# the benchmarks run at each volume size
+volume_benchmarks = [ bench_resample_to_world_grid,
+                      bench_resampled_slicer,
+                      bench_sampled_slicer,
+                      bench_color_mapping,
+                      bench_blending,
+                      bench_ortho_interaction ]
+
+def run_suite(size_names, repeat=3):
+    """Run the suite at each named volume size (see bm.sizes), and
+    return all timings, keyed by 'benchmark [size]: stage'.
+    """
+    timings = dict()
+    for size in size_names:
+        shape = bm.sizes[size]
+        for bench in volume_benchmarks:
+            stages = bench(shape=shape, repeat=repeat)
+            for stage, secs in stages.items():
+                timings['%s [%s]: %s'%(bench.__name__, size, stage)] = secs
+    stages = bench_signal_array_to_masked_vol(repeat=repeat)
+    for stage, secs in stages.items():
+        timings['bench_signal_array_to_masked_vol: %s'%stage] = secs
+    return timings
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--size', action='append', dest='sizes',
+                      choices=sorted(bm.sizes.keys()),
+                      help='volume size to run (may be repeated; '\
+                      'by default small and medium)')
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help='take the best of this many runs')
+    parser.add_option('-b', '--baselines', default=bm.baseline_file,
+                      help='the baseline table file')
+    parser.add_option('-t', '--tolerance', type='float', default=1.5,
+                      help='the slowdown factor counted as a regression')
+    parser.add_option('--save', action='store_true', default=False,
+                      help='save the timings as the new baselines')
+    opts, args = parser.parse_args(argv)
+    sizes = opts.sizes or ['small', 'medium']
+
+    timings = run_suite(sizes, repeat=opts.repeat)
+    if opts.save:
+        bm.save_baselines(timings, opts.baselines)
+        print 'saved %d baselines to %s'%(len(timings), opts.baselines)
+        return 0
+    baselines = bm.load_baselines(opts.baselines)
+    checked = [name for name in timings if name in baselines]
+    if not checked:
+        print >> sys.stderr, 'no baselines for these benchmarks in %s '\
+              '(run with --save first)'%opts.baselines
+        return 2
+    regressions = bm.find_regressions(timings, baselines,
+                                      tolerance=opts.tolerance)
+    if not regressions:
+        print 'no regressions against %d baselines'%len(checked)
+        return 0
+    print 'regressions (slower than %.1fx the baseline):'%opts.tolerance
+    for name, secs, base in regressions:
+        print '    %-60s %8.2f ms (baseline %.2f ms)'%(name, 1e3*secs,
+                                                        1e3*base)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -70,6 +70,11 @@ class MixedAlphaColormap(LinearSegmentedColormap):
         """
         *X* is already in the form of LUT indices, simply perform
         an indexing into the LUT and return
+
+        *alpha* may be a scalar, or an alpha value for each of the N
+        LUT entries. In the last case, the alpha of the last entry is
+        repeated for i_under and i_over, unless the alpha values of
+        i_under and i_over are given as two more entries.
         """
         if not self._isinit: self._init()
         if not cbook.iterable(Xi):
@@ -78,11 +83,12 @@ class MixedAlphaColormap(LinearSegmentedColormap):
         else:
             vtype = 'array'
         if cbook.iterable(alpha):
-            if len(alpha) != self.N:
+            if len(alpha) not in (self.N, self.N+2):
                 raise ValueError('Provided alpha LUT is not the right length')
             alpha = np.clip(alpha, 0, 1)
-            # repeat the last alpha value for i_under, i_over
-            alpha = np.r_[alpha, alpha[-1], alpha[-1]]
+            if len(alpha) == self.N:
+                # repeat the last alpha value for i_under, i_over
+                alpha = np.r_[alpha, alpha[-1], alpha[-1]]
         else:
             alpha = min(alpha, 1.0) # alpha must be between 0 and 1
             alpha = max(alpha, 0.0)
@@ -17,16 +17,8 @@ from enthought.mayavi.sources.vtk_data_source import VTKDataSource, \
 from enthought.tvtk.api import tvtk
 
 # -- XIPY imports
-from xipy.colors.rgba_blending import BlendedImages, quick_convert_rgba_to_vtk
-
-import time
-def time_wrap(fcall, ldict, gdict=None):
-    if gdict is None:
-        gdict = globals()
-    t0 = time.time()
-    exec fcall in gdict, ldict
-    t = time.time()
-    print '%s: %1.3f sec'%(fcall, (t-t0))
+from xipy.colors.rgba_blending import BlendedImages
+import xipy.instrumentation as instr
 
 # -- A New RGBA-enabled ArraySource ------------------------------------------
 def _check_scalar_array(obj, name, value):
@@ -216,6 +208,10 @@ class MasterSource(VTKDataSource):
     blended_channel = 'blended_colors'
 
     colors_changed = t.Event
+
+    # optional object with a request_render() method, to batch the
+    # renders requested by this source (eg, a RenderScheduler)
+    render_scheduler = t.Any
     
     rgba_channels = t.Property
     all_channels = t.Property
@@ -223,6 +219,9 @@ class MasterSource(VTKDataSource):
     def __init__(self, *args, **kwargs):
         super(MasterSource, self).__init__(*args, **kwargs)
         self.data = tvtk.ImageData()
+        # the ndarrays whose memory is shared with the point data arrays,
+        # keyed by channel name
+        self._shared_arrays = dict()
 
     @t.on_trait_change('blender')
     def _check_vtk_order(self):
@@ -288,7 +287,6 @@ class MasterSource(VTKDataSource):
         # otherwise, append/set a new array with over_channel tag
         updating = True #self.over_channel not in self.all_channels
 
-        print 'should update over rgba, blended rgba'
         self.set_new_array(
             self.blender.over_rgba, self.over_channel, update=False
             )        
@@ -297,6 +295,45 @@ class MasterSource(VTKDataSource):
             self.blender.blended_rgba, self.blended_channel
             )
 
+    @t.on_trait_change('blender.layers_changed')
+    def _set_layers(self):
+        # layers are only composited into the blended array
+        if not self.blender.main_rgba.size:
+            return
+        self.set_new_array(
+            self.blender.blended_rgba, self.blended_channel
+            )
+
+    @t.on_trait_change('blender.rgba_region_changed')
+    def _update_array_region(self, names_region):
+        # A sub-region of some RGBA arrays have changed in-place. If a
+        # channel shares its memory with the changed array, then VTK
+        # only needs to be told that it is modified. Otherwise, fall back
+        # on re-setting the whole array. In either case, the pipeline
+        # does not need to be rebuilt.
+        names, region = names_region
+        t0 = instr.start()
+        channels = dict(main_rgba=self.main_channel,
+                        over_rgba=self.over_channel,
+                        blended_rgba=self.blended_channel)
+        pdata = self.data.point_data
+        for name in names:
+            chan_name = channels[name]
+            chan = pdata.get_array(chan_name)
+            if not chan:
+                continue
+            arr = getattr(self.blender, name)
+            shared = self._shared_arrays.get(chan_name)
+            if shared is None or not np.may_share_memory(shared, arr):
+                self.set_new_array(arr, chan_name, update=False)
+            chan.modified()
+        self.data.modified()
+        instr.stop('vtk.update_region', t0)
+        if self.render_scheduler is not None:
+            self.render_scheduler.request_render()
+        else:
+            self.render()
+
     def _push_changes(self):
         # this should be called when..
         # * arrays are added/removed
@@ -319,16 +356,18 @@ class MasterSource(VTKDataSource):
     ## in scalar_data. If main_rgba isn't present, then set it to
     ## over_rgba (if present)
 
+    @instr.timed('vtk.change_primary_scalars')
     def _change_primary_scalars(self, arr, name):
         """
 
         Parameters
         ----------
 
-        arr: ndarray, shape (Nx, Ny, Nz, 4)
+        arr: ndarray, shape (Nz, Ny, Nx, 4)
            If this is going in as primary scalars, it is definitely an RGBA
-           vector array provided by a BlendedImages. Therefore is needs to
-           be reshaped to C-order (Nz, Ny, Nx, 4)
+           vector array provided by a BlendedImages in VTK order. Its C-order
+           memory layout is already the VTK point ordering, so it is shared
+           with the ImageData without copying.
 
         name: str
            array label
@@ -338,9 +377,7 @@ class MasterSource(VTKDataSource):
                and pd.scalars.size != arr.size:
             #self.flush_arrays(update=False)
             self.safe_remove_arrays()
-        rgba = quick_convert_rgba_to_vtk(arr)
-        xyz_shape = rgba.shape[:3]
-        flat_shape = (np.prod(xyz_shape), 4)
+        xyz_shape = arr.shape[:3][::-1]
         dataset = self.data
 
 
@@ -355,7 +392,7 @@ class MasterSource(VTKDataSource):
         dataset.scalar_type = get_vtk_array_type(arr.dtype)
 
         # set the scalars and name
-        self.set_new_array(rgba, name, update=False)
+        self.set_new_array(arr, name, update=False)
 ##         pd.scalars = rgba.reshape(flat_shape)
 ##         pd.scalars.name = name
 
@@ -386,10 +423,12 @@ class MasterSource(VTKDataSource):
 ##                     node.stop()
             # now remove the array safely
             self.data.point_data.remove_array(name)
+            self._shared_arrays.pop(name, None)
 
         # XXX: is this right?
         self._push_changes()
 
+    @instr.timed('vtk.set_new_array')
     @disable_render
     def set_new_array(self, arr, name, update=True):
         """
@@ -404,9 +443,18 @@ class MasterSource(VTKDataSource):
 
         name : str
           name of the array
-        
+
+        Notes
+        -----
+        When `arr` is C-contiguous (as BlendedImage RGBA arrays are), the
+        flattened array is a view on it, and tvtk shares that memory with
+        VTK rather than copying it. A reference to the view is held
+        until the channel is removed or replaced. In-place changes
+        to `arr` are therefore seen by VTK, but they must be followed
+        by a call to Modified() on the channel.
         """
         pdata = self.data.point_data
+        arr = np.ascontiguousarray(arr)
         if len(arr.shape) > 2:
             if len(arr.shape) > 3:
                 flat_arr = arr.reshape(np.prod(arr.shape[:3]), 4)
@@ -420,6 +468,7 @@ class MasterSource(VTKDataSource):
         else:
             n = pdata.add_array(flat_arr)
             pdata.get_array(n).name = name
+        self._shared_arrays[name] = flat_arr
         if update:
             self._push_changes()
 
@@ -489,18 +538,15 @@ class SetImageActiveAttribute(SetActiveAttribute):
                 if input_data is not None:
                     input_scalars = input_data.scalars
                     if input_scalars and input_scalars.name == scalars_name:
-                        print 'setting dtype'
                         odata.scalar_type = input_scalars.data_type
 
     def update_data(self):
-        print 'setting up output from update_data'
         self._setup_output()
         SetActiveAttribute.update_data(self)
     
     def update_pipeline(self):
 ##         super(SetImageActiveAttribute, self).update_pipeline()
         SetActiveAttribute.update_pipeline(self)
-        print 'setting up output from update_pipeline'
         self._setup_output()
         
 class SetImageActiveAttributeFactory(SetActiveAttributeFactory):
@@ -18,8 +18,10 @@ from _blend_pix import resample_and_blend, resize_lookup_array
 from _blend_pix import *
 import xipy.colors.color_mapping as cm
 import xipy.volume_utils as vu
+import xipy.instrumentation as instr
+from xipy.workers import WorkerPool
 from xipy.slicing.image_slicers import ResampledIndexVolumeSlicer, \
-     SAG, COR, AXI, xipy_ras
+     SparseVolumeSlicer, SAG, COR, AXI, xipy_ras
 
 def blend_two_images(base_img, base_cmap, base_alpha,
                      over_img, over_cmap, over_alpha):
@@ -33,14 +35,14 @@ def blend_two_images(base_img, base_cmap, base_alpha,
         The underlying image
     base_cmap : matplotlib.colors.LinearSegmentedColormap
         The mapping function to convert base_img's scalars to RGBA colors
-    base_alpha : scalar or len-256 iterable (optional)
+    base_alpha : scalar or len-256 (or len-258) iterable (optional)
         the strength of this map when alpha blending;
         scalar in range [0,1], iterable should be ints from [0,255]
     over_img : ResampledVolumeSlicer
         The overlying image
     over_cmap : matplotlib.colors.LinearSegmentedColormap
         The mapping function to convert over_img's scalars to RGBA colors
-    over_alpha : scalar or len-256 iterable (optional)
+    over_alpha : scalar or len-256 (or len-258) iterable (optional)
         the strength of this map when alpha blending;
         scalar in range [0,1], iterable should be ints from [0,255]
 
@@ -72,7 +74,7 @@ def normalize_and_map(arr, cmap, alpha=1, norm_min=None, norm_max=None):
         array to map
     cmap : xipy.colors.color_mapping.MixedAlphaColormap
         the mapping function
-    alpha : scalar or len-256 iterable (optional)
+    alpha : scalar or len-256 (or len-258) iterable (optional)
         the strength of this map when alpha blending;
         scalar in range [0,1], iterable should be ints from [0,255]
     norm_min : scalar (optional)
@@ -101,6 +103,29 @@ def blend_helper(a1, a2):
     a2.shape = xyz_shape + (4,)
 
 
+class IndexLayer(t_ui.HasTraits):
+    """
+    One layer of a BlendedArrays stack: an array of LUT indices, with
+    its own color mapping properties.
+    """
+
+    name = t_ui.Str
+    # the LUT index array, shaped like the main index array
+    idx = t_ui.Array(comparison_mode=t_ui.NO_COMPARE)
+    cmap = t_ui.Instance(cm.MixedAlphaColormap)
+    alpha = t_ui.Any(1.0)
+    visible = t_ui.Bool(True)
+    # for BlendedImages: the image of this layer, and how it is mapped
+    # to LUT indices
+    image = t_ui.Any(comparison_mode=t_ui.NO_COMPARE)
+    norm = t_ui.Tuple((0.0, 0.0))
+    spline_order = t_ui.Range(low=0,high=5,value=0)
+
+    def __init__(self, **traits):
+        t_ui.HasTraits.__init__(self, **traits)
+        if not self.cmap:
+            self.set(cmap=cm.jet, trait_change_notify=False)
+
 class BlendedArrays(t_ui.HasTraits):
     """
     This class can color map and blend two like-sized arrays
@@ -108,6 +133,10 @@ class BlendedArrays(t_ui.HasTraits):
 
     This is intended as a parent class, whose subclasses will
     provide and manager their own LUT index arrays (_main_idx and _over_idx)
+
+    Any number of further IndexLayers may be stacked above these two
+    arrays. Only their LUT indices are stored, and they are color mapped
+    and blended in one pass over the planes of blended_rgba.
     """
 
     # The LUT index images
@@ -117,7 +146,14 @@ class BlendedArrays(t_ui.HasTraits):
     # the RGBA byte arrays
     main_rgba = t_ui.Array(dtype='B', comparison_mode=t_ui.NO_COMPARE)
     over_rgba = t_ui.Array(dtype='B', comparison_mode=t_ui.NO_COMPARE)
-    blended_rgba = t_ui.Property(depends_on='main_rgba, over_rgba')
+    blended_rgba = t_ui.Property(
+        depends_on='main_rgba, over_rgba, layers_changed'
+        )
+
+    # The stack of layers blended (in order) above main and over
+    layers = t_ui.List(IndexLayer)
+    # Fired when the layers must be re-composited
+    layers_changed = t_ui.Event
 
     # Color mapping properties
     main_cmap = t_ui.Instance(cm.MixedAlphaColormap)
@@ -129,7 +165,16 @@ class BlendedArrays(t_ui.HasTraits):
     main_alpha = t_ui.Any # can be a float or array??
     over_alpha = t_ui.Any
 
+    # Fired with a (names, region) pair when the RGBA arrays have been
+    # changed in-place over a sub-region, instead of being reset.
+    # The names are those of the changed arrays (eg 'over_rgba' and
+    # 'blended_rgba'), and region is a tuple of slices into them.
+    rgba_region_changed = t_ui.Event
+
     def __init__(self, **traits):
+        # the main and over index arrays sorted by LUT index (see
+        # _sorted_index), made on demand
+        self._sorted_indices = dict()
         t_ui.HasTraits.__init__(self, **traits)
         if not self.main_cmap:
             self.set(main_cmap=cm.gray, trait_change_notify=False)
@@ -178,22 +223,62 @@ class BlendedArrays(t_ui.HasTraits):
 
     @t_ui.cached_property
     def _get_blended_rgba(self):
-        print 'update to blended image triggered'
         has_over = len(self.over_rgba)
         has_main = len(self.main_rgba)
+        has_layers = has_main and \
+                     len(self._visible_layers(self.main_rgba.shape[:-1]))
         # XXX: MAYBE SHOULD FILL ALPHA CHANNEL WITH 255 WHEN NOT BLENDING
-        if not has_over:
+        if not has_over and not has_layers:
             # even return this if main_rgba is empty
             return self.main_rgba
         if has_over and not has_main:
             return self.over_rgba
+        t0 = instr.start()
         blended_rgba = self.main_rgba.copy()
-        blend_helper(blended_rgba, self.over_rgba)
+        if has_over:
+            blend_helper(blended_rgba, self.over_rgba)
+        self._composite_layers(blended_rgba)
+        instr.stop('blend.blended_rgba', t0)
         return blended_rgba
 
+    @t_ui.on_trait_change('layers, layers_items, layers.idx, layers.cmap, '\
+                          'layers.alpha, layers.visible')
+    def _layers_modified(self):
+        self.layers_changed = True
+
+    def _visible_layers(self, shape):
+        return [layer for layer in self.layers
+                if layer.visible and layer.idx.shape == shape]
+
+    @instr.timed('blend.layers')
+    def _composite_layers(self, rgba, region=None):
+        """Blend the visible layers into rgba (in-place) over region,
+        a plane at a time.
+        """
+        layers = self._visible_layers(rgba.shape[:-1])
+        if not layers:
+            return
+        if region is None:
+            region = tuple( [slice(0, n) for n in rgba.shape[:-1]] )
+        alphas = [self._check_alpha(layer.alpha) for layer in layers]
+        if rgba.ndim > 2:
+            r0 = region[0]
+            planes = [ (i,) + region[1:] for i in xrange(r0.start, r0.stop) ]
+        else:
+            planes = [region]
+        for plane in planes:
+            plane_rgba = rgba[plane].copy()
+            for layer, alpha in zip(layers, alphas):
+                layer_rgba = layer.cmap.fast_lookup(
+                    layer.idx[plane], alpha=alpha, bytes=True
+                    )
+                blend_helper(plane_rgba, layer_rgba)
+            rgba[plane] = plane_rgba
+
     # Keep main/over RGBA values locked to the index images
     @t_ui.on_trait_change('_main_idx, _over_idx')
     def _map_rgba(self, name, new):
+        t0 = instr.start()
         if name=='_main_idx':
             self.main_rgba = self.main_cmap.fast_lookup(
                 self._main_idx, alpha=self.main_alpha, bytes=True
@@ -202,10 +287,11 @@ class BlendedArrays(t_ui.HasTraits):
             self.over_rgba = self.over_cmap.fast_lookup(
                 self._over_idx, alpha=self.over_alpha, bytes=True
                 )
+        instr.stop('lut.map_rgba', t0)
     
     @t_ui.on_trait_change('main_cmap, over_cmap')
     def _remap_index_image(self, name, new):
-        print 'remapping', name
+        instr.count('lut.remap_cmap')
         if name=='main_cmap' and len(self._main_idx):
             self.main_rgba[:] = self.main_cmap.fast_lookup(
                 self._main_idx, alpha=self.main_alpha, bytes=True
@@ -219,34 +305,112 @@ class BlendedArrays(t_ui.HasTraits):
             self.over_rgba = self.over_rgba
 
     @t_ui.on_trait_change('main_alpha, over_alpha')
-    def _fast_remap_alpha(self, name, changed):
-        print 'remapping alpha'
-        if name=='main_alpha':
-            # store new alpha
-            main_alpha = self._check_alpha(self.main_alpha)
-            self.trait_setq(main_alpha=main_alpha)
-            if len(self._main_idx):
-                # if there's an image, remap it
-                a_under, a_over, a_bad = self.main_cmap._lut[-3:,-1]
-                alpha_lut = np.r_[main_alpha*255, a_under, a_over, a_bad]
-                alpha_lut.take(self._main_idx, axis=0,
-                               mode='clip', out=self.main_rgba[...,3])
-                print 'looked up new main alpha chan'
-                # have to do this explicitly to set off trait notification
-                self.main_rgba = self.main_rgba
-        elif name=='over_alpha':
-            # store new alpha
-            over_alpha = self._check_alpha(self.over_alpha)
-            self.trait_setq(over_alpha=over_alpha)
-            if len(self._over_idx):
-                # if there's an image, remap it
-                a_under, a_over, a_bad = self.over_cmap._lut[-3:,-1]
-                alpha_lut = np.r_[over_alpha*255, a_under, a_over, a_bad]
-                alpha_lut.take(self._over_idx, axis=0,
-                               mode='clip', out=self.over_rgba[...,3])
-                print 'looked up new over alpha chan'
-                # have to do this explicitly to set off trait notification
-                self.over_rgba = self.over_rgba
+    def _fast_remap_alpha(self, obj, name, old, new):
+        which = name.split('_')[0]
+        # store new alpha
+        alpha = self._check_alpha(new)
+        self.trait_setq(**{name: alpha})
+        idx = getattr(self, '_%s_idx'%which)
+        if not len(idx):
+            return
+        # if there's an image, remap it
+        cmap = getattr(self, which+'_cmap')
+        rgba = getattr(self, which+'_rgba')
+        alpha_lut = self._alpha_lut(cmap, alpha)
+        region = self._changed_alpha_region(which, old, alpha_lut)
+        if region is None:
+            instr.count('lut.alpha_unchanged')
+            return
+        t0 = instr.start()
+        if region != tuple( [slice(0, n) for n in idx.shape] ):
+            rgba[region + (3,)] = alpha_lut.take(idx[region], mode='clip')
+            self._patch_blended_region(which+'_rgba', region)
+            instr.stop('lut.alpha_region', t0)
+            return
+        alpha_lut.take(idx, axis=0, mode='clip', out=rgba[...,3])
+        instr.stop('lut.alpha_full', t0)
+        # have to do this explicitly to set off trait notification
+        setattr(self, which+'_rgba', rgba)
+
+    def _alpha_lut(self, cmap, alpha):
+        """The alpha byte values that fast_lookup maps each entry of
+        cmap's LUT to (including the under, over and bad entries).
+        """
+        if not cmap._isinit:
+            cmap._init()
+        alpha = self._check_alpha(alpha)
+        if len(alpha) == cmap.N:
+            # as in fast_lookup, repeat the last alpha for under and over
+            alpha = np.r_[alpha, alpha[-1], alpha[-1]]
+        return np.r_[alpha*255, cmap._lut[cmap.i_bad,-1]*255]
+
+    def _index_version(self, which):
+        # counts in-place changes to the main or over index array
+        return 0
+
+    def _sorted_index(self, which):
+        """Return the flat positions of the main or over index array
+        sorted by LUT index, and where the positions of each LUT index
+        start in that order. This is made once per index array, so that
+        the points mapped to a few LUT entries can be found without
+        scanning the whole array.
+        """
+        idx = getattr(self, '_%s_idx'%which)
+        version = self._index_version(which)
+        cached = self._sorted_indices.get(which)
+        if cached is None or cached[0] is not idx or cached[1] != version:
+            t0 = instr.start()
+            flat_idx = idx.ravel()
+            order = flat_idx.argsort(kind='mergesort')
+            starts = np.searchsorted(
+                flat_idx[order], np.arange(cm.MixedAlphaColormap.i_bad+2)
+                )
+            cached = (idx, version, order, starts)
+            self._sorted_indices[which] = cached
+            instr.stop('lut.sort_index', t0)
+        return cached[2:]
+
+    def _changed_alpha_region(self, which, old_alpha, alpha_lut):
+        """Find the bounding box of the points in the main or over index
+        array whose alpha byte values differ between the old alpha
+        function and the new alpha LUT. Returns a tuple of slices, or
+        None if no point has changed.
+        """
+        idx = getattr(self, '_%s_idx'%which)
+        full_region = tuple( [slice(0, n) for n in idx.shape] )
+        if old_alpha is None:
+            return full_region
+        old_lut = self._alpha_lut(getattr(self, which+'_cmap'), old_alpha)
+        if old_lut.shape != alpha_lut.shape:
+            return full_region
+        changed_lut = old_lut.astype('B') != alpha_lut.astype('B')
+        if not changed_lut.any():
+            return None
+        if changed_lut[:-3].all():
+            # every color in the table changed
+            return full_region
+        # only visit the points mapped to the changed LUT entries
+        order, starts = self._sorted_index(which)
+        entries = changed_lut.nonzero()[0]
+        changed = [order[starts[e]:starts[e+1]] for e in entries]
+        return vu.flat_index_bbox(np.concatenate(changed), idx.shape)
+
+    def _patch_blended_region(self, name, region):
+        """After the RGBA array `name` has been updated in-place over
+        region, re-blend that region of blended_rgba (if it is a
+        distinct array) and fire the rgba_region_changed event.
+        """
+        names = [name]
+        blended = self.blended_rgba
+        if len(self.main_rgba) and blended is not self.main_rgba and \
+               blended is not self.over_rgba:
+            sub_main = self.main_rgba[region].copy()
+            if len(self.over_rgba):
+                blend_helper(sub_main, self.over_rgba[region].copy())
+            blended[region] = sub_main
+            self._composite_layers(blended, region=region)
+            names.append('blended_rgba')
+        self.rgba_region_changed = (names, region)
             
     # handle norm later.. I'm thinking this can be accomplished with a
     # sort of transfer function from integer indices to indices
@@ -296,11 +460,29 @@ class BlendedImages(BlendedArrays, ResampledIndexVolumeSlicer):
     # Adapting to ResampledIndexVolumeSlicer spec
     image_arr = t_ui.Property #(depends_on='main_rgba, over_rgba')
 
+    # Progressive loading: if a WorkerPool is given, then large main and
+    # over images are first set from a downsampled copy, while the finer
+    # levels of a resolution pyramid are made in the background. Each
+    # level is swapped in as soon as it is ready (if it is finer than the
+    # level in use), ending with the full resolution image.
+    workers = t_ui.Instance(WorkerPool)
+    # the downsampling factors of the preview levels
+    preview_factors = t_ui.Tuple((4, 2))
+    # the minimum size of image that gets previewed
+    preview_min_voxels = t_ui.Int(128**3)
+    # the downsampling factors of the main and over images in use
+    main_level = t_ui.Int(1)
+    over_level = t_ui.Int(1)
+
     def __init__(self, **traits):
         # trap main and over traits here, since their setup depends
         # on other traits
         main = traits.pop('main', None)
         over = traits.pop('over', None)
+        # the resolution levels made for the current main and over images,
+        # and a counter to expire the levels of previous images
+        self._pyramids = dict(main=dict(), over=dict())
+        self._pyramid_generation = dict(main=0, over=0)
         BlendedArrays.__init__(self, **traits)
         self.main = main
         self.over = over
@@ -382,25 +564,24 @@ class BlendedImages(BlendedArrays, ResampledIndexVolumeSlicer):
         transpose mode.
         """
         if self.main==None:
+            self._expire_pyramid('main')
             # "unload" main image
             self._main_idx = np.array([], np.int32)
             # trigger remapping of over index
             self.over = self.over
+            self._index_layers()
             return
         if isinstance(self.main, ni_api.Image):
-            img = self.main
-            spatial_axes = vtk_ax_order if self.vtk_order else None
-            main = ResampledIndexVolumeSlicer(
-                img, norm=self.main_norm,
-                spatial_axes=spatial_axes,
-                order=self.main_spline_order
-                )
+            if self._load_progressively('main', self.main):
+                return
             # go ahead and be re-entrant
-            self.main = main
+            self.main = self.make_main_slicer(self.main)
             return
         if not isinstance(self.main, ResampledIndexVolumeSlicer):
             raise ValueError('main image should be a NIPY Image, or '\
                              'a ResampledIndexVolumeSlicer')
+        if self.main not in self._pyramids['main'].values():
+            self._expire_pyramid('main')
         # self.main is definitely the right type, but is it aligned?
         if self.vtk_order:
             # with VTK order, x,y,z must be aligned with k, j, i
@@ -428,33 +609,33 @@ class BlendedImages(BlendedArrays, ResampledIndexVolumeSlicer):
             self._main_idx = self.main.image_arr
             # remap the over image (??)
             self.over = self.over
+        self._index_layers()
         self._adapt_to_slicer()
 
     @t_ui.on_trait_change('over')
     def _udpate_obytes(self):
         if self.over==None:
+            self._expire_pyramid('over')
             self._over_idx = np.array([], np.int32)
             self._adapt_to_slicer()
             return
         # define the axes order to resample onto
-        if self.vtk_order:
-            ax_order = vtk_ax_order
-        elif self.main:
-            ax_order = vu.find_spatial_correspondence(self.main.coordmap)
-        else:
-            ax_order = None
+        ax_order = self._over_axes_order()
         if type(self.over)==ni_api.Image:
-            over = ResampledIndexVolumeSlicer(
-                self.over, norm=self.over_norm,
-                spatial_axes=ax_order,
-                order=self.over_spline_order
-                )
+            if self._load_progressively('over', self.over):
+                return
             # go ahead and be re-entrant
-            self.over = over
+            self.over = self.make_over_slicer(self.over)
+            return
+        if isinstance(self.over, SparseVolumeSlicer):
+            self.over = self.make_over_slicer(self.over)
             return
         if type(self.over) != ResampledIndexVolumeSlicer:
-            raise ValueError('over image should be a NIPY Image, or '\
-                             'a ResampledIndexVolumeSlicer')
+            raise ValueError('over image should be a NIPY Image, a '\
+                             'SparseVolumeSlicer, or a '\
+                             'ResampledIndexVolumeSlicer')
+        if self.over not in self._pyramids['over'].values():
+            self._expire_pyramid('over')
         
         # self.over is definitely the right type, but is it aligned?
         if ax_order:
@@ -481,24 +662,280 @@ class BlendedImages(BlendedArrays, ResampledIndexVolumeSlicer):
             self.trait_setq(_over_idx=temp_idx)
             self._resample_over_into_main()
 
-    def _resample_over_into_main(self):
-        i_bad = self.over_cmap.i_bad
-        vox_to_vox = ni_api.compose(
-            self.over.coordmap.inverse(), self.main.coordmap
+    def make_main_slicer(self, image, norm=None, order=None,
+                         spatial_axes=None):
+        """Make the ResampledIndexVolumeSlicer of `image` that would be
+        made by setting it as the main image. This does not change the
+        state of this object, so it may be run in a background thread.
+
+        Parameters
+        ----------
+        image : NIPY Image
+            the new main image
+        norm : (black-pt, white-pt) pair, optional
+            the normalization (by default, main_norm)
+        order : int, optional
+            the spline order of the resampling (by default,
+            main_spline_order)
+        spatial_axes : sequence, optional
+            the array axes order to resample onto (by default, set by
+            vtk_order). An empty sequence keeps the image's own order.
+            From a background thread, pass the parameters as they were
+            when the job was submitted (see slicer_params).
+        """
+        if norm is None:
+            norm = self.main_norm
+        if order is None:
+            order = self.main_spline_order
+        if spatial_axes is None:
+            spatial_axes = self._main_axes_order()
+        return ResampledIndexVolumeSlicer(
+            image, norm=norm,
+            spatial_axes=spatial_axes or None,
+            order=order
             )
-        print vox_to_vox.affine
-        print self._main_idx.shape
-        print self._over_idx.shape
-        # this is supposed to be diagonal!!
-        mat = vox_to_vox.affine.diagonal()[:3]
-        offset = vox_to_vox.affine[:3,-1]
-##         self._over_idx = ndimage.affine_transform(
-##             self._over_idx, mat, offset,
-##             output_shape=self._main_idx.shape,
-##             output=self._over_idx.dtype,
-##             order=0, cval=i_bad)
-        self._over_idx = resize_lookup_array(
-            self._main_idx.shape, i_bad, self._over_idx, mat, offset
+
+    def slicer_params(self, which):
+        """The main or over slicer parameters as they are now, to make
+        slicers with later (eg, in a background thread).
+        """
+        axes = getattr(self, '_%s_axes_order'%which)()
+        return dict(norm=getattr(self, which+'_norm'),
+                    order=getattr(self, which+'_spline_order'),
+                    spatial_axes=axes or ())
+
+    # -- Resolution pyramid --------------------------------------------------
+    def _load_progressively(self, which, image):
+        """Start loading a large image as the main or over image from
+        its resolution pyramid. Returns False if the image should be
+        loaded directly.
+        """
+        if self.workers is None or not self.preview_factors or \
+               np.prod(image.shape[:3]) < self.preview_min_voxels:
+            return False
+        self._expire_pyramid(which)
+        generation = self._pyramid_generation[which]
+        valid = lambda: self._pyramid_generation[which] == generation
+        # the slicers are made with the parameters as they are now,
+        # rather than as they are when each job runs
+        params = self.slicer_params(which)
+        make = getattr(self, 'make_%s_slicer'%which)
+        make_slicer = lambda image: make(image, **params)
+        factors = sorted(self.preview_factors, reverse=True)
+        # the coarsest level is quick to make right away
+        coarsest = factors[0]
+        self._set_level(
+            which, coarsest, make_slicer(vu.decimate_image(image, coarsest))
+            )
+        for factor in factors[1:]:
+            self.workers.submit(
+                '%s %dx'%(which, factor),
+                (vu.decimate_image, make_slicer), args=(image, factor),
+                callback=self._level_setter(which, factor), valid=valid
+                )
+        self.workers.submit(
+            which, (make_slicer,), args=(image,),
+            callback=self._level_setter(which, 1), valid=valid
+            )
+        return True
+
+    def _level_setter(self, which, factor):
+        return lambda slicer: self._set_level(which, factor, slicer)
+
+    def _set_level(self, which, factor, slicer):
+        levels = self._pyramids[which]
+        finer_levels = [f for f in levels if f < factor]
+        levels[factor] = slicer
+        if finer_levels:
+            # a finer level arrived first
+            return
+        setattr(self, which, slicer)
+        setattr(self, which+'_level', factor)
+
+    def _expire_pyramid(self, which):
+        self._pyramid_generation[which] += 1
+        self._pyramids[which] = dict()
+        self.trait_setq(**{which+'_level': 1})
+
+    def _main_axes_order(self):
+        if self.vtk_order:
+            return vtk_ax_order
+        return None
+
+    def _over_axes_order(self):
+        if self.vtk_order:
+            return vtk_ax_order
+        elif self.main:
+            return vu.find_spatial_correspondence(self.main.coordmap)
+        return None
+
+    def make_over_slicer(self, image, norm=None, order=None,
+                         spatial_axes=None):
+        """Make the ResampledIndexVolumeSlicer of `image` that would be
+        made by setting it as the over image. This does not change the
+        state of this object, so it may be run in a background thread and
+        its result set as the over image later.
+
+        Parameters
+        ----------
+        image : NIPY Image or SparseVolumeSlicer
+            the new over image. The LUT indices of a sparse map are
+            scattered straight into the index image, without making a
+            dense volume of its values.
+        norm : (black-pt, white-pt) pair, optional
+            the normalization (by default, over_norm)
+        order : int, optional
+            the spline order of the resampling (by default,
+            over_spline_order)
+        spatial_axes : sequence, optional
+            the array axes order to resample onto (by default, that of
+            the main image). An empty sequence keeps the image's own
+            order. From a background thread, pass the parameters as they
+            were when the job was submitted (see slicer_params).
+        """
+        if norm is None:
+            norm = self.over_norm
+        if order is None:
+            order = self.over_spline_order
+        if spatial_axes is None:
+            spatial_axes = self._over_axes_order()
+        if isinstance(image, SparseVolumeSlicer):
+            # (LUT indices are not interpolated)
+            image = ni_api.Image(image.lut_volume(norm), image.coordmap)
+            norm = False
+            order = 0
+        return ResampledIndexVolumeSlicer(
+            image, norm=norm,
+            spatial_axes=spatial_axes or None,
+            order=order
             )
+
+    def _index_version(self, which):
+        # the over index may be patched in-place through its slicer
+        # (see patch_over)
+        slicer = getattr(self, which)
+        return getattr(slicer, 'patch_count', 0)
+
+    def patch_over(self, flat_idx, values, masked=None):
+        """Update a few voxels of the over image in-place (eg, the points
+        whose masking flipped when an overlay threshold moved), patching
+        the over index, RGBA and blended arrays only where they change.
+
+        This is possible if the over image is a full resolution
+        ResampledIndexVolumeSlicer which was normalized with fixed limits,
+        but not resampled, from the overlay array (see patch_indices).
+
+        Parameters
+        ----------
+        flat_idx : ndarray
+            flat indices into the overlay array
+        values : ndarray
+            the new scalar values of these voxels
+        masked : ndarray (optional)
+            True where these voxels are now masked
+
+        Returns
+        -------
+        True if the over image was patched, False if it must be remade
+        """
+        over = self.over
+        if not isinstance(over, ResampledIndexVolumeSlicer) or \
+               not over.can_patch_indices() or self.over_level != 1:
+            return False
+        lut_idx = over.patch_indices(flat_idx, values, masked=masked)
+        if not self.main:
+            self._over_idx.flat[flat_idx] = lut_idx
+            region = vu.flat_index_bbox(flat_idx, self._over_idx.shape)
+        else:
+            gmap = vu.grid_map(over.coordmap.affine, over.image_arr.shape,
+                               self.main.coordmap.affine,
+                               self._main_idx.shape)
+            region = gmap.put(self._over_idx, flat_idx, lut_idx)
+        if region is None:
+            return True
+        self.over_rgba[region] = self.over_cmap.fast_lookup(
+            self._over_idx[region], alpha=self.over_alpha, bytes=True
+            )
+        self._patch_blended_region('over_rgba', region)
+        return True
+
+    # -- Layers ----------------------------------------------------------------
+    def add_layer(self, image, name='', **props):
+        """Add an image as a new layer, above the over image and any
+        existing layers. Its LUT indices are resampled onto the grid of
+        the main image.
+
+        Parameters
+        ----------
+        image : NIPY Image, or ResampledIndexVolumeSlicer
+            the layer image
+        name : str, optional
+            a name for the layer
+        props : dict
+            other IndexLayer traits (eg cmap, alpha, norm, spline_order)
+
+        Returns
+        -------
+        the new IndexLayer
+        """
+        layer = IndexLayer(name=name, image=image, **props)
+        self._index_layer(layer)
+        self.layers.append(layer)
+        return layer
+
+    def remove_layer(self, layer):
+        self.layers.remove(layer)
+
+    def make_layer_slicer(self, layer, image):
+        """Make the ResampledIndexVolumeSlicer of `image` for a layer,
+        with the layer's normalization and spline order. This does not
+        change the state of this object, so it may be run in a background
+        thread.
+        """
+        return ResampledIndexVolumeSlicer(
+            image, norm=layer.norm,
+            spatial_axes=self._over_axes_order(),
+            order=layer.spline_order
+            )
+
+    @t_ui.on_trait_change('layers.image, layers.norm, layers.spline_order')
+    def _reindex_layer(self, obj, name, old, new):
+        if isinstance(obj, IndexLayer):
+            self._index_layer(obj)
+
+    def _index_layers(self):
+        for layer in self.layers:
+            self._index_layer(layer)
+
+    def _index_layer(self, layer):
+        if layer.image is None or not self.main:
+            layer.idx = np.array([], np.int32)
+            return
+        slicer = layer.image
+        if isinstance(slicer, ni_api.Image):
+            slicer = self.make_layer_slicer(layer, slicer)
+        else:
+            ax_order = self._over_axes_order()
+            axes = vu.find_spatial_correspondence(slicer.coordmap)
+            if ax_order and axes != ax_order:
+                ni_image = ni_api.Image(slicer.image_arr, slicer.coordmap)
+                slicer = ResampledIndexVolumeSlicer(
+                    ni_image, norm=False, spatial_axes=ax_order,
+                    order=layer.spline_order
+                    )
+        layer.idx = self._resample_index_into_main(slicer, slicer.image_arr)
+
+    def _resample_over_into_main(self):
+        self._over_idx = self._resample_index_into_main(
+            self.over, self._over_idx
+            )
+
+    def _resample_index_into_main(self, slicer, idx):
+        # overlays on the same grid (eg, contrasts from one analysis)
+        # share one cached GridMap into the main grid
+        i_bad = cm.MixedAlphaColormap.i_bad
+        gmap = vu.grid_map(slicer.coordmap.affine, idx.shape,
+                           self.main.coordmap.affine, self._main_idx.shape)
+        return gmap.take(idx, cval=i_bad)
                                              
 
@@ -90,3 +90,79 @@ def test_props_update():
     
     
     
+@decotest.parametric
+def test_alpha_region_update():
+    ba = BlendedArrays(main_cmap=cm.gray, over_cmap=cm.jet)
+    idx_arr1 = np.random.randint(0, high=255, size=(10,10,10))
+    idx_arr2 = np.zeros((10,10,10), 'i')
+    # only a small block of the over image will change
+    idx_arr2[2:4,3:6,5:8] = 200
+    ba._main_idx = idx_arr1
+    ba._over_idx = idx_arr2
+    # force the blended array to be computed
+    ba.blended_rgba
+
+    changes = []
+    ba.on_trait_change(lambda new: changes.append(new), 'rgba_region_changed')
+    alpha = np.ones(256)
+    alpha[128:] = 0
+    ba.over_alpha = alpha
+
+    yield assert_equal(len(changes), 1)
+    names, region = changes[0]
+    yield assert_equal(names, ['over_rgba', 'blended_rgba'])
+    yield assert_equal(region, (slice(2,4), slice(3,6), slice(5,8)))
+
+    # compare with the full mapping
+    ba2 = BlendedArrays(main_cmap=cm.gray, over_cmap=cm.jet, over_alpha=alpha)
+    ba2._main_idx = idx_arr1
+    ba2._over_idx = idx_arr2
+    yield npt.assert_array_equal(ba.over_rgba, ba2.over_rgba)
+    yield npt.assert_array_equal(ba.blended_rgba, ba2.blended_rgba)
+
+@decotest.parametric
+def test_out_of_range_alpha_update():
+    ba = BlendedArrays(main_cmap=cm.gray, over_cmap=cm.jet)
+    idx_arr1 = np.random.randint(0, high=255, size=(10,10,10))
+    idx_arr2 = np.random.randint(0, high=255, size=(10,10,10))
+    # a block of over-range points
+    idx_arr2[4:6,1:3,7:9] = cm.jet.i_over
+    ba._main_idx = idx_arr1
+    ba._over_idx = idx_arr2
+    ba.blended_rgba
+    changes = []
+    ba.on_trait_change(lambda new: changes.append(new), 'rgba_region_changed')
+    # hide only the over-range points
+    alpha = np.ones(258)
+    alpha[-1] = 0
+    ba.over_alpha = alpha
+    yield assert_equal(len(changes), 1)
+    names, region = changes[0]
+    yield assert_equal(region, (slice(4,6), slice(1,3), slice(7,9)))
+    yield assert_true( (ba.over_rgba[4:6,1:3,7:9,3] == 0).all() )
+    ba2 = BlendedArrays(main_cmap=cm.gray, over_cmap=cm.jet, over_alpha=alpha)
+    ba2._main_idx = idx_arr1
+    ba2._over_idx = idx_arr2
+    yield npt.assert_array_equal(ba.over_rgba, ba2.over_rgba)
+    yield npt.assert_array_equal(ba.blended_rgba, ba2.blended_rgba)
+
+@decotest.parametric
+def test_layers():
+    ba = BlendedArrays(main_cmap=cm.gray)
+    idx_arr1 = np.random.randint(0, high=255, size=(4,5,6))
+    idx_arr2 = np.random.randint(0, high=255, size=(4,5,6))
+    ba._main_idx = idx_arr1
+    yield npt.assert_array_equal(ba.blended_rgba, ba.main_rgba)
+
+    layer = IndexLayer(idx=idx_arr2, cmap=cm.gray, alpha=0.5)
+    ba.layers.append(layer)
+    blended = (idx_arr1 + idx_arr2)/2
+    foo = np.multiply.outer(blended, np.ones((3,), 'i'))
+    yield assert_true(np.abs(foo-ba.blended_rgba[...,:3]).max() <= 1)
+
+    # a hidden layer is not blended
+    layer.visible = False
+    yield npt.assert_array_equal(ba.blended_rgba, ba.main_rgba)
+    layer.visible = True
+    ba.layers.remove(layer)
+    yield npt.assert_array_equal(ba.blended_rgba, ba.main_rgba)
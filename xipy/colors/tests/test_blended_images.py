@@ -21,3 +21,127 @@ def gen_img(shape=(10,20,12)):
                         )
 
     
+def test_progressive_main():
+    from xipy.workers import WorkerPool, direct_deliver
+    workers = WorkerPool(nthreads=1, deliver=direct_deliver)
+    bi = BlendedImages(workers=workers, preview_factors=(4,2),
+                       preview_min_voxels=1000)
+    levels = []
+    bi.on_trait_change(lambda new: levels.append(new), 'main_level')
+    img = gen_img(shape=(16,20,12))
+    bi.main = img
+    workers.wait()
+    workers.shutdown()
+    yield assert_equal, levels, [4, 2, 1]
+    yield assert_equal, bi.main_level, 1
+    yield assert_equal, bi.main_rgba.shape[:3], img.shape
+    # small images are loaded directly
+    bi.workers = None
+    bi.main = gen_img()
+    yield assert_equal, bi.main_level, 1
+    yield assert_equal, bi.main_rgba.shape[:3], (10,20,12)
+
+def test_progressive_params():
+    import threading
+    from xipy.workers import WorkerPool, direct_deliver
+    workers = WorkerPool(nthreads=1, deliver=direct_deliver)
+    bi = BlendedImages(workers=workers, preview_factors=(4,2),
+                       preview_min_voxels=1000, main_norm=(-1.0, 1.0))
+    # hold up the worker until the parameters are changed
+    go = threading.Event()
+    workers.submit('hold', (go.wait,))
+    bi.main = gen_img(shape=(16,20,12))
+    bi.main_norm = (-2.0, 2.0)
+    go.set()
+    workers.wait()
+    workers.shutdown()
+    yield assert_equal, bi.main_level, 1
+    # the levels are made as the blender was when the image was set
+    norm = bi.main.norm
+    yield assert_equal, (norm.vmin, norm.vmax), (-1.0, 1.0)
+
+def test_decimate_image():
+    import xipy.volume_utils as vu
+    img = gen_img(shape=(16,20,12))
+    sub = vu.decimate_image(img, 4)
+    yield assert_equal, sub.shape, (4,5,3)
+    yield npt.assert_array_equal, np.asarray(sub)[1,2,1], \
+          np.asarray(img)[4,8,4]
+    yield npt.assert_array_equal, sub.affine[:3,:3], 4*np.eye(3)
+
+def test_patch_over():
+    main = gen_img(shape=(20,20,24))
+    over_arr = np.random.randn(10,10,12)
+    over_cmap = ni_api.AffineTransform.from_params(
+        'ijk', xipy_ras, np.diag([2., 2., 2., 1.])
+        )
+    mask = over_arr < 0
+    def over_slicer(bi, mask, norm=(-2., 2.)):
+        over = ni_api.Image(np.ma.masked_array(over_arr, mask=mask),
+                            over_cmap)
+        return bi.make_over_slicer(over, norm=norm)
+    bi = BlendedImages(vtk_order=False, main=main)
+    bi.over = over_slicer(bi, mask)
+    bi.blended_rgba
+    changes = []
+    bi.on_trait_change(lambda new: changes.append(new), 'rgba_region_changed')
+    # flip the masking of a few points
+    idx = np.random.permutation(mask.size)[:50]
+    new_mask = mask.copy()
+    new_mask.flat[idx] = ~mask.flat[idx]
+    patched = bi.patch_over(idx, over_arr.flat[idx], masked=new_mask.flat[idx])
+    yield assert_true, patched
+    yield assert_equal, len(changes), 1
+    # compare with remaking the over image
+    bi2 = BlendedImages(vtk_order=False, main=main)
+    bi2.over = over_slicer(bi2, new_mask)
+    yield npt.assert_array_equal, bi._over_idx, bi2._over_idx
+    yield npt.assert_array_equal, bi.over_rgba, bi2.over_rgba
+    yield npt.assert_array_equal, bi.blended_rgba, bi2.blended_rgba
+    # an autoscaled norm would change with the masking
+    bi.over = over_slicer(bi, mask, norm=None)
+    yield assert_false, bi.patch_over(idx, over_arr.flat[idx])
+    # without an over image, there is nothing to patch
+    bi.over = None
+    yield assert_false, bi.patch_over(idx, over_arr.flat[idx])
+
+def test_add_remove_layer():
+    main = gen_img(shape=(20,20,24))
+    layer_img = ni_api.Image(
+        np.random.randn(10,10,12),
+        ni_api.AffineTransform.from_params(
+            'ijk', xipy_ras, np.diag([2., 2., 2., 1.])
+            )
+        )
+    bi = BlendedImages(vtk_order=False, main=main)
+    main_rgba = bi.blended_rgba.copy()
+    layer = bi.add_layer(layer_img, name='layer', cmap=cm.gray,
+                         alpha=0.5, norm=(-2.0, 2.0))
+    yield assert_true, layer in bi.layers
+    yield assert_equal, layer.name, 'layer'
+    # the layer is indexed on the main grid, like an over image would be
+    bi2 = BlendedImages(vtk_order=False, main=main)
+    bi2.over = bi2.make_over_slicer(layer_img, norm=(-2.0, 2.0))
+    yield npt.assert_array_equal, layer.idx, bi2._over_idx
+    yield assert_false, (bi.blended_rgba == main_rgba).all()
+    # a new normalization re-indexes the layer
+    layer.norm = (-1.0, 1.0)
+    bi2.over = bi2.make_over_slicer(layer_img, norm=(-1.0, 1.0))
+    yield npt.assert_array_equal, layer.idx, bi2._over_idx
+    bi.remove_layer(layer)
+    yield assert_equal, len(bi.layers), 0
+    yield npt.assert_array_equal, bi.blended_rgba, main_rgba
+
+def test_sparse_over():
+    from xipy.slicing.image_slicers import SparseVolumeSlicer
+    shape = (10,20,12)
+    cmap = ni_api.AffineTransform.from_params('ijk', xipy_ras, np.eye(4))
+    flat_idx = np.random.permutation(np.prod(shape))[:100]
+    sparse = SparseVolumeSlicer(np.random.randn(100), flat_idx, shape, cmap)
+    bi = BlendedImages(vtk_order=False, over_norm=(-1.0, 1.0))
+    bi.over = sparse
+    # the over index is the same as that of the dense map
+    bi2 = BlendedImages(vtk_order=False, over_norm=(-1.0, 1.0))
+    bi2.over = sparse.to_image()
+    yield npt.assert_array_equal, bi._over_idx, bi2._over_idx
+    yield npt.assert_array_equal, bi.over_rgba, bi2.over_rgba
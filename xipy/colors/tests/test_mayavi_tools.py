@@ -122,3 +122,22 @@ def test_master_source_states():
         len(aa._point_scalars_list) == 2 and m.main_channel in aa._point_scalars_list,
         'Channel name not available in downstream AA'
         )
+
+def _data_pointer(arr):
+    return arr.__array_interface__['data'][0]
+
+def test_master_source_shares_memory():
+    bi = BlendedImages(vtk_order=True)
+    m = MasterSource(blender=bi)
+    bi.main = main_img
+    bi.over = over_img
+    pdata = m.data.point_data
+    for chan, rgba in ( (m.main_channel, bi.main_rgba),
+                        (m.over_channel, bi.over_rgba),
+                        (m.blended_channel, bi.blended_rgba) ):
+        vtk_data = pdata.get_array(chan).to_array()
+        yield nt.assert_equal, _data_pointer(vtk_data), _data_pointer(rgba), \
+              'Channel %s was copied'%chan
+        yield nt.assert_true, \
+              (vtk_data == quick_convert_rgba_to_vtk_array(rgba)).all(), \
+              'Channel %s data inconsistent'%chan
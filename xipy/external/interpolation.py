@@ -21,7 +21,7 @@ class ImageInterpolator(object):
     The resampling is done with scipy.ndimage.
     """
 
-    def __init__(self, image, order=3, use_mmap=False):
+    def __init__(self, image, order=3, use_mmap=False, dtype=None):
         """
         Parameters
         ----------
@@ -29,9 +29,16 @@ class ImageInterpolator(object):
            Image to be interpolated
         order : int
            order of spline interpolation as used in scipy.ndimage
+        dtype : numpy dtype
+           type of the spline coefficients and interpolated values (by
+           default, see xipy.volume_utils.working_dtype)
         """
         self.image = image
         self.order = order
+        if dtype is None:
+            from xipy.volume_utils import working_dtype
+            dtype = working_dtype(np.asarray(image).dtype, order=order)
+        self.dtype = np.dtype(dtype)
         self._datafile = None
         self._buildknots(use_mmap)
 
@@ -43,7 +50,7 @@ class ImageInterpolator(object):
             in_data = np.asarray(self.image)
             data = ndimage.spline_filter(in_data,
                                          order=self.order,
-                                         output=in_data.dtype)
+                                         output=self.dtype)
         else:
 ##             data = np.nan_to_num(np.asarray(self.image).astype('d'))
             data = np.asarray(self.image)
@@ -94,7 +101,7 @@ class ImageInterpolator(object):
                                     voxels,
                                     order=self.order,
                                     prefilter=False,
-                                    output=self.data.dtype,
+                                    output=self.dtype,
                                     **interp_kws)
         # ndimage.map_coordinates returns a flat array,
         # it needs to be reshaped to the original shape
@@ -51,7 +51,8 @@ def resample_img2img(source, target, order=3):
     return resimg
 
 
-def resample(image, target, mapping, shape, order=3, **interp_kws):
+def resample(image, target, mapping, shape, order=3, dtype=None,
+             **interp_kws):
     """
     Resample an image to a target CoordinateMap with a "world-to-world" mapping
     and spline interpolation of a given order.
@@ -71,6 +72,8 @@ def resample(image, target, mapping, shape, order=3, **interp_kws):
                or a representation of this in homogeneous coordinates. 
     shape : shape of output array, in target.function_domain
     order : what order of interpolation to use in `scipy.ndimage`
+    dtype : data type of the output (by default, the working dtype of the
+            image data from xipy.volume_utils.working_dtype)
     interp_kws : keyword arguments for ndimage interpolator routine
 
     Returns
@@ -95,6 +98,10 @@ def resample(image, target, mapping, shape, order=3, **interp_kws):
     else:
         TW2IW = CoordinateMap(mapping, target.function_range, image.coordmap.function_range)
 
+    if dtype is None:
+        from xipy.volume_utils import working_dtype
+        dtype = working_dtype(np.asarray(image).dtype, order=order)
+
     function_domain = target.function_domain
     function_range = image.coordmap.function_range
 
@@ -108,7 +115,7 @@ def resample(image, target, mapping, shape, order=3, **interp_kws):
         # interpolator evaluates image at values image.coordmap.function_range,
         # i.e. physical coordinates rather than voxel coordinates
         grid = ArrayCoordMap.from_shape(TV2IW, shape)
-        interp = ImageInterpolator(image, order=order)
+        interp = ImageInterpolator(image, order=order, dtype=dtype)
         idata = interp.evaluate(grid.transposed_values, **interp_kws)
         del(interp)
     else:
@@ -119,11 +126,11 @@ def resample(image, target, mapping, shape, order=3, **interp_kws):
             idata = affine_transform(data, A,
                                      offset=b,
                                      output_shape=shape,
-                                     output=data.dtype,
+                                     output=dtype,
                                      order=order,
                                      **interp_kws)
         else:
-            interp = ImageInterpolator(image, order=order)
+            interp = ImageInterpolator(image, order=order, dtype=dtype)
             grid = ArrayCoordMap.from_shape(TV2IV, shape)
             idata = interp.evaluate(grid.values, **interp_kws)
             del(interp)
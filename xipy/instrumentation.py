@@ -0,0 +1,163 @@
+"""Named timers and counters for the hot paths of the data pipeline
+(slicing, resampling, LUT mapping, blending, VTK upload and matplotlib
+drawing).
+
+Instrumentation is off by default, and then every call here returns at
+once. When it is on, each timer accumulates its number of calls and its
+total and maximum times, and each counter its total count. The
+statistics can be printed with report(), or appended to a log file with
+dump().
+
+Timing a function:
+
+    @timed('blend.layers')
+    def composite(...):
+
+Timing a section of code (also for Traits handlers, whose signatures
+must not be wrapped):
+
+    t0 = start()
+    ...
+    stop('slicing.resample_volume', t0)
+
+Setting the environment variable XIPY_INSTRUMENT turns instrumentation
+on at import time. If it names a file, then the statistics are dumped
+there when the interpreter exits.
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+
+_enabled = False
+_lock = threading.Lock()
+# name --> [calls, total secs, max secs]
+_timers = dict()
+# name --> count
+_counters = dict()
+
+def enable(on=True):
+    global _enabled
+    _enabled = bool(on)
+
+def disable():
+    enable(False)
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Clear all timers and counters"""
+    _lock.acquire()
+    try:
+        _timers.clear()
+        _counters.clear()
+    finally:
+        _lock.release()
+
+def start():
+    """Start timing a section of code. Returns a start time to pass to
+    stop(), or None if instrumentation is off.
+    """
+    if not _enabled:
+        return None
+    return time.time()
+
+def stop(name, t0):
+    """Record the time since t0 (from start()) under the timer `name`
+    """
+    if t0 is None:
+        return
+    record(name, time.time() - t0)
+
+def record(name, secs):
+    """Add one call of secs seconds to the timer `name`"""
+    if not _enabled:
+        return
+    _lock.acquire()
+    try:
+        stats = _timers.get(name)
+        if stats is None:
+            _timers[name] = [1, secs, secs]
+        else:
+            stats[0] += 1
+            stats[1] += secs
+            if secs > stats[2]:
+                stats[2] = secs
+    finally:
+        _lock.release()
+
+def count(name, n=1):
+    """Add n to the counter `name`"""
+    if not _enabled:
+        return
+    _lock.acquire()
+    try:
+        _counters[name] = _counters.get(name, 0) + n
+    finally:
+        _lock.release()
+
+def timed(name):
+    """Decorate a function to time each call under the timer `name`
+    """
+    def dec(func):
+        def timed_func(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            t0 = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.time() - t0)
+        # copy func's info to timed_func
+        for attr in ['func_doc', 'func_name']:
+            setattr(timed_func, attr, getattr(func, attr))
+        return timed_func
+    return dec
+
+def statistics():
+    """Return the timer statistics, as a dictionary of
+    name --> (calls, total secs, mean secs, max secs), and the counters,
+    as a dictionary of name --> count
+    """
+    _lock.acquire()
+    try:
+        timers = dict( [ (name, (n, total, total/n, mx))
+                         for name, (n, total, mx) in _timers.items() ] )
+        counters = _counters.copy()
+    finally:
+        _lock.release()
+    return timers, counters
+
+def report(stream=None):
+    """Print the aggregated statistics (to stdout, by default)"""
+    if stream is None:
+        stream = sys.stdout
+    timers, counters = statistics()
+    if timers:
+        stream.write('%-36s %8s %11s %11s %11s\n'%
+                     ('timer', 'calls', 'total ms', 'mean ms', 'max ms'))
+        for name in sorted(timers.keys()):
+            n, total, mean, mx = timers[name]
+            stream.write('%-36s %8d %11.2f %11.3f %11.3f\n'%
+                         (name, n, 1e3*total, 1e3*mean, 1e3*mx))
+    if counters:
+        stream.write('%-36s %8s\n'%('counter', 'count'))
+        for name in sorted(counters.keys()):
+            stream.write('%-36s %8d\n'%(name, counters[name]))
+
+def dump(fname):
+    """Append a time-stamped report to the log file fname"""
+    f = open(fname, 'a')
+    try:
+        f.write('# xipy instrumentation, %s\n'%time.ctime())
+        report(stream=f)
+    finally:
+        f.close()
+
+_env = os.environ.get('XIPY_INSTRUMENT', '')
+if _env:
+    enable()
+    if _env not in ('1', 'on', 'yes'):
+        atexit.register(dump, _env)
@@ -7,7 +7,7 @@ from PyQt4 import QtGui, QtCore
 from enthought.traits.api \
     import HasTraits, HasPrivateTraits, Instance, Enum, Dict, Constant, Str, \
     List, on_trait_change, Float, File, Array, Button, Range, Property, \
-    cached_property, Event, Bool, Color, Int, String
+    cached_property, Event, Bool, Color, Int, String, Any
     
 from enthought.traits.ui.api \
     import Item, Group, View, VGroup, HGroup, HSplit, \
@@ -18,13 +18,15 @@ from enthought.traits.ui.file_dialog import open_file
 from xipy.slicing import load_sampled_slicer, load_resampled_slicer
 from xipy.slicing.image_slicers import SampledVolumeSlicer, \
      ResampledVolumeSlicer, ResampledIndexVolumeSlicer, VolumeSlicerInterface, \
-     slice_timewise, timedim
+     SparseVolumeSlicer, TimeResolvedSparseMap, slice_timewise, timedim
 from xipy.vis.qt4_widgets import browse_files
 from xipy.vis.qt4_widgets.colorbar_panel import ColorbarPanel
 from xipy.overlay.interface import OverlayInterface, OverlayWindowInterface, \
      ThresholdMap
 from xipy.volume_utils import signal_array_to_masked_vol
 from xipy.io import load_image
+from xipy.workers import WorkerPool, Job, direct_deliver, checkpoint
+import xipy.instrumentation as instr
 
 from nipy.core import api as ni_api
 from nipy.core.reference.coordinate_map import compose
@@ -65,7 +67,8 @@ class ImageOverlayWindow( OverlayWindowInterface ):
                 loc_signal=self.loc_changed,
                 image_signal=self.image_changed,
                 props_signal=self.image_props_changed,
-                overlay=overlay
+                overlay=overlay,
+                workers=WorkerPool()
                 )
         self.func_man.connect_colorbar(self.cbar)
         # breaking independence
@@ -104,7 +107,6 @@ class ImageOverlayManager( OverlayInterface ):
     # Various Events
     #---------------------------------------------------------------------------
     lbutton = Button('Load Overlay Image')
-    _recompute_work = Event
     mask_button = Button('Apply Mask')
     clear_button = Button('Clear Mask')
     loc_button = Button('Find Extremum')
@@ -113,22 +115,35 @@ class ImageOverlayManager( OverlayInterface ):
     # Image Data
     #---------------------------------------------------------------------------
     _ndimage = Instance(ni_api.Image)
+    # alternatively, a (possibly time resolved) sparse map
+    # (see set_sparse_data)
+    _sparse_map = Instance(SparseVolumeSlicer)
 
     # raw image is a read-only property that changes with the underlying
     # data, and with the time slice. Whenever raw_data is recomputed,
     # the "orig_mask" attribute is reset also.
-    raw_image = Property(depends_on='time_idx, _ndimage')
+    raw_image = Property(depends_on='time_idx, _ndimage, _sparse_map')
+
+    # The following are recomputed together by update_overlay(), possibly
+    # in a background thread (see the "workers" trait)
 
     # work_arr is the computed masked-array given the current conditions
-    work_arr = Property(depends_on='_recompute_work')
+    work_arr = Any
     # overlay is simply ni_api.Image(work_arr, raw_image.coordmap)
-    overlay = Property(depends_on='_recompute_work')
+    overlay = Instance(ni_api.Image)
 
-    mask = Property(Array, depends_on='_recompute_work')
+    mask = Any
     # XYZ: RETHINK WHEN ordered_idx SHOULD BE RECALCULATED.. MAYBE ONLY
     # WHEN THE THE MASK IS "DIRTY" (IE RECENTLY APPLIED, BUT NOT USED)
-    ordered_idx = Property(Array,
-                           depends_on='_recompute_work')
+    ordered_idx = Any
+    # the last mask computed, and the ThresholdMap mask_generation it
+    # corresponds to (so that it can be patched for small threshold moves)
+    _last_mask = (None, -1)
+    # the time resolved sparse map whose frame is the overlay in hand
+    # (see _step_sparse_frame), and whether the threshold's map scalars
+    # lag behind that frame
+    _frame_of = None
+    _stale_map_scalars = False
 
     #---------------------------------------------------------------------------
     # (G)UI controls
@@ -143,11 +158,23 @@ class ImageOverlayManager( OverlayInterface ):
                  editor=RangeEditor(low_name='_min_t', high_name='_max_t',
                                     format='%1.2f'))
     comp = Enum('greater than', 'less than')
+    # if True, apply the threshold by zeroing the overlay's alpha
+    # values beyond the threshold's LUT index, rather than masking
+    # (and re-resampling) the overlay data
+    lut_threshold = Bool(False)
 
     grid_size = Range(0,150)
 
     peak_color = Color
 
+    #---------------------------------------------------------------------------
+    # Background computation
+    #---------------------------------------------------------------------------
+    # If present, the heavy stages of overlay updates run in this pool,
+    # and the results are delivered back to this object (and signaled)
+    # in the GUI thread. Otherwise, they run synchronously.
+    workers = Instance(WorkerPool)
+
     #---------------------------------------------------------------------------
     # Other OverlayInterface data
     #---------------------------------------------------------------------------
@@ -211,34 +238,138 @@ class ImageOverlayManager( OverlayInterface ):
             image = load_image(image)
         if not isinstance(image, ni_api.Image):
             raise ValueError("argument provided was not a NIPY Image")
+        self._new_data_source()
+        self._sparse_map = None
         self._ndimage = image
-        
-        idata = image._data
-        self._min_t = float(np.ma.min(idata))
-        self._max_t = float(np.ma.max(idata))
-        self.norm = (self._min_t, self._max_t)
-
-        self._new_slice_from_ndimage()
+        self._run_stages('data range', (self._compute_data_range,),
+                         self._set_data_range, args=(image,))
+
+    def set_sparse_data(self, sparse_map):
+        """Overlay a sparse map (eg, made by SparseVolumeSlicer.from_blobs),
+        which is only made into a dense volume of the measure in use.
+        For a TimeResolvedSparseMap, each time slice is written into the
+        same volume, so moving through time only touches the map voxels.
+        """
+        if not isinstance(sparse_map, SparseVolumeSlicer):
+            raise ValueError("argument provided was not a "\
+                             "SparseVolumeSlicer")
+        self._new_data_source()
+        self._ndimage = None
+        self._sparse_map = sparse_map
+        self._run_stages('data range', (self._compute_data_range,),
+                         self._set_data_range, args=(sparse_map,))
+
+    def _new_data_source(self):
+        # abandon any overlay job running on the previous data, and
+        # forget its mask, which can not be patched for the new data
+        self.overlay_generation += 1
+        self._last_mask = (None, -1)
+        self._frame_of = None
 
     @on_trait_change('time_idx')
     def _new_slice_from_ndimage(self):
+        if self._step_sparse_frame():
+            return
         if not self.raw_image:
             return
+        self._update_map_scalars()
+        self.update_overlay()
+
+    def _update_map_scalars(self):
         #   threshold scalars (just use same array, nothing fancy yet)
         self.threshold.map_scalars = np.asarray(self.raw_image)
-        self.update_overlay()
+        self._stale_map_scalars = False
+
+    def _step_sparse_frame(self):
+        """Move the overlay of a time resolved sparse map to the frame at
+        time_idx in-place, writing only the map voxels. These are
+        published in changed_idx, so that the display can re-map only
+        them, and scrubbing through time costs O(nvox). This is possible
+        if the overlay in hand is a frame of the same map, with no
+        threshold mask and no update pending. Returns False if the
+        overlay must be recomputed.
+        """
+        smap = self._sparse_map
+        if not isinstance(smap, TimeResolvedSparseMap) or \
+               self._frame_of is not smap or self.overlay is None or \
+               self.threshold.thresh_map_name or \
+               self.overlay_version != self.overlay_generation:
+            return False
+        t0 = instr.start()
+        flat_idx, values = smap.frame(self.time_idx)
+        np.ma.getdata(self.work_arr).flat[flat_idx] = values
+        # only the map voxels are unmasked, so only they are sorted
+        m_values = np.abs(values) if self.ana_xform=='absmax' else values
+        ordered_idx = flat_idx[m_values.argsort()]
+        # (the threshold's map scalars share the overlay data, and are
+        # refreshed before a threshold is next applied)
+        self._stale_map_scalars = True
+        self.overlay_generation += 1
+        self.trait_setq(ordered_idx=ordered_idx, changed_idx=flat_idx,
+                        changed_from=self.overlay_version,
+                        overlay_version=self.overlay_generation)
+        instr.stop('overlay.sparse_frame', t0)
+        self.send_image_signal()
+        return True
     
     def update_overlay(self, recompute=True):
-        if recompute:
-            self._recompute_work = True
+        if not recompute:
+            self.send_image_signal()
+            return
+        self.overlay_generation += 1
+        generation = self.overlay_generation
+        stages = (self._compute_mask,
+                  self._compute_work_arr,
+                  self._compute_ordered_idx)
+        # the job is abandoned as soon as another update is requested
+        inputs = self._overlay_inputs()
+        inputs['overlay_generation'] = generation
+        self._run_stages('overlay', stages, self._set_overlay_results,
+                         args=(inputs,),
+                         valid=lambda: self.overlay_generation==generation)
+
+    def _run_stages(self, channel, stages, callback, args=(), valid=None):
+        if self.workers is None:
+            Job(channel, stages, args=args,
+                callback=callback).run(direct_deliver)
+        else:
+            self.workers.submit(channel, stages, args=args,
+                                callback=callback, valid=valid)
+
+    # -- Results delivered from the computation stages -----------------------
+    def _set_data_range(self, data_range):
+        self._min_t, self._max_t = data_range
+        self.norm = data_range
+        self._new_slice_from_ndimage()
+
+    def _set_overlay_results(self, results):
+        inputs, mask, work_arr, ordered_idx = results
+        if inputs['mask_generation'] < 0:
+            self._last_mask = (None, -1)
+        else:
+            self._last_mask = (mask, inputs['mask_generation'])
+        # a patched mask only changes the patched points of the last overlay
+        patch = inputs['patch']
+        self._frame_of = inputs['sparse_map']
+        self.trait_setq(mask=mask, work_arr=work_arr,
+                        ordered_idx=ordered_idx,
+                        changed_idx=None if patch is None else patch[0],
+                        changed_from=self.overlay_version,
+                        overlay_version=inputs.get('overlay_generation', -1))
+        if work_arr is None:
+            self.overlay = None
+        else:
+            self.overlay = ni_api.Image(work_arr, inputs['coordmap'])
+        if ordered_idx is not None:
+            self._numfeatures = len(ordered_idx)
         self.send_image_signal()
 
     # -- Signaling -----------------------------------------------------------
     def send_image_signal(self):
-        print 'sending overlay updated'
+        instr.count('overlay.updated_signals')
         self.overlay_updated = True
         if self.image_signal:
-            print 'sending image signal'
+            instr.count('overlay.image_signals')
             self.image_signal.emit(self)
 
     def send_location_signal(self, loc):
@@ -253,9 +384,13 @@ class ImageOverlayManager( OverlayInterface ):
             self.props_signal.emit(self)
     
     # -- Event Callbacks -----------------------------------------------------
-    @on_trait_change('_ndimage')
+    @on_trait_change('_ndimage, _sparse_map')
     def _set_len_tdim(self):
-        if not self._ndimage or len(self._ndimage.shape) < 4:
+        if isinstance(self._sparse_map, TimeResolvedSparseMap):
+            self._len_tdim = self._sparse_map.ntime - 1
+        elif self._sparse_map is not None:
+            self._len_tdim = 0
+        elif not self._ndimage or len(self._ndimage.shape) < 4:
             self._len_tdim = 0
         else:
             self._len_tdim = self._ndimage.shape[timedim(self._ndimage)]-1
@@ -267,10 +402,20 @@ class ImageOverlayManager( OverlayInterface ):
             self.set_ndimage_data(f)
 
     def _loc_button_fired(self):
-        # XYZ: DON'T THINK THIS WILL EXECUTE IN A NEW THREAD: FIX
+        # the expensive part (sorting) is done when the overlay updates
         self.find_peak()
 
     def _mask_button_fired(self):
+        if self.lut_threshold:
+            if self.threshold.thresh_map_name:
+                # drop the data mask, in favor of the alpha threshold
+                self.threshold.thresh_map_name = ''
+                self.update_overlay()
+            self.alpha_threshold = (self.tval, self.comp)
+            return
+        self.alpha_threshold = None
+        if self._stale_map_scalars:
+            self._update_map_scalars()
         self.threshold.thresh_map_name = 'overlay scalars'        
         if self.comp == 'greater than':
             self.threshold.thresh_mode = 'mask higher'
@@ -281,12 +426,21 @@ class ImageOverlayManager( OverlayInterface ):
         self.update_overlay()
 
     def _clear_button_fired(self):
-        self.threshold.thresh_map_name = ''
-        self.update_overlay()
+        self.alpha_threshold = None
+        if self.threshold.thresh_map_name:
+            self.threshold.thresh_map_name = ''
+            self.update_overlay()
+
+    @on_trait_change('tval, comp')
+    def _move_alpha_threshold(self):
+        # an alpha threshold is cheap to update, so let it follow
+        # the threshold controls
+        if self.alpha_threshold is not None:
+            self.alpha_threshold = (self.tval, self.comp)
 
     @on_trait_change('order') #, dispatch='new')
     def find_peak(self):
-        if self.overlay is None:
+        if self.overlay is None or self.ordered_idx is None:
             return
         if self.ana_xform in ('absmax', 'max'):
             pk_flat_idx = self.ordered_idx[-self.order]
@@ -326,29 +480,32 @@ class ImageOverlayManager( OverlayInterface ):
     def _set_cbar_norm(self):
         if not self.cbar:
             return
-        print 'image norm changed'
         self.cbar.change_norm(mpl.colors.normalize(*self.norm))
     @on_trait_change('cmap_option')
     def _set_cbar_cmap(self):
         if not self.cbar:
             return
-        print 'image cmap changed'
         self.cbar.change_cmap(self.colormap)
 
     # -- Property Getters ----------------------------------------------------
-    @cached_property
-    def _get_overlay(self):
-        data = self.work_arr
-        if data is None:
-            return None
-        return ni_api.Image(self.work_arr, self.raw_image.coordmap)
-
     @cached_property
     def _get_raw_image(self):
         """
         Return the raw_image for the given time slice. Also sets up
         the raw mask for this slice
         """
+        if isinstance(self._sparse_map, TimeResolvedSparseMap):
+            # the sparse map refills one volume for every frame, so keep
+            # a copy of this frame: it is read by the overlay jobs, and
+            # becomes the data of the overlay on display
+            frame = self._sparse_map.scalar_volume(self.time_idx).copy()
+            img = ni_api.Image(frame, self._sparse_map.coordmap)
+            self.orig_mask = np.ma.getmask(img._data)
+            return img
+        if self._sparse_map is not None:
+            img = self._sparse_map.to_image()
+            self.orig_mask = np.ma.getmask(img._data)
+            return img
         if not self._ndimage:
             return None
 
@@ -374,45 +531,113 @@ unmasked points: %s
 """%(d_range[0], d_range[1], um_pts)
         return dstr
 
-    @cached_property
-    def _get_mask(self):
+    # -- Computation Stages --------------------------------------------------
+    # These methods run in a background thread (if there are workers), so
+    # they neither set traits nor read any live state: update_overlay()
+    # snapshots their inputs in the GUI thread (see _overlay_inputs), and
+    # _set_overlay_results() stores their results back in the GUI thread.
+
+    def _compute_data_range(self, image):
+        if isinstance(image, TimeResolvedSparseMap):
+            idata = image.values
+        elif isinstance(image, SparseVolumeSlicer):
+            idata = image.scalars
+        else:
+            idata = image._data
+        return ( float(np.ma.min(idata)), float(np.ma.max(idata)) )
+
+    def _overlay_inputs(self):
+        """Snapshot the inputs of the overlay stages. This must run in
+        the GUI thread, since it may (lazily) build the threshold mask.
+
+        Returns
+        -------
+        a dictionary with the raw data and its coordmap, the original
+        mask of the data, and either a private copy of the threshold mask
+        ("thresh_mask"), or the patch to apply to the last mask
+        ("patch", as (flat indices, new mask values))
+        """
+        raw = self.raw_image
+        inputs = dict(data=None, coordmap=None, orig_mask=np.ma.nomask,
+                      thresh_mask=None, patch=None, last_mask=None,
+                      mask_generation=-1, ana_xform=self.ana_xform,
+                      sparse_map=self._sparse_map)
+        if raw is None:
+            return inputs
+        inputs.update(data=np.asarray(raw), coordmap=raw.coordmap,
+                      orig_mask=self.orig_mask)
+        thresh = self.threshold
+        if thresh.unmasked_points < 0:
+            # no threshold mask
+            return inputs
+        generation = thresh.mask_generation
+        inputs['mask_generation'] = generation
+        last_m, last_gen = self._last_mask
+        idx = thresh.changed_idx
+        if last_m is not None and idx is not None and \
+               last_gen == generation - 1:
+            # the threshold mask was only patched since the last time,
+            # so only those points need to be passed on (and a packed
+            # mask is not unpacked to find them)
+            if thresh.pack_mask:
+                patch = thresh.packed_mask.take(idx)
+            else:
+                patch = thresh.binary_mask.ravel()[idx]
+            inputs.update(patch=(idx.copy(), patch), last_mask=last_m)
+        else:
+            # an unpacked mask is already a private copy
+            nm = thresh.binary_mask
+            inputs['thresh_mask'] = nm if thresh.pack_mask else nm.copy()
+        return inputs
+
+    def _compute_mask(self, inputs):
         """ Create a negative mask of the overlay map, where points
         masked are marked as True
         """
-        if self._ndimage is None:
-            return np.ma.nomask
-        m = self.orig_mask.copy() # neg mask
-        nm = self.threshold.binary_mask
+        if inputs['data'] is None:
+            return inputs, np.ma.nomask
+        om = inputs['orig_mask']
+        checkpoint()
+        if inputs['patch'] is not None:
+            # patch a copy of the last mask, which is still in use by
+            # the overlay on display
+            idx, patch = inputs['patch']
+            if om is not np.ma.nomask:
+                patch = patch | om.ravel()[idx]
+            m = inputs['last_mask'].copy()
+            m.ravel()[idx] = patch
+            return inputs, m
+        nm = inputs['thresh_mask']
         if nm is None:
-            return m
-        if m is np.ma.nomask:
-            return nm
-        m |= nm
-        return m
-
-    @cached_property
-    def _get_work_arr(self):
-        if self.raw_image is None:
-            return None
-        data = np.asarray(self.raw_image)
-        return np.ma.masked_array(data, mask=self.mask, copy=False)
+            return inputs, (om if om is np.ma.nomask else om.copy()) # neg mask
+        if om is not np.ma.nomask:
+            nm |= om
+        return inputs, nm
+
+    def _compute_work_arr(self, inputs_and_mask):
+        inputs, mask = inputs_and_mask
+        if inputs['data'] is None:
+            return inputs, mask, None
+        checkpoint()
+        work_arr = np.ma.masked_array(inputs['data'], mask=mask, copy=False)
+        return inputs, mask, work_arr
     
-    @cached_property
-    def _get_ordered_idx(self):
+    def _compute_ordered_idx(self, mask_and_work_arr):
         """ Create a list of sorted map indices
         """
-        if self.overlay is None:
-            return None
-        m_arr = np.abs(self.work_arr) if self.ana_xform=='absmax' \
-                else self.work_arr
+        inputs, mask, work_arr = mask_and_work_arr
+        if work_arr is None:
+            return inputs, mask, None, None
+        m_arr = np.abs(work_arr) if inputs['ana_xform']=='absmax' \
+                else work_arr
+        checkpoint()
         sidx = m_arr.flatten().argsort()
         if m_arr.mask is np.ma.nomask:
             last_good = len(sidx)
         else:
             last_good = m_arr.mask.flat[sidx].nonzero()[0][0]
 ##             last_good = len(m_arr.mask.flat)
-        self._numfeatures = last_good
-        return sidx[:last_good]
+        return inputs, mask, work_arr, sidx[:last_good]
 
     view = View(
         HGroup(
@@ -432,6 +657,7 @@ unmasked points: %s
                 Item('_'),
                 Item('comp', label='Mask values'),
                 Item('tval', style='custom', label='Overlay Threshold'),
+                Item('lut_threshold', label='Threshold Colormap Only'),
                 HGroup(
                     Item('mask_button', show_label=False),
                     Item('clear_button', show_label=False)
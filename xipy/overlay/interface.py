@@ -18,6 +18,7 @@ from xipy.slicing.image_slicers import VolumeSlicerInterface
 from xipy.vis.qt4_widgets.auxiliary_window import TopLevelAuxiliaryWindow
 import xipy.volume_utils as vu
 import xipy.colors.color_mapping as cm
+import xipy.instrumentation as instr
 import numpy as np
 
 class OverlayWindowInterface(TopLevelAuxiliaryWindow):
@@ -159,26 +160,154 @@ class ThresholdMap(t_api.HasTraits):
     # subclasses must fire this event whenever the mask must be recaculated
     map_changed = t_api.Event
 
-    binary_mask = t_api.Property(
-        depends_on='map_changed, thresh_limits, thresh_mode'
-        )
-    unmasked_points = t_api.Property(depends_on='binary_mask')
-
-    @t_api.on_trait_change('map_scalars, thresh_limits, thresh_mode')
+    binary_mask = t_api.Property(depends_on='map_changed')
+    unmasked_points = t_api.Property(depends_on='map_changed')
+
+    # When the threshold limits move, only the points whose values lie
+    # between the old and new limits can change their masking status.
+    # In that case, these are the flat indices (into map_scalars) of the
+    # points that flipped in the most recent update. If the whole mask
+    # was recomputed, this is None.
+    changed_idx = t_api.Any
+    # Counts mask updates, so that a listener holding a copy of the mask
+    # from generation n-1 knows that it may patch in changed_idx
+    mask_generation = t_api.Int(0)
+
+    # If True, the mask is kept bit-packed (see vu.PackedMask), and
+    # binary_mask is unpacked on request
+    pack_mask = t_api.Bool(False)
+    packed_mask = t_api.Property(depends_on='map_changed')
+
+    # the current mask and the number of unmasked points in it
+    _mask = None
+    _unmasked = -1
+    # the flat argsort of map_scalars, and the sorted values
+    _sort_idx = None
+    _sorted_scalars = None
+    # flag that the mask has been patched (rather than invalidated)
+    _patched = False
+
+    def _map_changed_fired(self):
+        if self._patched:
+            self._patched = False
+        else:
+            self._mask = None
+            self._unmasked = -1
+            self.changed_idx = None
+        self.mask_generation += 1
+
+    @t_api.on_trait_change('map_scalars')
+    def _new_map_scalars(self):
+        self._sort_idx = None
+        self._sorted_scalars = None
+        self._dirty_mask()
+
+    @t_api.on_trait_change('thresh_mode, thresh_map_name, pack_mask')
     def _dirty_mask(self):
-        print 'mask dirty'
+        instr.count('overlay.dirty_masks')
+        self.map_changed = True
+
+    @t_api.on_trait_change('thresh_limits')
+    def _move_limits(self, obj, name, old, new):
+        if self._mask is None or not self.thresh_map_name:
+            self._dirty_mask()
+            return
+        self.changed_idx = self._flip_between_limits(old, new)
+        self._patched = True
         self.map_changed = True
 
-    @t_api.cached_property
     def _get_binary_mask(self):
-        return self.create_binary_mask()
+        self._make_mask()
+        if isinstance(self._mask, vu.PackedMask):
+            return self._mask.unpack()
+        return self._mask
+
+    def _get_packed_mask(self):
+        self._make_mask()
+        if self._mask is None or isinstance(self._mask, vu.PackedMask):
+            return self._mask
+        return vu.PackedMask(self._mask)
+
+    def _make_mask(self):
+        if self._mask is not None:
+            return
+        mask = self.create_binary_mask()
+        if mask is None:
+            return
+        if self.pack_mask:
+            self._mask = vu.PackedMask(mask)
+            self._unmasked = mask.size - self._mask.count()
+        else:
+            self._mask = mask
+            self._unmasked = mask.size - mask.sum()
 
-    @t_api.cached_property
     def _get_unmasked_points(self):
-        mask = self.binary_mask
-        if mask is not None:
-            return mask.size - mask.sum()
-        return -1
+        # (a packed mask is counted without unpacking it)
+        self._make_mask()
+        if self._mask is None:
+            return -1
+        return self._unmasked
+
+    def _sorted_map(self):
+        if self._sort_idx is None:
+            flat_map = self.map_scalars.ravel()
+            self._sort_idx = flat_map.argsort()
+            self._sorted_scalars = flat_map[self._sort_idx]
+        return self._sort_idx, self._sorted_scalars
+
+    def _flip_between_limits(self, old_limits, new_limits):
+        """Update the current mask in-place for the move from old_limits
+        to new_limits. Only points whose values lie between an old limit
+        and its new position are re-tested, and those are found by a
+        binary search on the sorted map values.
+
+        Returns
+        -------
+        the flat indices of the points whose masking status flipped
+        """
+        sidx, svals = self._sorted_map()
+        candidates = []
+        for old, new in zip(old_limits, new_limits):
+            if old == new:
+                continue
+            i0 = svals.searchsorted(min(old, new), side='left')
+            i1 = svals.searchsorted(max(old, new), side='right')
+            candidates.append(sidx[i0:i1])
+        if not candidates:
+            return np.array([], dtype=sidx.dtype)
+        if len(candidates) > 1:
+            candidates = np.unique(np.concatenate(candidates))
+        else:
+            candidates = candidates[0]
+        if isinstance(self._mask, vu.PackedMask):
+            old_vals = self._mask.take(candidates)
+        else:
+            flat_mask = self._mask.reshape(-1)
+            old_vals = flat_mask[candidates]
+        new_vals = self.threshold_values(self.map_scalars.ravel()[candidates])
+        changed = new_vals != old_vals
+        flipped = candidates[changed]
+        newly_masked = new_vals[changed]
+        if isinstance(self._mask, vu.PackedMask):
+            self._mask.put(flipped, newly_masked)
+        else:
+            flat_mask[flipped] = newly_masked
+        self._unmasked += len(flipped) - 2*newly_masked.sum()
+        return flipped
+
+    def threshold_values(self, values, type='negative'):
+        """Evaluate the current threshold conditions on an array of values.
+
+        Parameters
+        ----------
+        values : ndarray
+            scalar values to test
+        type : str, optional
+            By default, make a MaskedArray convention mask ('negative').
+            Otherwise, set mask to True where values are unmasked ('positive')
+        """
+        return vu.threshold_mask(values, self.thresh_mode,
+                                 self.thresh_limits, type=type)
         
     def create_binary_mask(self, type='negative'):
         """Create a binary mask in the shape of map_scalars for the
@@ -192,22 +321,7 @@ class ThresholdMap(t_api.HasTraits):
         """
         if not self.thresh_map_name:
             return None
-        mode = self.thresh_mode
-        limits = self.thresh_limits
-        map = self.map_scalars
-        if mode=='mask lower':
-            m = (map < limits[0]) if type=='negative' else (map >= limits[0])
-        elif mode=='mask higher':
-            m = (map > limits[1]) if type=='negative' else (map <= limits[1])
-        elif mode=='mask between':
-            m = ( (map > limits[0]) & (map < limits[1]) ) \
-                if type=='negative' \
-                else ( (map <= limits[0]) | (map >= limits[1]) )
-        else: # mask outside
-            m = ( (map < limits[0]) | (map > limits[1]) ) \
-                if type=='negative' \
-                else ( (map >= limits[0]) & (map <= limits[1]) )
-        return m
+        return self.threshold_values(self.map_scalars, type=type)
     
 
 # XYZ: SHOULD MAKE A TEST CLASS TO PROBAR ANY INSTANCE OF THIS INTERFACE
@@ -230,6 +344,19 @@ class OverlayInterface(t_api.HasTraits):
     # XYZ: CAN'T TRAITS SIMPLY WATCH FOR "overlay" TO CHANGE?
     overlay_updated = t_api.Event
 
+    # Counts the overlay updates requested. If an overlay is computed
+    # asynchronously, this may run ahead of the overlay in hand, and
+    # listeners can use it to abandon work on an out-of-date overlay
+    overlay_generation = t_api.Int(0)
+    # The overlay_generation of the overlay in hand
+    overlay_version = t_api.Int(-1)
+    # If the overlay in hand differs from the overlay of version
+    # changed_from only in the masking of a few points, these are their
+    # flat indices into the overlay array (otherwise, None). Listeners
+    # holding that overlay may patch these points, rather than rebuild.
+    changed_idx = t_api.Any
+    changed_from = t_api.Int(-1)
+
     # A text description of the overlay
     description = t_api.Any
     
@@ -247,11 +374,45 @@ class OverlayInterface(t_api.HasTraits):
     # 2a) a(x) function for scalar-to-alpha mapping
     alpha_scale = t_api.Range(low=0.0, high=4.0, value=1.0)    
     _base_alpha = np.ones(256)
+    # A simple value threshold can be realized in the alpha function
+    # alone, since it is a monotone function of the LUT index. This is
+    # either None or a (threshold-value, comparison-type) pair, where the
+    # comparison is 'greater than' or 'less than' (the values to hide)
+    alpha_threshold = t_api.Any
     def alpha(self, scale=None):
+        """The alpha value of each LUT entry, followed by the alpha
+        values of the under-range and over-range entries.
+
+        With an alpha_threshold, the entries holding only hidden values
+        are transparent. The entry holding the threshold value itself is
+        always shown, so values up to one LUT bin past the threshold may
+        be shown. Likewise, the out-of-range entries are transparent when
+        the threshold is inside the normalization limits or beyond the
+        out-of-range side.
+        """
         if scale is None:
             scale = self.alpha_scale
         # scale may go between 0 and 4.. just map this from (0,1)
         a = (scale/4.0)*self._base_alpha
+        N = len(a)
+        # the under and over alpha repeat the end values of the LUT,
+        # unless they are thresholded away
+        a = np.r_[a, a[0], a[-1]]
+        if self.alpha_threshold is not None:
+            tval, comp = self.alpha_threshold
+            lut_idx = alpha_threshold_index(tval, self.norm, N)
+            if comp == 'greater than':
+                a[lut_idx+1:N] = 0
+                if lut_idx < 0:
+                    a[N] = 0
+                if lut_idx < N:
+                    a[N+1] = 0
+            else:
+                a[:max(lut_idx, 0)] = 0
+                if lut_idx >= 0:
+                    a[N] = 0
+                if lut_idx >= N:
+                    a[N+1] = 0
         return a
 
     # 3) interpolation
@@ -286,9 +447,10 @@ class OverlayInterface(t_api.HasTraits):
     def _get_colormap(self):
         return cm.cmap_d[self.cmap_option]
 
-    @t_api.on_trait_change('norm, cmap_option, interpolation, alpha_scale')
+    @t_api.on_trait_change('norm, cmap_option, interpolation, alpha_scale, '\
+                           'alpha_threshold')
     def signal_image_props(self):
-        print 'signalling new im props'
+        instr.count('overlay.props_signals')
         self.image_props_updated = True
         if self.props_signal:
             self.props_signal.emit(self)
@@ -317,6 +479,37 @@ class OverlayInterface(t_api.HasTraits):
         ui = self.edit_traits(parent=parent, kind='subpanel').control
         return ui
 
+def alpha_threshold_index(threshold, norm, N=256):
+    """ Find the LUT index of a scalar threshold value under the
+    normalization given by norm.
+
+    Parameters
+    ----------
+    threshold : float
+        the scalar threshold value
+    norm : len-2 iterable
+        the (min, max) values mapped to the bottom and top of the LUT
+    N : int, optional
+        the length of the LUT
+
+    Returns
+    -------
+    lut_idx : int
+        the LUT index of the threshold, clipped to the range [-1, N]
+
+    Examples
+    --------
+    >>> alpha_threshold_index(0.5, (0, 1))
+    128
+    >>> alpha_threshold_index(2.0, (0, 1))
+    256
+    """
+    mn, mx = norm
+    if mx <= mn:
+        return -1 if threshold < mn else N
+    lut_idx = np.floor( N*(float(threshold) - mn)/(mx - mn) )
+    return int(np.clip(lut_idx, -1, N))
+
 def overlay_thresholding_function(threshold, positive=True):
     """ Take the OverlayInterface threshold parameters and create a
     function that maps from reals to {0,1}.
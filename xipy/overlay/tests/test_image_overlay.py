@@ -0,0 +1,131 @@
+import numpy as np
+import numpy.testing as npt
+import nose.tools as nt
+
+import nipy.core.api as ni_api
+
+# the code to test
+from xipy.overlay.image_overlay import ImageOverlayManager
+from xipy.slicing import xipy_ras
+
+def _manager():
+    arr = np.random.randn(10,12,14)
+    cmap = ni_api.AffineTransform.from_start_step(
+        'ijk', xipy_ras, np.zeros(3), np.ones(3)
+        )
+    oman = ImageOverlayManager([(0,10), (0,12), (0,14)],
+                               overlay=ni_api.Image(arr, cmap))
+    return oman, arr
+
+def test_patched_threshold():
+    oman, arr = _manager()
+    oman.comp = 'less than'
+    oman.tval = 0.5
+    oman._mask_button_fired()
+    yield npt.assert_array_equal, np.ma.getmaskarray(oman.work_arr), arr < 0.5
+    yield nt.assert_true, oman.changed_idx is None
+    version = oman.overlay_version
+    old_mask = oman.mask
+    old_copy = old_mask.copy()
+    # a small move of the threshold patches the last mask
+    oman.tval = 0.25
+    oman._mask_button_fired()
+    yield nt.assert_true, oman.threshold.changed_idx is not None
+    yield npt.assert_array_equal, oman.mask, arr < 0.25
+    # ... but the mask of the previous overlay is left alone
+    yield npt.assert_array_equal, old_mask, old_copy
+    yield nt.assert_false, oman.mask is old_mask
+    # listeners are told which points of the last overlay changed
+    yield nt.assert_equal, oman.changed_from, version
+    yield nt.assert_true, oman.overlay_version > version
+    flipped = ((arr < 0.25) != old_copy).ravel().nonzero()[0]
+    yield npt.assert_array_equal, np.sort(oman.changed_idx), flipped
+
+def test_packed_patched_threshold():
+    oman, arr = _manager()
+    oman.threshold.pack_mask = True
+    oman.comp = 'less than'
+    oman.tval = 0.5
+    oman._mask_button_fired()
+    yield npt.assert_array_equal, oman.mask, arr < 0.5
+    # the patch is read from the packed mask
+    oman.tval = 0.25
+    oman._mask_button_fired()
+    yield nt.assert_true, oman.threshold.changed_idx is not None
+    yield npt.assert_array_equal, oman.mask, arr < 0.25
+    yield (nt.assert_equal,
+           oman.threshold.unmasked_points, (arr >= 0.25).sum())
+
+def test_cleared_threshold():
+    oman, arr = _manager()
+    oman.tval = 0.5
+    oman._mask_button_fired()
+    oman._clear_button_fired()
+    yield nt.assert_equal, oman._last_mask, (None, -1)
+    yield nt.assert_equal, np.ma.count_masked(oman.work_arr), 0
+
+def test_new_data_source():
+    oman, arr = _manager()
+    oman.tval = 0.5
+    oman._mask_button_fired()
+    generation = oman.overlay_generation
+    arr2 = np.random.randn(8,8,8)
+    cmap = ni_api.AffineTransform.from_start_step(
+        'ijk', xipy_ras, np.zeros(3), np.ones(3)
+        )
+    oman.set_ndimage_data(ni_api.Image(arr2, cmap))
+    yield nt.assert_true, oman.overlay_generation > generation
+    yield nt.assert_equal, oman.overlay.shape, arr2.shape
+    yield npt.assert_array_equal, np.asarray(oman.overlay), arr2
+
+def test_sparse_frames():
+    from xipy.slicing.image_slicers import TimeResolvedSparseMap
+    oman, arr = _manager()
+    flat_idx = np.array([3, 50, 700, 1200])
+    values = np.random.randn(len(flat_idx), 5)
+    cmap = ni_api.AffineTransform.from_start_step(
+        'ijk', xipy_ras, np.zeros(3), np.ones(3)
+        )
+    smap = TimeResolvedSparseMap(values, flat_idx, arr.shape, cmap)
+    oman.set_sparse_data(smap)
+    overlay0 = oman.overlay
+    version = oman.overlay_version
+    oman.time_idx = 1
+    # the next frame is written into the same overlay, and only the map
+    # voxels are reported as changed
+    yield nt.assert_true, oman.overlay is overlay0
+    yield (npt.assert_array_equal,
+           np.asarray(oman.overlay).flat[flat_idx], values[:,1])
+    yield npt.assert_array_equal, oman.changed_idx, flat_idx
+    yield nt.assert_equal, oman.changed_from, version
+    yield nt.assert_true, oman.overlay_version > version
+    yield (npt.assert_array_equal,
+           oman.ordered_idx, flat_idx[values[:,1].argsort()])
+    # with a threshold applied, the frame is recomputed
+    oman.comp = 'greater than'
+    oman.tval = 0
+    oman._mask_button_fired()
+    yield (npt.assert_array_equal, oman.threshold.map_scalars.flat[flat_idx],
+           values[:,1])
+    overlay1 = oman.overlay
+    oman.time_idx = 2
+    yield nt.assert_false, oman.overlay is overlay1
+    yield (npt.assert_array_equal,
+           np.asarray(oman.overlay).flat[flat_idx], values[:,2])
+
+def test_sparse_map_overlay():
+    from xipy.slicing.image_slicers import SparseVolumeSlicer
+    oman, arr = _manager()
+    flat_idx = np.array([3, 50, 700, 1200])
+    values = np.random.randn(len(flat_idx), 3)
+    cmap = ni_api.AffineTransform.from_start_step(
+        'ijk', xipy_ras, np.zeros(3), np.ones(3)
+        )
+    smap = SparseVolumeSlicer(values, flat_idx, arr.shape, cmap)
+    smap.measure = 2
+    oman.set_sparse_data(smap)
+    yield nt.assert_equal, oman._len_tdim, 0
+    yield nt.assert_equal, oman.overlay.shape, arr.shape
+    yield nt.assert_equal, oman.overlay._data.count(), len(flat_idx)
+    yield (npt.assert_array_equal,
+           np.asarray(oman.overlay).flat[flat_idx], values[:,2])
@@ -0,0 +1,94 @@
+import numpy as np
+import numpy.testing as npt
+import nose.tools as nt
+
+# the code to test
+from xipy.overlay.interface import ThresholdMap, OverlayInterface, \
+     alpha_threshold_index
+
+def _moving_threshold(mode, pack_mask=False):
+    tm = ThresholdMap(thresh_map_name='test map', thresh_mode=mode,
+                      pack_mask=pack_mask)
+    tm.map_scalars = np.random.randn(20,20,20)
+    tm.thresh_limits = (-1.0, 1.0)
+    # build the full mask first
+    tm.binary_mask
+    limits = [(-0.5, 1.0), (-0.5, 0.25), (-2.0, 3.0), (0.1, 0.2)]
+    for lims in limits:
+        old_mask = tm.binary_mask.copy()
+        tm.thresh_limits = lims
+        yield tm, old_mask
+
+def test_incremental_threshold():
+    for mode in ('mask lower', 'mask higher', 'mask between', 'mask outside'):
+        for tm, old_mask in _moving_threshold(mode):
+            full_mask = tm.create_binary_mask()
+            yield npt.assert_array_equal, full_mask, tm.binary_mask.copy()
+            yield (nt.assert_equal,
+                   tm.unmasked_points, full_mask.size - full_mask.sum())
+            # the changed indices should be exactly the flipped points
+            flipped = (full_mask != old_mask).ravel().nonzero()[0]
+            yield npt.assert_array_equal, np.sort(tm.changed_idx), flipped
+
+def test_packed_threshold():
+    for tm, old_mask in _moving_threshold('mask outside', pack_mask=True):
+        full_mask = tm.create_binary_mask()
+        yield npt.assert_array_equal, full_mask, tm.binary_mask
+        yield npt.assert_array_equal, full_mask, tm.packed_mask.unpack()
+        yield (nt.assert_equal,
+               tm.unmasked_points, full_mask.size - full_mask.sum())
+
+def test_changed_points():
+    tm = ThresholdMap(thresh_map_name='test map', thresh_mode='mask lower')
+    scalars = np.zeros((10,10,10))
+    scalars[2:4,5:9,1] = 1
+    tm.map_scalars = scalars
+    tm.thresh_limits = (2, 2)
+    yield nt.assert_equal, tm.unmasked_points, 0
+    tm.thresh_limits = (0.5, 2)
+    yield nt.assert_equal, tm.unmasked_points, 8
+    yield (npt.assert_array_equal,
+           np.sort(tm.changed_idx), scalars.ravel().nonzero()[0])
+    # a new map invalidates the whole mask
+    tm.map_scalars = scalars.copy()
+    yield nt.assert_true, tm.changed_idx is None
+
+def test_alpha_threshold():
+    oi = OverlayInterface(norm=(-1.0, 1.0), alpha_scale=4.0)
+    # the LUT alpha, followed by the under and over alpha
+    yield npt.assert_array_equal, oi.alpha(), np.ones(258)
+    oi.alpha_threshold = (0.0, 'greater than')
+    a = oi.alpha()
+    yield nt.assert_equal, alpha_threshold_index(0.0, oi.norm), 128
+    yield nt.assert_true, (a[:129]==1).all() and (a[129:256]==0).all()
+    # values under the range are shown, values over the range are hidden
+    yield nt.assert_equal, (a[256], a[257]), (1, 0)
+    oi.alpha_threshold = (0.0, 'less than')
+    a = oi.alpha()
+    yield nt.assert_true, (a[:128]==0).all() and (a[128:256]==1).all()
+    yield nt.assert_equal, (a[256], a[257]), (0, 1)
+    # thresholds outside of the normalization limits
+    oi.alpha_threshold = (-2.0, 'greater than')
+    yield nt.assert_true, (oi.alpha()==0).all()
+    oi.alpha_threshold = (-2.0, 'less than')
+    yield nt.assert_true, (oi.alpha()==1).all()
+    oi.alpha_threshold = (2.0, 'greater than')
+    yield nt.assert_true, (oi.alpha()==1).all()
+    oi.alpha_threshold = (2.0, 'less than')
+    yield nt.assert_true, (oi.alpha()==0).all()
+    # the base alpha array is left untouched
+    yield npt.assert_array_equal, oi._base_alpha, np.ones(256)
+
+def test_out_of_range_alpha():
+    oi = OverlayInterface(norm=(-1.0, 1.0), alpha_scale=4.0)
+    cmap = oi.colormap
+    idx = np.array([0, 255, cmap.i_under, cmap.i_over])
+    oi.alpha_threshold = (0.0, 'greater than')
+    rgba = cmap.fast_lookup(idx, alpha=oi.alpha())
+    yield npt.assert_array_equal, rgba[:,3], [1, 0, 1, 0]
+    oi.alpha_threshold = (0.0, 'less than')
+    rgba = cmap.fast_lookup(idx, alpha=oi.alpha())
+    yield npt.assert_array_equal, rgba[:,3], [0, 1, 0, 1]
+    # a LUT alpha alone is repeated for the out-of-range entries
+    rgba = cmap.fast_lookup(idx, alpha=oi.alpha()[:256])
+    yield npt.assert_array_equal, rgba[:,3], [0, 1, 1, 1]
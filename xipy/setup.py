@@ -18,6 +18,7 @@ def configuration(parent_package='', top_path=None):
     config.add_subpackage('vis')
     config.add_subpackage('io')
     config.add_subpackage('colors')
+    config.add_subpackage('benchmarks')
 
     config.add_data_dir('resources')
 
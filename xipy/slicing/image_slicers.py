@@ -1,3 +1,5 @@
+import threading
+
 # NumPy / Scipy
 import numpy as np
 from scipy import ndimage
@@ -14,6 +16,8 @@ from xipy.slicing import SAG, COR, AXI, transverse_plane_lookup, \
 from xipy.external.interpolation import ImageInterpolator
 import xipy.volume_utils as vu
 import xipy.colors.color_mapping as cm
+from xipy.workers import checkpoint, gui_deliver
+import xipy.instrumentation as instr
 
 
 def timedim(img):
@@ -46,6 +50,44 @@ def slice_timewise(img, t):
     cm_3d = ni_api.drop_io_dim(img.coordmap, 't')
     return ni_api.Image(np.asarray(img)[slicing], cm_3d)
 
+def orient_plane(pln, ax, coordmap):
+    """Rotate and flip a plane cut normal to a spatial axis from an
+    array, so that it is aligned in the canonical orientation (see
+    VolumeSlicerInterface.cut_image).
+
+    Parameters
+    ----------
+    pln : ndarray
+        the plane, as sliced from the array
+    ax : str
+        logical axis name
+    coordmap : NIPY AffineTransform
+        the (spatially aligned) index to world mapping of the array
+    """
+    ras = list(xipy_ras)
+    output_order = {
+        ras[0] : (ras[2], ras[1]),
+        ras[1] : (ras[2], ras[0]),
+        ras[2] : (ras[1], ras[0])
+        }[ax]
+    aff = vu.drop_io_dim(coordmap, ax).reordered_range(output_order)
+    rot = aff.affine[:2,:2]
+    # if the little aff is diagonal, let it go
+    # otherwise transpose the plane
+    if np.abs(aff.affine[0,0]) < np.abs(aff.affine[0,1]):
+        # only transpose the plane axes (0 and 1), in
+        # case this plane has vector information in the last dimension
+        axes = np.arange(len(pln.shape))
+        axes[0] = 1; axes[1] = 0
+        pln = pln.transpose(*axes)
+        rot = np.take(rot, [1,0], axis=1)
+    # now check to see if the dims should be reversed
+    if rot[0,0] < 0:
+        pln = pln[::-1]
+    if rot[1,1] < 0:
+        pln = pln[:,::-1]
+    return pln
+
 class VolumeSlicerInterface(object):
     """
     Interface only class!
@@ -96,6 +138,7 @@ class VolumeSlicerInterface(object):
         """
         pass
     
+    @instr.timed('slicing.cut_image')
     def cut_image(self, loc, axes=(SAG, COR, AXI), oriented=True, **interp_kw):
         """
         Return len(axes) planes, which are cut along the axes specified.
@@ -135,6 +178,37 @@ class VolumeSlicerInterface(object):
                   for ax in axes]
         return planes
 
+    def cut_image_progressive(self, loc, callback, axes=(SAG, COR, AXI),
+                              deliver=gui_deliver):
+        """
+        Cut planes for an interactive display. Slicers that can cut
+        cheaper preview planes return those, and later hand back the full
+        quality planes with deliver(callback, planes). By default, the
+        full quality planes are returned at once, and callback is never
+        called.
+
+        Parameters
+        ----------
+        loc : iterable, len-3
+            The coordinates of the cut location
+        callback : callable
+            called as callback(planes) with any refined planes
+        axes : iterable, len-1, 2, or 3
+            The returned planes will be those normal to these axes
+        deliver : callable, optional
+            the function deliver(callback, planes) that hands back the
+            refined planes
+
+        Returns
+        _______
+        len(axes) planes
+        """
+        return self.cut_image(loc, axes=axes)
+
+    def cancel_refinement(self):
+        """Cancel any pending refinement of progressive cuts"""
+        pass
+
     def update_mask(self, mask, positive_mask=True):
         """
         Reset the mask of the raw image data.
@@ -150,12 +224,29 @@ class VolumeSlicerInterface(object):
         pass
 
     @classmethod
-    def from_blobs(klass, scalar_map, voxel_coordinates, coordmap, **kwargs):
-        arr_indices = np.round(coordmap.inverse()(voxel_coordinates)).astype('i')
-##         arr_indices = coordmap.inverse(voxel_coordinates).astype('i')
-        arr = vu.signal_array_to_masked_vol(scalar_map, arr_indices)
+    def from_blobs(klass, scalar_map, voxel_coordinates, coordmap,
+                   measure=0, **kwargs):
+        """Make a slicer from a map of values at a list of world
+        coordinates, which fall on the grid of coordmap. If the map has
+        many measures per voxel, only the volume of one measure is made.
+        """
+        if not vu.is_spatially_aligned(coordmap):
+            arr_indices = np.round(
+                coordmap.inverse()(voxel_coordinates)
+                ).astype('i')
+            arr = vu.signal_array_to_masked_vol(scalar_map, arr_indices)
+            if arr.ndim > 3:
+                arr = arr.reshape(arr.shape[:3] + (-1,))[...,measure]
+            image = ni_api.Image(arr.data, coordmap)
+            return klass(image, mask=np.logical_not(arr.mask), **kwargs)
+        # scatter the measure into the one dense volume the slicer needs
+        sparse = SparseVolumeSlicer.from_blobs(scalar_map, voxel_coordinates,
+                                               coordmap)
+        sparse.measure = measure
+        arr = sparse.to_image()._data
         image = ni_api.Image(arr.data, coordmap)
-        return klass(image, mask=np.logical_not(arr.mask), **kwargs)
+        return klass(image, mask=np.logical_not(np.ma.getmaskarray(arr)),
+                     **kwargs)
                      
 
 
@@ -166,10 +257,16 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
     through an image such that the cut planes extend across the three
     {x,y,z} planes of the target space. Each plane is sampled from the
     original image voxel array by spline interpolation.
+
+    In progressive mode (see cut_image_progressive), planes are first
+    sampled with a cheap, low order interpolator while the cut location
+    is moving, and re-sampled at the full interpolation order once it
+    has been still for a moment. Full order planes are cached by location.
     """
 
     def __init__(self, image, bbox=None, mask=False,
-                 grid_spacing=None, interpolation_order=3):
+                 grid_spacing=None, interpolation_order=3,
+                 preview_order=1, refine_delay=0.25, cache_size=30):
         """
         Creates a new SampledVolumeSlicer
         
@@ -187,6 +284,15 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
         grid_spacing : iterable (optional)
             New grid spacing for the sliced planes. If None, then the
             natural voxel spacing is used.
+        interpolation_order : int (optional)
+            The spline order of the full quality planes
+        preview_order : int (optional)
+            The spline order (0 or 1) of planes cut during interaction
+        refine_delay : float (optional)
+            The idle time (in seconds) after the last progressive cut
+            before the full quality planes are made
+        cache_size : int (optional)
+            The number of full quality planes to keep
         """
         
         xyz_image = ni_api.Image(
@@ -197,12 +303,27 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
         self.coordmap = xyz_image.coordmap
         self.raw_image = xyz_image
         nvox = np.product(self.raw_image.shape)
-        # if the volume array of the map is more than 100mb in memory,
-        # better use a memmap
-        self._use_mmap = nvox*8 > 100e6
+        # if the spline coefficients of the map are more than 100mb in
+        # memory, better use a memmap
+        itemsize = vu.working_dtype(xyz_image._data.dtype,
+                                    order=interpolation_order).itemsize
+        self._use_mmap = nvox*itemsize > 100e6
         self.interpolator = ImageInterpolator(xyz_image,
                                               order=interpolation_order,
                                               use_mmap=self._use_mmap)
+        # orders 0 and 1 need no spline coefficients, so the preview
+        # interpolator is only a view of the image data
+        self.preview_order = min(preview_order, interpolation_order)
+        self.preview_interpolator = ImageInterpolator(xyz_image,
+                                                      order=self.preview_order)
+        self.refine_delay = refine_delay
+        self.cache_size = cache_size
+        # the cache is shared with the refinement (timer) thread, and
+        # its keys are kept in least to most recently used order
+        self._cache_lock = threading.Lock()
+        self._plane_cache = dict()
+        self._cache_keys = []
+        self._refine_timer = None
 ##         if mask is True:
 ##             mask = compute_mask(np.asarray(self.raw_image), cc=0, m=.1, M=.999)
         if type(mask) is np.ndarray:
@@ -265,15 +386,53 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
             # IE, if this is a MaskedArray type mask
             mask = np.logical_not(mask)
 ##         fmask = np.array([ndimage.binary_fill_holes(m) for m in mask], 'd')
-        self.m_interpolator = ImageInterpolator(ni_api.Image(mask, cmap),
+        m_image = ni_api.Image(mask.astype(vu.get_working_precision()), cmap)
+        self.m_interpolator = ImageInterpolator(m_image,
                                                 order=3,
                                                 use_mmap=self._use_mmap)
+        self.m_preview_interpolator = ImageInterpolator(
+            m_image, order=self.preview_order
+            )
         self.raw_mask = mask
         self._masking = True
+        self.clear_plane_cache()
 
     def _update_grid_spacing(self, grid_spacing):
         self.grid_spacing = grid_spacing
         self._define_grids()
+        self.clear_plane_cache()
+
+    def clear_plane_cache(self):
+        self._cache_lock.acquire()
+        try:
+            self._plane_cache = dict()
+            self._cache_keys = []
+        finally:
+            self._cache_lock.release()
+
+    def _cache_plane(self, key, pln):
+        self._cache_lock.acquire()
+        try:
+            if key in self._plane_cache:
+                self._cache_keys.remove(key)
+            self._cache_keys.append(key)
+            self._plane_cache[key] = pln
+            while len(self._cache_keys) > self.cache_size:
+                self._plane_cache.pop(self._cache_keys.pop(0), None)
+        finally:
+            self._cache_lock.release()
+
+    def _cached_plane(self, key):
+        # look up a full order plane (or None), and mark it most recently used
+        self._cache_lock.acquire()
+        try:
+            pln = self._plane_cache.get(key)
+            if pln is not None:
+                self._cache_keys.remove(key)
+                self._cache_keys.append(key)
+            return pln
+        finally:
+            self._cache_lock.release()
 
 ##     def update_mask_crit(self, crit, thresh):
 ##         self._masking = True
@@ -292,7 +451,7 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
         new_coord = round ( (coord-ax_min) / ax_step ) * ax_step + ax_min
         return new_coord
         
-    def _cut_plane(self, ax, coord, **interp_kw):
+    def _cut_plane(self, ax, coord, oriented=True, **interp_kw):
         """
         For a given axis in {SAG, COR, AXI}, make a plane cut in the
         volume at the coordinate value.
@@ -303,6 +462,12 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
             axis label in {SAG, COR, AXI} (defined in xipy.slicing)
         coord : float
             coordinate value along this axis
+        oriented : bool, optional
+            the planes are sampled on the {x,y,z} grids, so they are
+            always in the canonical layout
+        preview : bool, optional
+            Sample the plane at the low preview order, unless the full
+            order plane is already cached
         interp_kw : dict
             Keyword args for the interpolating machinery
             (ie, ndimage.map_coordinates keyword args)
@@ -313,6 +478,20 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
             The transverse plane sampled at the grid points and fixed axis
             coordinate for the given args
         """
+        preview = interp_kw.pop('preview', False)
+        coord = self._closest_grid_pt(coord, ax)
+        # only planes made with the default interpolation are cached
+        key = None if interp_kw else (ax, coord)
+        if key is not None:
+            pln = self._cached_plane(key)
+            if pln is not None:
+                return pln
+        if preview:
+            interpolator = self.preview_interpolator
+            m_interpolator = getattr(self, 'm_preview_interpolator', None)
+        else:
+            interpolator = self.interpolator
+            m_interpolator = getattr(self, 'm_interpolator', None)
     
         # a little hokey
         grid_lookup = {SAG: ('xshape', 'xgrid'),
@@ -323,15 +502,99 @@ class SampledVolumeSlicer(VolumeSlicerInterface):
         grid = getattr(self, gname)
         shape = getattr(self, sname)
         coords = np.empty((3, grid.shape[0]), 'd')
-        coords[ax] = self._closest_grid_pt(coord, ax)
+        coords[ax] = coord
         coords[ii] = grid[:,0]; coords[jj] = grid[:,1]
-        pln = self.interpolator.evaluate(coords, **interp_kw).reshape(shape)
+        pln = interpolator.evaluate(coords, **interp_kw).reshape(shape)
         if self._masking:
-            m_pln = self.m_interpolator.evaluate(coords, mode='constant',
-                                                 cval=-10).reshape(shape)
-            return np.ma.masked_where(m_pln < 0.5, pln)
+            m_pln = m_interpolator.evaluate(coords, mode='constant',
+                                            cval=-10).reshape(shape)
+            pln = np.ma.masked_where(m_pln < 0.5, pln)
+        if not preview and key is not None:
+            self._cache_plane(key, pln)
         return pln
 
+    @instr.timed('slicing.cut_image')
+    def cut_image(self, loc, axes=(SAG, COR, AXI), oriented=True, **interp_kw):
+        """
+        Return len(axes) planes, which are cut normal to the axes
+        specified, through the world coordinate loc.
+
+        Parameters
+        ----------
+        loc : iterable, len-3
+            The {x,y,z} coordinates of the cut location
+        axes : iterable, len-1, 2, or 3
+            The returned planes will be those normal to these axes
+        oriented : bool
+            Whether to return the planes aligned to the canonical
+            orientations (see _cut_plane)
+        interp_kw : dict
+            Keyword args for the interpolating machinery, and the
+            `preview` flag (see _cut_plane)
+
+        Returns
+        _______
+        len(axes) planes
+        """
+        return [self._cut_plane(ax, loc[ax], oriented=oriented, **interp_kw)
+                for ax in enumerated_axes(axes)]
+
+    def cut_image_progressive(self, loc, callback, axes=(SAG, COR, AXI),
+                              deliver=gui_deliver):
+        """
+        Cut planes for an interactive display. The planes returned are
+        sampled at the preview order (unless they are cached at full
+        order), and an idle timer is (re)started. If no other progressive
+        cut is requested before it expires, then the full order planes at
+        this location are made in the timer's thread, and handed back
+        with deliver(callback, planes) (by default, in the GUI thread).
+
+        Parameters
+        ----------
+        loc : iterable, len-3
+            The {x,y,z} coordinates of the cut location
+        callback : callable
+            called as callback(planes) with the refined planes
+        axes : iterable, len-1, 2, or 3
+            The returned planes will be those normal to these axes
+        deliver : callable, optional
+            the function deliver(callback, planes) that hands back the
+            refined planes
+
+        Returns
+        _______
+        len(axes) planes
+        """
+        self.cancel_refinement()
+        axes = enumerated_axes(axes)
+        planes = self.cut_image(loc, axes=axes, preview=True)
+        refined = [ self._cached_plane(
+                        (ax, self._closest_grid_pt(loc[ax], ax))
+                        ) is not None for ax in axes ]
+        if np.all(refined):
+            return planes
+        timer = threading.Timer(self.refine_delay, self._refine,
+                                args=(loc, axes, callback, deliver))
+        timer.setDaemon(True)
+        self._refine_timer = timer
+        timer.start()
+        return planes
+
+    def cancel_refinement(self):
+        """Cancel any pending refinement of progressive cuts"""
+        timer = self._refine_timer
+        self._refine_timer = None
+        if timer is not None:
+            timer.cancel()
+
+    def _refine(self, loc, axes, callback, deliver):
+        timer = threading.currentThread()
+        planes = self.cut_image(loc, axes=axes)
+        # only hand back the planes if no newer cut has been requested
+        if self._refine_timer is timer:
+            self._refine_timer = None
+            deliver(callback, planes)
+
     def update_target_space(self, coreg_image):
         raise NotImplementedError('not sure how to do this yet')
 
@@ -345,7 +608,7 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
     """
     
     def __init__(self, image, bbox=None, mask=False,
-                 grid_spacing=None, spatial_axes=None,
+                 grid_spacing=None, spatial_axes=None, pack_mask=False,
                  **interp_kws):
         """
         Creates a new ResampledVolumeSlicer
@@ -369,6 +632,9 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
           one-to-one correspondence from array axes to spatial axes. However,
           a desired correspondence can be specified here. List in 'x, y, z'
           order.
+        pack_mask : bool (optional)
+          Store the mask bit-packed (see vu.PackedMask), and unpack it
+          plane by plane when slicing
         interp_kws : dict
           Keyword args for the interpolating machinery.. eg:
           * order -- spline order
@@ -376,9 +642,13 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
                      according to the given mode ('constant', 'nearest',
                      'reflect' or 'wrap'). Default is 'constant'.
           * cval -- fill value if mode is 'constant'
+          * dtype -- type of the resampled data (by default, see
+                     xipy.volume_utils.working_dtype)
             
         """
 
+        self.pack_mask = pack_mask
+        self.packed_mask = None
         # XYZ: NEED TO BREAK API HERE FOR MASKED ARRAY
         xyz_image = ni_api.Image(
             image._data,
@@ -405,7 +675,10 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
             else:
                 world_image = xyz_image
         if not aligned:
-            print 'resampling entire Image volume'
+            # this may be a long computation, so give up now if it
+            # is running in a job that has been superseded
+            checkpoint()
+            instr.count('slicing.resample_volume')
             self.__resamp_kws.update(interp_kws)
             self.__resamp_kws.update(
                 dict(grid_spacing=grid_spacing, axis_permutation=spatial_axes)
@@ -413,8 +686,9 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
             world_image = vu.resample_to_world_grid(
                 image, **self.__resamp_kws
                 )
+        # if not resampled, image_arr is the array of the original image
+        self.resampled = not aligned
 
-        
 
         self.coordmap = world_image.coordmap
         self.image_arr = np.asanyarray(world_image)
@@ -463,17 +737,19 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
                 mdata = mdata.astype('B')
             mdata = np.logical_not(mdata)
 
-        # now, if necessary resample the mask ...
+        # now, if necessary resample the mask onto the same grid as
+        # the image (points outside of the image are masked)
         if len(self.__resamp_kws):
-            m_resamp = ni_api.Image(mdata.astype('d'), mask.coordmap)
-            m_resamp = vu.resample_to_world_grid(
-                m_resamp, cval=1, **self.__resamp_kws
+            mdata = vu.resample_binary_mask(
+                ni_api.Image(mdata, mask.coordmap), cval=True,
+                **self.__resamp_kws
                 )
-            # ... and set mdata to wherever the mask goes towards 1
-            mdata = (np.asarray(m_resamp) > 0.5)
 
 
-        print 'new unmasked pts:', mdata.size - mdata.sum()
+        if self.pack_mask:
+            self.packed_mask = vu.PackedMask(mdata)
+            self.image_arr = np.ma.getdata(self.image_arr)
+            return
         self.image_arr = np.ma.masked_array(np.ma.getdata(self.image_arr),
                                             mask=mdata)
         
@@ -506,30 +782,13 @@ class ResampledVolumeSlicer(VolumeSlicerInterface):
             slicer = [slice(None)]*3
             slicer[arr_ax] = idx
             pln = self.image_arr[tuple(slicer)]
+            if self.packed_mask is not None:
+                pln = np.ma.masked_array(
+                    pln, mask=self.packed_mask.plane(arr_ax, idx)
+                    )
 
         if oriented:
-            ras = list(xipy_ras)
-            output_order = {
-                ras[0] : (ras[2], ras[1]),
-                ras[1] : (ras[2], ras[0]),
-                ras[2] : (ras[1], ras[0])
-                }[ax]
-            aff=vu.drop_io_dim(self.coordmap, ax).reordered_range(output_order)
-            rot = aff.affine[:2,:2]
-            # if the little aff is diagonal, let it go
-            # otherwise transpose the plane
-            if np.abs(aff.affine[0,0]) < np.abs(aff.affine[0,1]):
-                # only transpose the plane axes (0 and 1), in
-                # case this plane has vector information in the last dimension
-                axes = np.arange(len(pln.shape))
-                axes[0] = 1; axes[1] = 0
-                pln = pln.transpose(*axes)
-                rot = np.take(rot, [1,0], axis=1)
-            # now check to see if the dims should be reversed
-            if rot[0,0] < 0:
-                pln = pln[::-1]
-            if rot[1,1] < 0:
-                pln = pln[:,::-1]
+            pln = orient_plane(pln, ax, self.coordmap)
         return pln
 
 class ResampledIndexVolumeSlicer(ResampledVolumeSlicer):
@@ -569,6 +828,8 @@ class ResampledIndexVolumeSlicer(ResampledVolumeSlicer):
         """
         # XYZ: NEED TO BREAK API HERE FOR MASKED ARRAY
         vol_data = np.ma.masked_array(image._data)
+        # an autoscaled norm depends on all of the (unmasked) data
+        self._autoscaled = norm is None or norm==(0, 0)
         if norm is not False:
             # normalize the image data to the range [0,1]
             if norm is None or norm==(0, 0):
@@ -577,21 +838,30 @@ class ResampledIndexVolumeSlicer(ResampledVolumeSlicer):
                 norm = colors.Normalize(*norm)
             elif type(norm) is not colors.Normalize:
                 raise ValueError('Could not parse normalization parameter')
+            t0 = instr.start()
             compressed = norm(vol_data)
+            checkpoint()
             # map to indices
             raw_idx = cm.MixedAlphaColormap.lut_indices(compressed)
+            instr.stop('lut.lut_indices', t0)
         else:
             raw_idx = np.asarray(image)
+        self.norm = norm
+        # counts the in-place changes made by patch_indices
+        self.patch_count = 0
 
+        checkpoint()
         idx_image = ni_api.Image(raw_idx, image.coordmap)
         # Resample to a diagonal affine with grid spacing as given.
         # Fill in boundary voxels with "i_bad", so they are hidden
         # in the color mapping
         bad_idx = cm.MixedAlphaColormap.i_bad
+        # resampled indices stay indices, whatever the spline order
         ResampledVolumeSlicer.__init__(self, idx_image, bbox=bbox,
                                        grid_spacing=grid_spacing,
                                        spatial_axes=spatial_axes,
-                                       order=order, cval=bad_idx)
+                                       order=order, cval=bad_idx,
+                                       dtype=raw_idx.dtype)
 
 ##     def __init__(self, image, bbox=None, norm=None,
 ##                  grid_spacing=None, spatial_axes=None, order=0):
@@ -654,5 +924,321 @@ class ResampledIndexVolumeSlicer(ResampledVolumeSlicer):
     def update_mask(self, mask, positive_mask=True):
         raise NotImplementedError('no updating masks in index mapped images')
 
+    def can_patch_indices(self):
+        """Whether patch_indices() is possible: the image must have been
+        normalized with fixed limits by this slicer, and not resampled
+        (so that image_arr is laid out like the original image array).
+        """
+        return not (self.resampled or self.norm is False or self._autoscaled)
+
+    def patch_indices(self, flat_idx, values, masked=None):
+        """Re-map a few voxels of the image to LUT indices, in-place
+        (see can_patch_indices).
+
+        Parameters
+        ----------
+        flat_idx : ndarray
+            flat indices into the original image array
+        values : ndarray
+            the new scalar values of these voxels
+        masked : ndarray (optional)
+            True where these voxels are now masked
+
+        Returns
+        -------
+        the new LUT indices of the voxels
+        """
+        if not self.can_patch_indices():
+            raise ValueError('only the indices of an image normalized with '\
+                             'fixed limits, and not resampled, can be patched')
+        values = np.ma.masked_array(values, mask=masked)
+        lut_idx = cm.MixedAlphaColormap.lut_indices(self.norm(values))
+        self.image_arr.flat[flat_idx] = lut_idx
+        self.patch_count += 1
+        return lut_idx
+
             
         
+
+class SparseVolumeSlicer(VolumeSlicerInterface):
+    """
+    This object slices a sparse map, such as a MEG/EEG source map, which
+    has values at only a small set of voxels in a grid. Only the flat
+    grid index and the value(s) of each of these voxels are stored,
+    along with the grid shape and index to world mapping. No dense volume
+    is made to cut planes, threshold the map, or map it to colormap LUT
+    indices.
+
+    If the map has many measures per voxel (eg, time points), the
+    measure in use is chosen with the `measure` attribute.
+
+    VolumeSlicerInterface.from_blobs goes through this map, so only the
+    volume of one measure is ever made. BlendedImages makes its over
+    index image straight from the LUT indices of the map voxels, and
+    ImageOverlayManager overlays sparse maps (see set_sparse_data).
+    """
+
+    def __init__(self, values, flat_idx, shape, coordmap, mask=None):
+        """
+        Creates a new SparseVolumeSlicer
+
+        Parameters
+        ----------
+        values : ndarray
+            nvox x [num_measures] array of map values
+        flat_idx : ndarray
+            nvox array of indices into the flattened (C-order) grid
+        shape : sequence
+            the grid shape, eg [imax, jmax, kmax]
+        coordmap : NIPY AffineTransform
+            the mapping from grid indices to world coordinates, which
+            should be spatially aligned (sparse maps are not resampled)
+        mask : ndarray (optional)
+            A positive mask (unmasked points marked True), either of the
+            nvox map voxels, or of the whole grid
+        """
+        if not vu.is_spatially_aligned(coordmap):
+            raise ValueError('sparse maps must be spatially aligned with '\
+                             'the world coordinates')
+        self.shape = tuple(shape)
+        self.coordmap = coordmap.reordered_range(xipy_ras)
+        self.bbox = vu.world_limits(self.coordmap, self.shape)
+        self.grid_spacing = vu.voxel_size(self.coordmap.affine)
+        self._ax_lookup = vu.spatial_axes_lookup(self.coordmap)
+
+        flat_idx = np.asarray(flat_idx)
+        order = np.argsort(flat_idx, kind='mergesort')
+        self.flat_idx = flat_idx[order].astype(np.intp)
+        self.values = np.asarray(values)[order]
+        # for each array axis, keep the map voxels sorted by their index
+        # along that axis, and where each slice of the grid starts
+        self._ax_order = []
+        self._ax_starts = []
+        for arr_ax, ijk in enumerate(np.unravel_index(self.flat_idx,
+                                                      self.shape)):
+            ax_order = np.argsort(ijk, kind='mergesort')
+            self._ax_order.append(ax_order)
+            self._ax_starts.append(
+                np.searchsorted(ijk[ax_order],
+                                np.arange(self.shape[arr_ax]+1))
+                )
+
+        self._measure = 0
+        self._lut_cache = None
+        self.unmasked = None
+        if mask is not None:
+            self.update_mask(mask)
+
+    @classmethod
+    def from_blobs(klass, scalar_map, voxel_coordinates, coordmap,
+                   grid_shape=[], **kwargs):
+        """Make a SparseVolumeSlicer from a map of values at a list of
+        world coordinates, which fall on the grid of coordmap.
+        """
+        arr_indices = np.round(
+            coordmap.inverse()(voxel_coordinates)
+            ).astype('i')
+        grid, flat_idx = vu.calc_grid_and_map(arr_indices, grid=grid_shape)
+        return klass(scalar_map, flat_idx, grid, coordmap, **kwargs)
+
+    def _get_measure(self):
+        return self._measure
+    def _set_measure(self, measure):
+        self._measure = measure
+        self._lut_cache = None
+    measure = property(_get_measure, _set_measure)
+
+    @property
+    def scalars(self):
+        """The values of the measure in use, at each map voxel"""
+        if self.values.ndim > 1:
+            return self.values.reshape(len(self.values), -1)[:,self.measure]
+        return self.values
+
+    def update_mask(self, mask, positive_mask=True):
+        """
+        Reset the mask of the map.
+
+        Parameters
+        ----------
+        mask : ndarray
+            The new mask, either of the nvox map voxels (eg, the result
+            of ThresholdMap.threshold_values(slicer.scalars)), or of
+            the whole grid. Or None, to unmask all map voxels.
+        positive_mask : bool
+            Indicates whether this is a positive (True=unmasked) or
+            negative (True=masked) style mask
+        """
+        self._lut_cache = None
+        if mask is None:
+            self.unmasked = None
+            return
+        mask = np.asarray(mask)
+        if mask.shape != (len(self.flat_idx),):
+            mask = mask.reshape(-1)[self.flat_idx]
+        self.unmasked = mask.astype(np.bool) if positive_mask \
+                        else np.logical_not(mask)
+
+    def lut_indices(self, norm):
+        """Return the colormap LUT indices of the map voxels, as in
+        ResampledIndexVolumeSlicer (masked voxels index i_bad).
+
+        Parameters
+        ----------
+        norm : (black-pt, white-pt) pair or mpl.colors.Normalize instance
+            Limits for normalizing the scalar values (if None or (0, 0),
+            the limits of the unmasked values)
+        """
+        if norm is None or norm == (0, 0):
+            # autoscale to the unmasked map values, as ResampledIndexVolumeSlicer
+            # would to the unmasked volume
+            norm = colors.Normalize()
+            scalars = self.scalars if self.unmasked is None \
+                      else self.scalars[self.unmasked]
+            norm.autoscale_None(scalars)
+        elif type(norm) in (list, tuple):
+            norm = colors.Normalize(*norm)
+        key = (norm.vmin, norm.vmax)
+        if self._lut_cache is not None and self._lut_cache[0] == key:
+            return self._lut_cache[1]
+        lut_idx = self._map_to_lut(self.scalars, norm)
+        self._lut_cache = (key, lut_idx)
+        return lut_idx
+
+    def _map_to_lut(self, scalars, norm):
+        lut_idx = cm.MixedAlphaColormap.lut_indices(norm(scalars))
+        if self.unmasked is not None:
+            lut_idx[~self.unmasked] = cm.MixedAlphaColormap.i_bad
+        return lut_idx
+
+    def lut_volume(self, norm):
+        """Return a new volume, with the grid shape, of the colormap LUT
+        indices of the map voxels (other voxels index i_bad).
+
+        Parameters
+        ----------
+        norm : (black-pt, white-pt) pair or mpl.colors.Normalize instance
+            Limits for normalizing the scalar values
+        """
+        vol = np.empty(self.shape, np.int32)
+        vol.fill(cm.MixedAlphaColormap.i_bad)
+        vol.reshape(-1)[self.flat_idx] = self.lut_indices(norm)
+        return vol
+
+    def to_image(self):
+        """Make a dense NIPY Image of the measure in use, with the
+        masked and empty voxels masked out.
+        """
+        arr = np.ma.masked_all(self.shape, self.values.dtype)
+        if self.unmasked is None:
+            arr.flat[self.flat_idx] = self.scalars
+        else:
+            arr.flat[self.flat_idx[self.unmasked]] = \
+                                 self.scalars[self.unmasked]
+        return ni_api.Image(arr, self.coordmap)
+
+    def _cut_plane(self, ax, indices, oriented=True, lut_norm=None):
+        """
+        For a given axis name, make a cut through the map at the given
+        index coordinates
+
+        Parameters
+        ----------
+        ax : str
+            logical axis name
+        indices : len-3 iterable
+            index coordinates
+        oriented : bool, optional
+            return the plane oriented in the canonical layout
+        lut_norm : optional
+            if given, return a plane of colormap LUT indices with this
+            normalization (see lut_indices), rather than a MaskedArray
+            of the map values
+        Returns
+        _______
+        plane : ndarray
+            The transverse plane cut along the given axis and coordinate
+        """
+        arr_ax = self._ax_lookup[ax]
+        idx = int(round(indices[arr_ax]))
+        pln_shape = [d for n, d in enumerate(self.shape) if n != arr_ax]
+        if lut_norm is None:
+            pln = np.ma.masked_all(pln_shape, self.values.dtype)
+        else:
+            pln = np.empty(pln_shape, np.int32)
+            pln.fill(cm.MixedAlphaColormap.i_bad)
+        if 0 <= idx < self.shape[arr_ax]:
+            starts = self._ax_starts[arr_ax]
+            entries = self._ax_order[arr_ax][starts[idx]:starts[idx+1]]
+            if lut_norm is None:
+                if self.unmasked is not None:
+                    entries = entries[self.unmasked[entries]]
+                values = self.scalars[entries]
+            else:
+                values = self.lut_indices(lut_norm)[entries]
+            ijk = np.unravel_index(self.flat_idx[entries], self.shape)
+            pln_idx = [ijk[n] for n in xrange(3) if n != arr_ax]
+            pln[tuple(pln_idx)] = values
+        if oriented:
+            pln = orient_plane(pln, ax, self.coordmap)
+        return pln
+
+class TimeResolvedSparseMap(SparseVolumeSlicer):
+    """
+    A SparseVolumeSlicer of a map with a time course at each voxel (eg,
+    a beamformer source map), whose measures are time points. The
+    nvox x ntime signal matrix is stored once. The volume of one time
+    point is made by writing only the nvox map values into a grid that
+    is reused from frame to frame, so stepping through time costs O(nvox)
+    rather than slicing (or building) a dense 4D array.
+
+    When no threshold mask is applied, ImageOverlayManager steps through
+    time by writing only the map voxels of each frame (see frame()) into
+    the overlay in hand, and the ortho viewer re-maps only those voxels
+    to LUT indices. Otherwise, each frame is copied, and then masked,
+    sorted and resampled as a dense volume.
+    """
+
+    def __init__(self, values, flat_idx, shape, coordmap, mask=None):
+        SparseVolumeSlicer.__init__(self, values, flat_idx, shape, coordmap,
+                                    mask=mask)
+        if self.values.ndim != 2:
+            raise ValueError('the time resolved map should be nvox x ntime')
+        self._scalar_vol = None
+
+    @property
+    def ntime(self):
+        return self.values.shape[1]
+
+    def update_mask(self, mask, positive_mask=True):
+        SparseVolumeSlicer.update_mask(self, mask,
+                                       positive_mask=positive_mask)
+        # the mask of the frame volume is reset on the next frame
+        self._scalar_vol = None
+
+    def scalar_volume(self, t):
+        """Return the map values at time point t, in a MaskedArray volume
+        with the grid shape. The same array is refilled for each call,
+        so copy it to keep a frame.
+        """
+        if self._scalar_vol is None:
+            m = np.ones(self.shape, np.bool)
+            m.flat[self._unmasked_idx()] = False
+            self._scalar_vol = np.ma.masked_array(
+                np.zeros(self.shape, self.values.dtype), mask=m
+                )
+        self._scalar_vol.data.reshape(-1)[self.flat_idx] = self.values[:,t]
+        return self._scalar_vol
+
+    def frame(self, t):
+        """Return the flat grid indices and the values at time point t
+        of the unmasked map voxels.
+        """
+        if self.unmasked is None:
+            return self.flat_idx, self.values[:,t]
+        return self.flat_idx[self.unmasked], self.values[self.unmasked,t]
+
+    def _unmasked_idx(self):
+        if self.unmasked is None:
+            return self.flat_idx
+        return self.flat_idx[self.unmasked]
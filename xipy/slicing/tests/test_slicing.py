@@ -0,0 +1,172 @@
+import numpy as np
+import numpy.testing as npt
+from nose.tools import assert_true, assert_equal
+
+import nipy.core.api as ni_api
+
+from xipy.slicing import xipy_ras, SAG, COR, AXI
+from xipy.workers import direct_deliver
+
+# the code to test
+from xipy.slicing.image_slicers import SampledVolumeSlicer, \
+     ResampledVolumeSlicer, SparseVolumeSlicer
+import xipy.colors.color_mapping as cm
+
+def gen_img(shape=(10,20,12)):
+    scalars = np.random.randn(*shape)
+    return ni_api.Image(scalars,
+                        ni_api.AffineTransform.from_params(
+                            'ijk', xipy_ras, np.eye(4)
+                            )
+                        )
+
+def test_progressive_cuts():
+    slicer = SampledVolumeSlicer(gen_img(), refine_delay=0.05)
+    loc = (4.0, 7.0, 5.0)
+    full = slicer.cut_image(loc)
+    slicer.clear_plane_cache()
+    refined = []
+    previews = slicer.cut_image_progressive(loc, refined.append,
+                                            deliver=direct_deliver)
+    timer = slicer._refine_timer
+    yield assert_equal, [p.shape for p in previews], [p.shape for p in full]
+    timer.join()
+    yield assert_equal, len(refined), 1
+    for p1, p2 in zip(refined[0], full):
+        yield npt.assert_array_almost_equal, p1, p2
+    # now the full order planes are cached, and no refinement is needed
+    planes = slicer.cut_image_progressive(loc, refined.append,
+                                          deliver=direct_deliver)
+    yield assert_true, slicer._refine_timer is None
+    for p1, p2 in zip(planes, full):
+        yield npt.assert_array_almost_equal, p1, p2
+
+def test_superseded_refinement():
+    slicer = SampledVolumeSlicer(gen_img(), refine_delay=0.05)
+    refined = []
+    slicer.cut_image_progressive((2.0, 2.0, 2.0), refined.append,
+                                 axes=(SAG,), deliver=direct_deliver)
+    first_timer = slicer._refine_timer
+    slicer.cut_image_progressive((3.0, 2.0, 2.0), refined.append,
+                                 axes=(SAG,), deliver=direct_deliver)
+    last_timer = slicer._refine_timer
+    last_timer.join()
+    first_timer.join()
+    # only the last location is refined
+    yield assert_equal, len(refined), 1
+    yield assert_equal, (SAG, 3.0) in slicer._plane_cache, True
+    yield assert_equal, (SAG, 2.0) in slicer._plane_cache, False
+
+def test_plane_cache_lru():
+    slicer = SampledVolumeSlicer(gen_img(), cache_size=2)
+    slicer.cut_image((2.0, 0, 0), axes=(SAG,))
+    slicer.cut_image((3.0, 0, 0), axes=(SAG,))
+    # a cache hit makes the first plane the most recently used
+    slicer.cut_image((2.0, 0, 0), axes=(SAG,))
+    slicer.cut_image((4.0, 0, 0), axes=(SAG,))
+    yield assert_equal, slicer._cache_keys, [(SAG, 2.0), (SAG, 4.0)]
+    yield assert_equal, (SAG, 3.0) in slicer._plane_cache, False
+
+def test_sampled_oriented_cuts():
+    slicer = SampledVolumeSlicer(gen_img())
+    loc = (4.0, 7.0, 5.0)
+    # the sampled planes are always in the canonical layout
+    for p1, p2 in zip(slicer.cut_image(loc),
+                      slicer.cut_image(loc, oriented=False)):
+        yield npt.assert_array_equal, p1, p2
+
+def test_default_progressive_cuts():
+    # slicers without a preview mode return the full planes at once
+    slicer = ResampledVolumeSlicer(gen_img())
+    loc = (4.0, 7.0, 5.0)
+    refined = []
+    planes = slicer.cut_image_progressive(loc, refined.append,
+                                          deliver=direct_deliver)
+    for p1, p2 in zip(planes, slicer.cut_image(loc)):
+        yield npt.assert_array_equal, p1, p2
+    yield assert_equal, refined, []
+
+def _sparse_map(nmeasures=3):
+    shape = (10,20,12)
+    cmap = ni_api.AffineTransform.from_params('ijk', xipy_ras, np.eye(4))
+    flat_idx = np.random.permutation(np.prod(shape))[:200]
+    values = np.random.randn(200, nmeasures)
+    return SparseVolumeSlicer(values, flat_idx, shape, cmap), values, flat_idx
+
+def test_sparse_cuts():
+    sparse, values, flat_idx = _sparse_map()
+    sparse.measure = 1
+    dense = sparse.to_image()
+    # the dense version has the values of the measure in use
+    arr = np.ma.getdata(np.asarray(dense._data)).reshape(-1)
+    yield npt.assert_array_equal, arr[flat_idx], values[:,1]
+    dense_slicer = ResampledVolumeSlicer(dense)
+    for loc in [(0,0,0), (3,14,11), (9,19,5)]:
+        for p1, p2 in zip(sparse.cut_image(loc), dense_slicer.cut_image(loc)):
+            yield npt.assert_array_equal, np.ma.getmaskarray(p1), \
+                  np.ma.getmaskarray(p2)
+            yield npt.assert_array_equal, p1.filled(0), p2.filled(0)
+
+def test_sparse_threshold_and_lut():
+    sparse, values, flat_idx = _sparse_map(nmeasures=1)
+    unmasked = sparse.scalars > 0
+    sparse.update_mask(unmasked)
+    lut_idx = sparse.lut_indices((-1, 1))
+    yield assert_true, (lut_idx[~unmasked] == cm.MixedAlphaColormap.i_bad).all()
+    yield assert_true, (lut_idx[unmasked] >= 128).all()
+    # planes of indices have i_bad everywhere off the map
+    plane = sparse.cut_image((4,0,0), axes=(SAG,), lut_norm=(-1,1))[0]
+    masked_plane = sparse.cut_image((4,0,0), axes=(SAG,))[0]
+    yield npt.assert_array_equal, plane == cm.MixedAlphaColormap.i_bad, \
+          np.ma.getmaskarray(masked_plane)
+
+def test_blobs_through_sparse():
+    sparse, values, flat_idx = _sparse_map()
+    cmap = sparse.coordmap
+    ijk = np.array(np.unravel_index(flat_idx, sparse.shape)).T
+    coords = cmap(ijk)
+    slicer = ResampledVolumeSlicer.from_blobs(values, coords, cmap,
+                                              measure=2)
+    # (the grid of a blob map spans the map voxels)
+    sparse = SparseVolumeSlicer.from_blobs(values, coords, cmap)
+    sparse.measure = 2
+    dense_slicer = ResampledVolumeSlicer(sparse.to_image())
+    for loc in [(0,0,0), (3,14,11)]:
+        for p1, p2 in zip(slicer.cut_image(loc),
+                          dense_slicer.cut_image(loc)):
+            yield npt.assert_array_equal, np.ma.getmaskarray(p1), \
+                  np.ma.getmaskarray(p2)
+            yield npt.assert_array_equal, np.ma.filled(p1, 0), \
+                  np.ma.filled(p2, 0)
+
+def test_sparse_lut_volume():
+    sparse, values, flat_idx = _sparse_map(nmeasures=1)
+    vol = sparse.lut_volume((-1, 1))
+    yield assert_equal, vol.shape, sparse.shape
+    yield npt.assert_array_equal, vol.reshape(-1)[sparse.flat_idx], \
+          sparse.lut_indices((-1, 1))
+    yield assert_equal, (vol != cm.MixedAlphaColormap.i_bad).sum(), 200
+    # an autoscaled norm spans the map values
+    lut_idx = sparse.lut_indices((0, 0))
+    yield assert_equal, (lut_idx.min(), lut_idx.max()), (0, 255)
+
+def test_time_resolved_frames():
+    from xipy.slicing.image_slicers import TimeResolvedSparseMap
+    shape = (10,20,12)
+    cmap = ni_api.AffineTransform.from_params('ijk', xipy_ras, np.eye(4))
+    flat_idx = np.random.permutation(np.prod(shape))[:50]
+    values = np.random.randn(50, 8)
+    tmap = TimeResolvedSparseMap(values, flat_idx, shape, cmap)
+    yield assert_equal, tmap.ntime, 8
+    vol = tmap.scalar_volume(0)
+    for t in (3, 7):
+        vol_t = tmap.scalar_volume(t)
+        # the same volume is refilled
+        yield assert_true, vol_t is vol
+        yield npt.assert_array_equal, vol_t.reshape(-1)[flat_idx], values[:,t]
+        yield assert_equal, vol_t.count(), 50
+    # the values of the unmasked map voxels
+    tmap.update_mask(tmap.values[:,0] > 0)
+    idx, vals = tmap.frame(5)
+    yield npt.assert_array_equal, idx, tmap.flat_idx[tmap.values[:,0] > 0]
+    yield npt.assert_array_equal, vals, tmap.values[tmap.values[:,0] > 0, 5]
@@ -0,0 +1,37 @@
+import time
+import nose.tools as nt
+
+import xipy.instrumentation as instr
+
+def test_disabled():
+    instr.disable()
+    instr.reset()
+    instr.count('a counter')
+    instr.stop('a timer', instr.start())
+    instr.timed('a function')(lambda: None)()
+    timers, counters = instr.statistics()
+    yield nt.assert_equal, timers, dict()
+    yield nt.assert_equal, counters, dict()
+
+def test_timers_and_counters():
+    instr.enable()
+    instr.reset()
+    try:
+        @instr.timed('sleep')
+        def sleep(secs):
+            """sleep a while"""
+            time.sleep(secs)
+            return secs
+        yield nt.assert_equal, sleep(0.01), 0.01
+        sleep(0.02)
+        yield nt.assert_equal, sleep.func_name, 'sleep'
+        instr.count('calls', 2)
+        instr.count('calls')
+        timers, counters = instr.statistics()
+        n, total, mean, mx = timers['sleep']
+        yield nt.assert_equal, n, 2
+        yield nt.assert_true, total >= 0.03 and mx >= 0.02
+        yield nt.assert_equal, counters['calls'], 3
+    finally:
+        instr.disable()
+        instr.reset()
@@ -0,0 +1,124 @@
+import numpy as np
+import numpy.testing as npt
+import nose.tools as nt
+
+import nipy.core.api as ni_api
+
+from xipy.slicing import xipy_ras, SAG, COR, AXI
+from xipy.slicing.image_slicers import ResampledVolumeSlicer
+import xipy.colors.color_mapping as cm
+
+# the code to test
+from xipy.vis.mosaic import slice_stack, tile_planes, to_rgba_bytes, \
+     render_mosaic
+
+def gen_img(shape=(10,20,12)):
+    scalars = np.random.randn(*shape)
+    return ni_api.Image(scalars,
+                        ni_api.AffineTransform.from_params(
+                            'ijk', xipy_ras, np.eye(4)
+                            )
+                        )
+
+def _compare_with_cuts(slicer, axis, coords):
+    planes, kept = slice_stack(slicer, axis=axis, coords=coords)
+    yield nt.assert_equal, len(planes), len(coords)
+    center = np.array(slicer.bbox, 'd').mean(axis=1)
+    for plane, c in zip(planes, kept):
+        loc = center.copy()
+        loc[axis] = c
+        cut = slicer.cut_image(loc, axes=[axis])[0]
+        yield nt.assert_equal, plane.shape, cut.shape
+        yield (npt.assert_array_equal,
+               np.ma.getmaskarray(plane), np.ma.getmaskarray(cut))
+        yield npt.assert_array_equal, np.ma.filled(plane, 0), \
+              np.ma.filled(cut, 0)
+
+def test_slice_stack():
+    slicer = ResampledVolumeSlicer(gen_img())
+    for axis in (SAG, COR, AXI):
+        # evenly spaced planes (a strided view of the array)
+        for t in _compare_with_cuts(slicer, axis, [2., 4., 6.]):
+            yield t
+        # unevenly spaced planes
+        for t in _compare_with_cuts(slicer, axis, [1., 2., 7.]):
+            yield t
+
+def test_slice_stack_outside():
+    slicer = ResampledVolumeSlicer(gen_img())
+    planes, coords = slice_stack(slicer, axis=AXI, coords=[-50., 3., 50.])
+    yield npt.assert_array_equal, coords, [3.]
+    yield nt.assert_equal, len(planes), 1
+
+def test_slice_stack_rgba():
+    from xipy.colors.rgba_blending import BlendedImages
+    blender = BlendedImages(vtk_order=False, main=gen_img())
+    for axis in (SAG, COR, AXI):
+        planes, coords = slice_stack(blender, axis=axis, coords=[2., 5.])
+        # a stack of RGBA planes
+        yield nt.assert_equal, planes.ndim, 4
+        yield nt.assert_equal, planes.shape[-1], 4
+        for t in _compare_with_cuts(blender, axis, [2., 5.]):
+            yield t
+    # the RGBA planes are tiled as they are
+    canvas, coords = render_mosaic(blender, axis=AXI, nslices=4, ncols=2)
+    yield nt.assert_equal, len(coords), 4
+    planes = slice_stack(blender, axis=AXI, coords=coords)[0]
+    yield npt.assert_array_equal, canvas, tile_planes(planes, ncols=2)
+    # planes outside of the volume
+    planes, coords = slice_stack(blender, axis=AXI, coords=[-50., 50.])
+    yield nt.assert_equal, planes.shape, (0,0,0,4)
+    yield (nt.assert_raises, ValueError, render_mosaic, blender, None, AXI,
+           [-50., 50.])
+
+def test_slice_stack_packed_mask():
+    img = gen_img()
+    slicer = ResampledVolumeSlicer(img, pack_mask=True)
+    positive = ni_api.Image((np.asarray(img) > 0).astype('B'), img.coordmap)
+    slicer.update_mask(positive)
+    yield nt.assert_true, slicer.packed_mask is not None
+    for axis in (SAG, COR, AXI):
+        planes, coords = slice_stack(slicer, axis=axis, coords=[2., 5.])
+        # the masked voxels are masked in the stack
+        yield nt.assert_true, np.ma.getmaskarray(planes).any()
+        for t in _compare_with_cuts(slicer, axis, [2., 5.]):
+            yield t
+
+def test_tile_planes():
+    nplanes, rows, cols = 5, 3, 4
+    planes = np.empty((nplanes, rows, cols, 4), 'B')
+    for n in xrange(nplanes):
+        for r in xrange(rows):
+            planes[n,r] = 10*n + r
+    bg = (1, 2, 3, 255)
+    canvas = tile_planes(planes, ncols=3, pad=1, bg=bg, flip=False)
+    yield nt.assert_equal, canvas.shape, (2*rows + 3, 3*cols + 4, 4)
+    for n in xrange(nplanes):
+        r, c = divmod(n, 3)
+        y0 = 1 + r*(rows + 1)
+        x0 = 1 + c*(cols + 1)
+        yield (npt.assert_array_equal,
+               canvas[y0:y0+rows, x0:x0+cols], planes[n])
+    # the padding, and the empty last tile, are background
+    yield nt.assert_true, (canvas[0] == bg).all()
+    yield nt.assert_true, (canvas[:,0] == bg).all()
+    yield nt.assert_true, (canvas[5:8, 11:15] == bg).all()
+    # flipping puts the first row of each plane at the bottom of its tile
+    flipped = tile_planes(planes, ncols=3, pad=1, bg=bg)
+    yield npt.assert_array_equal, flipped[1:4, 1:5], planes[0,::-1]
+
+def test_to_rgba_bytes():
+    rgba = np.zeros((2,3,4,4), 'B')
+    yield nt.assert_true, to_rgba_bytes(rgba) is rgba
+    planes = np.array([[[0., 0.5], [1., np.nan]]])
+    bytes = to_rgba_bytes(planes, cmap=cm.gray, norm=(0., 1.))
+    yield nt.assert_equal, bytes.shape, (1, 2, 2, 4)
+    yield nt.assert_equal, bytes.dtype.char, 'B'
+    yield npt.assert_array_equal, bytes[0,0,0], (0, 0, 0, 255)
+    yield npt.assert_array_equal, bytes[0,1,0], (255, 255, 255, 255)
+    # invalid values take the colormap's "bad" color
+    bad = cm.gray(np.ma.masked_array([0.], mask=[True]), bytes=True)[0]
+    yield npt.assert_array_equal, bytes[0,1,1], bad
+    # by default, the planes are normalized to their own limits
+    yield (npt.assert_array_equal,
+           to_rgba_bytes(2*planes, cmap=cm.gray), bytes)
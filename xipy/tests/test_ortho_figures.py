@@ -0,0 +1,87 @@
+import numpy as np
+import nose.tools as nt
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from xipy.slicing import SAG, COR, AXI
+
+# the code to test
+from xipy.vis.ortho_figures import OrthoFigures
+
+class AggOrthoFigures(OrthoFigures):
+    """OrthoFigures on Agg canvases, which records its emitted states"""
+    def __init__(self, limits):
+        self._full_fov_lims = limits
+        figures = []
+        for ax in (SAG, COR, AXI):
+            fig = Figure(figsize=(2,2), dpi=50)
+            FigureCanvasAgg(fig)
+            figures.append(fig)
+        self._init_figures(figures, blit=True)
+        self.emitted = []
+    def emit_states(self, *indices):
+        self.emitted.append(indices)
+
+class Event(object):
+    def __init__(self, canvas, x, y):
+        self.canvas = canvas
+        self.inaxes = True
+        self.xdata = x
+        self.ydata = y
+
+_limits = [(-10,10), (-20,20), (-5,15)]
+
+def _ortho_figures():
+    ofigs = AggOrthoFigures(_limits)
+    planes = [np.zeros((40,40)), np.zeros((20,20)), np.zeros((40,20))]
+    ofigs.initialize_plots(planes, (1,2,3), _limits)
+    return ofigs
+
+def test_initialize_plots():
+    ofigs = _ortho_figures()
+    yield nt.assert_equal, len(ofigs.main_plots), 3
+    yield nt.assert_equal, ofigs.active_voxel, [1,2,3]
+    yield nt.assert_equal, ofigs.emitted, [(SAG,COR,AXI)]
+    # each crosshair is at the point of the other two axes
+    yield nt.assert_equal, (ofigs.sag_fig.px, ofigs.sag_fig.py), (2,3)
+    yield nt.assert_equal, (ofigs.cor_fig.px, ofigs.cor_fig.py), (1,3)
+    yield nt.assert_equal, (ofigs.axi_fig.px, ofigs.axi_fig.py), (1,2)
+
+def test_coord_event_handling():
+    ofigs = _ortho_figures()
+    ofigs.paint_frame()
+    axes = ofigs.coord_event_handling(Event(ofigs.axi_fig.canvas, 4., -6.))
+    yield nt.assert_equal, axes, (SAG, COR)
+    yield nt.assert_equal, ofigs.emitted[-1], (SAG, COR)
+    yield nt.assert_equal, list(ofigs.active_voxel), [4., -6., 3]
+    yield nt.assert_equal, (ofigs.sag_fig.px, ofigs.sag_fig.py), (-6., 3)
+    yield nt.assert_equal, (ofigs.cor_fig.px, ofigs.cor_fig.py), (4., 3)
+    # the crosshairs are painted once, in the next frame
+    yield nt.assert_equal, [f.redraw_invalid() for f in ofigs.figs], \
+          [True]*3
+    yield nt.assert_equal, [f.redraw_invalid() for f in ofigs.figs], \
+          [False]*3
+    # points off the figure are clipped, and stray hits ignored
+    ofigs.coord_event_handling(Event(ofigs.sag_fig.canvas, 100., -100.),
+                               emitting=False)
+    yield nt.assert_equal, list(ofigs.active_voxel), [4., 20., -5.]
+    yield nt.assert_equal, ofigs.emitted[-1], (SAG, COR)
+    stray = Event(ofigs.cor_fig.canvas, None, 1.)
+    yield nt.assert_true, ofigs.coord_event_handling(stray) is None
+    yield nt.assert_equal, list(ofigs.active_voxel), [4., 20., -5.]
+
+def test_update_main_plot_data():
+    ofigs = _ortho_figures()
+    ofigs.paint_frame()
+    planes = [np.ones((40,40)), np.ones((40,20))]
+    ofigs.update_main_plot_data(planes, fig_labels=[SAG, AXI])
+    yield nt.assert_true, (ofigs.main_plots[SAG].data == 1).all()
+    yield nt.assert_true, (ofigs.main_plots[AXI].data == 1).all()
+    yield nt.assert_false, (ofigs.main_plots[COR].data == 1).any()
+    # only the updated figures have images to paint
+    yield nt.assert_true, ofigs.sag_fig._invalid_images
+    yield nt.assert_false, ofigs.cor_fig._invalid
+    ofigs.paint_frame()
+    yield nt.assert_false, ofigs.sag_fig._invalid
+    yield nt.assert_false, ofigs.axi_fig._invalid
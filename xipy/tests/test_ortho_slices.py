@@ -0,0 +1,40 @@
+import nose.tools as nt
+
+# the code to test
+from xipy.vis.qt4_widgets.ortho_slices import MplQT4OrthoSlicesWidget
+
+class FakeTimer(object):
+    def __init__(self, active):
+        self.active = active
+    def isActive(self):
+        return self.active
+
+class FakeOrthoWidget(object):
+    """Just enough of the widget to handle its motion events"""
+    def __init__(self, painting):
+        self._mouse_dragging = True
+        self._paint_timer = FakeTimer(painting)
+        self._pending_event = None
+        self.handled = []
+    def coord_event_handling(self, event, emitting=True):
+        self.handled.append(event)
+
+_xhair_motion = MplQT4OrthoSlicesWidget.xhair_motion.im_func
+
+def test_motion_while_painting():
+    widget = FakeOrthoWidget(painting=True)
+    for event in ('first', 'second', 'third'):
+        _xhair_motion(widget, event)
+    # the events are dropped, except for the latest
+    yield nt.assert_equal, widget.handled, []
+    yield nt.assert_equal, widget._pending_event, 'third'
+
+def test_motion_while_idle():
+    widget = FakeOrthoWidget(painting=False)
+    _xhair_motion(widget, 'first')
+    yield nt.assert_equal, widget.handled, ['first']
+    yield nt.assert_true, widget._pending_event is None
+    # motion without dragging is ignored
+    widget._mouse_dragging = False
+    _xhair_motion(widget, 'second')
+    yield nt.assert_equal, widget.handled, ['first']
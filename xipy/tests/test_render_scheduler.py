@@ -0,0 +1,77 @@
+import nose.tools as nt
+
+# the code to test
+from xipy.vis.mayavi_widgets.render_scheduler import RenderScheduler
+
+class FakeScene(object):
+    """Counts renders, and records the render state during updates"""
+    def __init__(self):
+        self.disable_render = False
+        self.renders = 0
+    def render(self):
+        self.renders += 1
+
+class FrameScheduler(RenderScheduler):
+    """A scheduler whose frames end when flush() is called"""
+    def _schedule_flush(self):
+        pass
+
+class Update(object):
+    def __init__(self, scene, log, name):
+        self.scene = scene
+        self.log = log
+        self.name = name
+    def __call__(self):
+        self.log.append( (self.name, self.scene.disable_render) )
+
+def test_coalesced_updates():
+    scene = FakeScene()
+    sched = FrameScheduler(scene, interval=30)
+    log = []
+    a = Update(scene, log, 'a')
+    b = Update(scene, log, 'b')
+    sched.request_update(a)
+    sched.request_update(b)
+    sched.request_update(a)
+    sched.request_render()
+    yield nt.assert_equal, log, []
+    sched.flush()
+    # each update is run once, in the order first requested, with
+    # rendering disabled, and then the scene is rendered once
+    yield nt.assert_equal, log, [('a', True), ('b', True)]
+    yield nt.assert_false, scene.disable_render
+    yield nt.assert_equal, scene.renders, 1
+    yield nt.assert_equal, sched.updates, 2
+    yield nt.assert_equal, sched.updates_saved, 1
+    yield nt.assert_equal, sched.renders, 1
+    yield nt.assert_equal, sched.renders_saved, 3
+    # an empty frame does no work
+    sched.flush()
+    yield nt.assert_equal, scene.renders, 1
+    yield nt.assert_equal, len(log), 2
+
+def test_update_without_render():
+    scene = FakeScene()
+    sched = FrameScheduler(scene, interval=30)
+    log = []
+    sched.request_update(Update(scene, log, 'a'), render=False)
+    sched.flush()
+    yield nt.assert_equal, len(log), 1
+    yield nt.assert_equal, scene.renders, 0
+    yield nt.assert_equal, sched.render_requests, 0
+
+def test_immediate_flush():
+    scene = FakeScene()
+    sched = RenderScheduler(scene, interval=None)
+    log = []
+    a = Update(scene, log, 'a')
+    sched.request_update(a)
+    sched.request_update(a)
+    # with no frame interval, nothing is batched
+    yield nt.assert_equal, log, [('a', True), ('a', True)]
+    yield nt.assert_equal, scene.renders, 2
+    yield nt.assert_equal, sched.updates_saved, 0
+    yield nt.assert_equal, sched.renders_saved, 0
+    sched.reset_counters()
+    yield nt.assert_equal, sched.update_requests, 0
+    yield nt.assert_equal, sched.renders, 0
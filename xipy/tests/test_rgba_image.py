@@ -0,0 +1,55 @@
+import numpy as np
+import numpy.testing as npt
+import nose.tools as nt
+
+from xipy.vis.rgba_image import nearest_pixel_tables, scale_rgba_plane, \
+     apply_alpha, is_rgba_bytes
+
+def test_pixel_tables_origin():
+    # one pixel per plane element
+    extent = (0, 6, 0, 4)
+    rows, cols = nearest_pixel_tables((4,6), extent, extent, 6, 4)
+    yield npt.assert_array_equal, cols, np.arange(6)
+    # pixel rows count from the top of the axes
+    yield npt.assert_array_equal, rows, np.arange(4)[::-1]
+    rows, cols = nearest_pixel_tables((4,6), extent, extent, 6, 4,
+                                      origin='upper')
+    yield npt.assert_array_equal, rows, np.arange(4)
+    # two pixels per plane element
+    rows, cols = nearest_pixel_tables((4,6), extent, extent, 12, 8)
+    yield npt.assert_array_equal, cols, np.arange(6).repeat(2)
+    yield npt.assert_array_equal, rows, np.arange(4)[::-1].repeat(2)
+
+def test_pixel_tables_outside():
+    # a view which runs 3 units past the plane on the left and right,
+    # and 2 units past it on the top
+    rows, cols = nearest_pixel_tables((4,6), (0, 6, 0, 4), (-3, 9, 0, 6),
+                                      12, 6)
+    yield npt.assert_array_equal, cols[:3], [-1]*3
+    yield npt.assert_array_equal, cols[3:9], np.arange(6)
+    yield npt.assert_array_equal, cols[9:], [-1]*3
+    yield npt.assert_array_equal, rows[:2], [-1]*2
+    yield npt.assert_array_equal, rows[2:], np.arange(4)[::-1]
+
+def test_scale_rgba_plane():
+    plane = np.random.randint(0, 256, size=(4,6,4)).astype('B')
+    yield nt.assert_true, is_rgba_bytes(plane)
+    rows, cols = nearest_pixel_tables((4,6), (0, 6, 0, 4), (-3, 9, 0, 6),
+                                      12, 6)
+    pixels = scale_rgba_plane(plane, rows, cols)
+    yield nt.assert_equal, pixels.shape, (6, 12, 4)
+    # pixels outside of the plane are transparent
+    yield nt.assert_true, (pixels[:2] == 0).all()
+    yield nt.assert_true, (pixels[:,:3] == 0).all()
+    yield nt.assert_true, (pixels[:,9:] == 0).all()
+    # and the rest is the plane, flipped to count rows from the top
+    yield npt.assert_array_equal, pixels[2:,3:9], plane[::-1]
+    # the plane itself is untouched
+    yield nt.assert_false, (plane == 0).all()
+
+def test_apply_alpha():
+    pixels = np.empty((2,3,4), 'B')
+    pixels[:] = (10, 20, 30, 200)
+    apply_alpha(pixels, 0.5)
+    yield nt.assert_true, (pixels[...,3] == 100).all()
+    yield nt.assert_true, (pixels[...,:3] == (10, 20, 30)).all()
@@ -0,0 +1,174 @@
+import numpy as np
+import nose.tools as nt
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# the code to test
+from xipy.vis.single_slice_plot import SliceFigure
+
+class CallCounter(object):
+    """Wrap a method, to count its calls"""
+    def __init__(self, obj, name):
+        self.calls = 0
+        self.args = []
+        self._func = getattr(obj, name)
+        setattr(obj, name, self)
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        self.args.append(args)
+        return self._func(*args, **kwargs)
+
+def _slice_figure(color=(0, 255, 0, 255)):
+    fig = Figure(figsize=(3,3), dpi=50)
+    FigureCanvasAgg(fig)
+    sf = SliceFigure(fig, [0, 10, 0, 10], blit=True)
+    plane = np.empty((10,10,4), 'B')
+    plane[:] = color
+    s_img = sf.spawn_image(plane, interpolation='nearest')
+    return sf, s_img, plane
+
+def _canvas_pixel(canvas, x, y, ax):
+    # the RGB pixel at data point (x,y)
+    w, h = canvas.get_width_height()
+    buf = np.fromstring(canvas.tostring_rgb(), 'B').reshape(h, w, 3)
+    px, py = ax.transData.transform((x, y))
+    return buf[h - 1 - int(py), int(px)]
+
+def test_on_draw():
+    sf, s_img, plane = _slice_figure()
+    # the crosshairs are off in a corner
+    sf.move_crosshairs(1, 1)
+    sf.canvas.draw()
+    # the full draw saved the bare axes as the background
+    yield nt.assert_true, sf.bkgrnd is not None
+    yield nt.assert_true, sf.img_bkgrnd is not None
+    # and drew the animated image back in
+    yield nt.assert_true, s_img.img.get_animated()
+    yield (nt.assert_equal,
+           tuple(_canvas_pixel(sf.canvas, 5, 5, sf.ax)), (0, 255, 0))
+
+def test_draw_without_blitting():
+    fig = Figure(figsize=(3,3), dpi=50)
+    FigureCanvasAgg(fig)
+    sf = SliceFigure(fig, [0, 10, 0, 10], blit=False)
+    plane = np.empty((10,10,4), 'B')
+    plane[:] = (0, 255, 0, 255)
+    s_img = sf.spawn_image(plane, interpolation='nearest')
+    sf.canvas.draw()
+    # nothing is saved for blitting, and the image is drawn normally
+    yield nt.assert_true, sf.bkgrnd is None
+    yield nt.assert_true, sf.img_bkgrnd is None
+    yield nt.assert_false, s_img.img.get_animated()
+    yield (nt.assert_equal,
+           tuple(_canvas_pixel(sf.canvas, 5, 5, sf.ax)), (0, 255, 0))
+
+def test_spawn_fast_rgba():
+    import xipy.vis.rgba_image as rgba_image
+    fig = Figure(figsize=(3,3), dpi=50)
+    FigureCanvasAgg(fig)
+    sf = SliceFigure(fig, [0, 10, 0, 10], blit=True)
+    plane = np.empty((10,10,4), 'B')
+    plane[:] = (0, 255, 0, 255)
+    # no interpolation is given
+    s_img = sf.spawn_image(plane, fast_rgba=True)
+    yield nt.assert_true, isinstance(s_img.img, rgba_image.RGBAImage)
+    yield nt.assert_equal, s_img.img.get_interpolation(), 'nearest'
+    if rgba_image._frombyte is None:
+        return
+    scales = CallCounter(rgba_image, 'scale_rgba_plane')
+    try:
+        sf.canvas.draw()
+    finally:
+        rgba_image.scale_rgba_plane = scales._func
+    # the plane was drawn directly
+    yield nt.assert_true, scales.calls > 0
+    yield (nt.assert_equal,
+           tuple(_canvas_pixel(sf.canvas, 5, 5, sf.ax)), (0, 255, 0))
+
+def test_update_images_blits():
+    sf, s_img, plane = _slice_figure()
+    sf.canvas.draw()
+    draws = CallCounter(sf.canvas, 'draw')
+    blits = CallCounter(sf.canvas, 'blit')
+    new_plane = plane.copy()
+    new_plane[:] = (0, 0, 255, 255)
+    s_img.set_data(new_plane)
+    yield nt.assert_equal, draws.calls, 0
+    yield nt.assert_equal, blits.calls, 1
+    yield (nt.assert_equal,
+           tuple(_canvas_pixel(sf.canvas, 5, 5, sf.ax)), (0, 0, 255))
+
+def test_update_images_after_resize():
+    sf, s_img, plane = _slice_figure()
+    sf.canvas.draw()
+    sf.fig.set_size_inches(4, 4)
+    yield nt.assert_false, sf._can_blit()
+    draws = CallCounter(sf.canvas, 'draw')
+    idle_draws = CallCounter(sf.canvas, 'draw_idle')
+    blits = CallCounter(sf.canvas, 'blit')
+    sf.update_images()
+    # a blit into the old background would be the wrong size
+    yield nt.assert_equal, blits.calls, 0
+    yield nt.assert_true, draws.calls + idle_draws.calls > 0
+    sf.canvas.draw()
+    yield nt.assert_true, sf._can_blit()
+
+def test_crosshairs_reuse_images():
+    sf, s_img, plane = _slice_figure()
+    sf.canvas.draw()
+    img_blits = CallCounter(sf, '_blit_images')
+    restores = CallCounter(sf.canvas, 'restore_region')
+    sf.move_crosshairs(3, 4)
+    # only the crosshairs were drawn, over the saved images
+    yield nt.assert_equal, img_blits.calls, 0
+    yield nt.assert_equal, restores.calls, 1
+    yield nt.assert_true, restores.args[0][0] is sf.img_bkgrnd
+    # without the saved images, they are drawn again
+    sf.img_bkgrnd = None
+    sf.move_crosshairs(5, 6)
+    yield nt.assert_equal, img_blits.calls, 1
+
+def test_savefig():
+    import StringIO
+    sf, s_img, plane = _slice_figure()
+    sf.savefig(StringIO.StringIO(), format='png')
+    # the artists are still animated
+    yield nt.assert_true, s_img.img.get_animated()
+    yield nt.assert_true, sf.crosshairs[0].get_animated()
+    yield nt.assert_true, sf._can_blit()
+
+def test_redraw_invalid():
+    sf, s_img, plane = _slice_figure()
+    sf.canvas.draw()
+    xhairs = CallCounter(sf, '_draw_crosshairs')
+    images = CallCounter(sf, 'update_images')
+    # nothing to redraw yet
+    yield nt.assert_false, sf.redraw_invalid()
+    sf.move_crosshairs(3, 4, redraw=False)
+    sf.move_crosshairs(5, 6, redraw=False)
+    yield nt.assert_equal, xhairs.calls, 0
+    # the two moves are redrawn once
+    yield nt.assert_true, sf.redraw_invalid()
+    yield nt.assert_equal, xhairs.calls, 1
+    yield nt.assert_false, sf.redraw_invalid()
+    yield nt.assert_equal, xhairs.calls, 1
+    yield nt.assert_equal, images.calls, 0
+
+def test_redraw_invalid_images():
+    sf, s_img, plane = _slice_figure()
+    sf.canvas.draw()
+    xhairs = CallCounter(sf, '_draw_crosshairs')
+    images = CallCounter(sf, 'update_images')
+    new_plane = plane.copy()
+    new_plane[:] = (0, 0, 255, 255)
+    s_img.set_data(new_plane, redraw=False)
+    # a later crosshair move does not lose the image update
+    sf.move_crosshairs(3, 4, redraw=False)
+    yield nt.assert_true, sf.redraw_invalid()
+    yield nt.assert_equal, images.calls, 1
+    yield nt.assert_equal, xhairs.calls, 0
+    yield (nt.assert_equal,
+           tuple(_canvas_pixel(sf.canvas, 5, 5, sf.ax)), (0, 0, 255))
+    yield nt.assert_false, sf.redraw_invalid()
+    yield nt.assert_equal, images.calls, 1
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+import nose.tools as nt
+
+import nipy.core.api as ni_api
+from nipy.io.api import save_image
+
+from xipy.slicing import xipy_ras
+
+# the code to test
+from xipy.vis.snapshots import threshold_overlay, find_peak, \
+     write_peak_table, peak_table_columns, OverlaySnapshots, \
+     snapshot_overlays
+
+_affine = np.array([[2., 0, 0, -10],
+                    [0, 2., 0, 0],
+                    [0, 0, 2., 5],
+                    [0, 0, 0, 1]])
+
+def gen_img(arr=None, shape=(10,20,12)):
+    if arr is None:
+        arr = np.random.randn(*shape)
+    return ni_api.Image(arr,
+                        ni_api.AffineTransform.from_params(
+                            'ijk', xipy_ras, _affine
+                            )
+                        )
+
+def _peak_arr():
+    arr = np.zeros((10,20,12))
+    arr[3,4,5] = -7
+    arr[1,1,1] = 5
+    return arr
+
+def test_threshold_overlay():
+    arr = np.random.randn(10,20,12)
+    arr[0,0,0] = np.nan
+    img = gen_img(arr)
+    # only the invalid values are masked without a threshold
+    m = np.ma.getmaskarray(threshold_overlay(img))
+    yield nt.assert_equal, m.sum(), 1
+    yield nt.assert_true, m[0,0,0]
+    lower = threshold_overlay(img, tval=0.5, comp='less than')
+    yield (npt.assert_array_equal,
+           np.ma.getmaskarray(lower), ~(arr >= 0.5))
+    higher = threshold_overlay(img, tval=0.5, comp='greater than')
+    yield (npt.assert_array_equal,
+           np.ma.getmaskarray(higher), ~(arr <= 0.5))
+
+def test_find_peak():
+    img = gen_img(_peak_arr())
+    work_arr = threshold_overlay(img)
+    center = np.dot(_affine, [3.5, 4.5, 5.5, 1])[:3]
+    vox, loc, value = find_peak(work_arr, img.coordmap)
+    yield npt.assert_array_equal, vox, [3, 4, 5]
+    yield npt.assert_array_almost_equal, loc, center
+    yield nt.assert_equal, value, -7
+    vox, loc, value = find_peak(work_arr, img.coordmap, ana_xform='max')
+    yield npt.assert_array_equal, vox, [1, 1, 1]
+    yield nt.assert_equal, value, 5
+    vox, loc, value = find_peak(work_arr, img.coordmap, ana_xform='min')
+    yield npt.assert_array_equal, vox, [3, 4, 5]
+    # nothing unmasked
+    work_arr = threshold_overlay(img, tval=10)
+    yield nt.assert_equal, find_peak(work_arr, img.coordmap), \
+          (None, None, None)
+
+def test_write_peak_table():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'peaks.txt')
+        rows = [dict(overlay='a.nii', x=1.0, i=3, value=np.float32(2.5)),
+                dict(overlay='b.nii', error='IOError: no file')]
+        write_peak_table(fname, rows)
+        lines = open(fname).read().splitlines()
+    finally:
+        shutil.rmtree(tmpdir)
+    yield nt.assert_equal, len(lines), 3
+    yield nt.assert_equal, lines[0].split('\t'), list(peak_table_columns)
+    row = dict(zip(peak_table_columns, lines[1].split('\t')))
+    yield nt.assert_equal, row['overlay'], 'a.nii'
+    yield nt.assert_equal, row['x'], '1.0000'
+    yield nt.assert_equal, row['i'], '3'
+    yield nt.assert_equal, row['value'], '2.5000'
+    # missing columns are left empty
+    yield nt.assert_equal, row['y'], ''
+    row = dict(zip(peak_table_columns, lines[2].split('\t')))
+    yield nt.assert_equal, row['error'], 'IOError: no file'
+
+def test_snapshot():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        over_file = os.path.join(tmpdir, 'over.nii')
+        save_image(gen_img(_peak_arr()), over_file)
+        snaps = OverlaySnapshots(gen_img(), outdir=tmpdir, tval=1.0,
+                                 comp='less than', dpi=20)
+        row = snaps.snapshot(over_file)
+        png_written = os.path.exists(os.path.join(tmpdir, 'over.png'))
+        # the overlay is taken down after each snapshot
+        over = snaps.blender.over
+        # a missing overlay is reported in its row
+        rows = snapshot_overlays(gen_img(),
+                                 [over_file,
+                                  os.path.join(tmpdir, 'missing.nii')],
+                                 outdir=tmpdir, processes=1, dpi=20)
+    finally:
+        shutil.rmtree(tmpdir)
+    yield nt.assert_true, png_written
+    yield nt.assert_true, over is None
+    yield nt.assert_equal, row['snapshot'], os.path.join(tmpdir, 'over.png')
+    yield nt.assert_equal, row['unmasked'], 1
+    yield nt.assert_equal, row['value'], 5
+    yield nt.assert_equal, (row['i'], row['j'], row['k']), (1, 1, 1)
+    yield (npt.assert_array_almost_equal,
+           (row['x'], row['y'], row['z']),
+           np.dot(_affine, [1.5, 1.5, 1.5, 1])[:3])
+    yield nt.assert_equal, row['error'], ''
+    yield nt.assert_equal, len(rows), 2
+    yield nt.assert_equal, rows[0]['error'], ''
+    yield nt.assert_true, rows[1]['error'] != ''
@@ -1,4 +1,5 @@
 import numpy as np
+import numpy.testing as npt
 import nose.tools as nt
 
 from xipy.external import decotest
@@ -43,3 +44,142 @@ def test_spatial_axes_lookup():
            axes,
            [mapping[k] for k in ('SAG', 'COR', 'AXI')])
            
+
+def test_signal_array_to_masked_vol():
+    grid = (6,7,8)
+    flat_idx = np.random.permutation(np.prod(grid))[:30]
+    vox_indices = np.array(np.unravel_index(flat_idx, grid)).T
+    sig = np.random.randn(30, 4)
+    vol = signal_array_to_masked_vol(sig, vox_indices, grid_shape=grid)
+    yield nt.assert_equal, vol.shape, grid + (4,)
+    yield nt.assert_equal, vol.count(), sig.size
+    yield nt.assert_true, (vol.reshape(-1,4)[flat_idx] == sig).all()
+    # fill the same buffer with a new frame, masking the first voxel
+    prior_mask = np.zeros(30, np.bool)
+    prior_mask[0] = True
+    vol2 = signal_array_to_masked_vol(2*sig, vox_indices, out=vol,
+                                      prior_mask=prior_mask)
+    yield nt.assert_true, vol2 is vol
+    yield nt.assert_equal, vol.count(), sig.size - 4
+    yield nt.assert_true, (vol.reshape(-1,4)[flat_idx[1:]] == 2*sig[1:]).all()
+    vol32 = signal_array_to_masked_vol(sig, vox_indices, grid_shape=grid,
+                                       dtype=np.float32)
+    yield nt.assert_equal, vol32.dtype, np.dtype(np.float32)
+    # masked array keywords, including copy, are passed through
+    vol_c = signal_array_to_masked_vol(sig, vox_indices, grid_shape=grid,
+                                       copy=True, fill_value=-1)
+    yield nt.assert_equal, vol_c.count(), sig.size
+    yield nt.assert_true, (vol_c.reshape(-1,4)[flat_idx] == sig).all()
+    yield nt.assert_equal, vol_c.fill_value, -1
+
+def test_working_dtype():
+    yield nt.assert_equal, working_dtype('h', order=0), np.dtype('h')
+    yield nt.assert_equal, working_dtype('h'), np.dtype(np.float32)
+    yield nt.assert_equal, working_dtype('d', order=1), np.dtype(np.float32)
+    set_working_precision(np.float64)
+    try:
+        yield nt.assert_equal, working_dtype('h'), np.dtype(np.float64)
+    finally:
+        set_working_precision(np.float32)
+    yield nt.assert_raises, ValueError, set_working_precision, 'i'
+
+def test_resample_precision():
+    arr = np.random.randint(0, 1000, size=(10,12,8)).astype('h')
+    r = np.eye(4)
+    r[:3,:3] = np.array([[0.8, -0.6, 0], [0.6, 0.8, 0], [0, 0, 1]])
+    img = ni_api.Image(arr, ni_api.AffineTransform.from_params(
+        'ijk', xipy_ras, r
+        ))
+    resamp = resample_to_world_grid(img, order=3)
+    yield nt.assert_equal, np.asarray(resamp).dtype, np.dtype(np.float32)
+    resamp = resample_to_world_grid(img, order=0)
+    yield nt.assert_equal, np.asarray(resamp).dtype, np.dtype('h')
+
+def test_resample_binary_mask():
+    mask = np.zeros((10,12,8), np.bool)
+    mask[2:6,3:9,1:5] = True
+    r = np.eye(4)
+    r[:3,:3] = np.array([[0.8, -0.6, 0], [0.6, 0.8, 0], [0, 0, 1]])
+    cmap = ni_api.AffineTransform.from_params('ijk', xipy_ras, r)
+    m_resamp = resample_binary_mask(ni_api.Image(mask, cmap), cval=False)
+    yield nt.assert_equal, m_resamp.dtype, np.dtype(np.bool)
+    # nearest neighbor resampling of the data values gives the same grid
+    img = ni_api.Image(mask.astype('h'), cmap)
+    resamp = np.asarray(resample_to_world_grid(img, order=0, cval=0))
+    yield nt.assert_true, ((resamp > 0) == m_resamp).all()
+
+def test_packed_mask():
+    m1 = np.random.rand(7,9,13) > 0.5
+    m2 = np.random.rand(7,9,13) > 0.3
+    p1 = PackedMask(m1); p2 = PackedMask(m2)
+    yield nt.assert_true, (p1.unpack() == m1).all()
+    yield nt.assert_equal, p1.count(), m1.sum()
+    yield nt.assert_true, ((p1 & p2).unpack() == (m1 & m2)).all()
+    yield nt.assert_true, ((p1 | p2).unpack() == (m1 | m2)).all()
+    yield nt.assert_equal, (~p1).count(), (~m1).sum()
+    yield nt.assert_true, (p1.plane(1, 4) == m1[:,4,:]).all()
+    yield nt.assert_true, (p1.plane(2, 11) == m1[:,:,11]).all()
+    idx = np.random.permutation(m1.size)[:100]
+    vals = np.random.rand(100) > 0.5
+    yield nt.assert_true, (p1.take(idx) == m1.flat[idx]).all()
+    p1.put(idx, vals)
+    m1.flat[idx] = vals
+    yield nt.assert_true, (p1.unpack() == m1).all()
+
+def test_grid_map():
+    src = np.random.randint(0, 256, size=(6,7,8)).astype(np.int32)
+    src_aff = np.diag([2., 2., 3., 1.])
+    src_aff[:3,3] = -5, 0, 4
+    dst_aff = np.diag([1., 1.5, 1., 1.])
+    dst_aff[:3,3] = -8, 1, 2
+    dst_shape = (16,12,20)
+    gmap = grid_map(src_aff, src.shape, dst_aff, dst_shape)
+    resamp = gmap.take(src, cval=-1)
+    # compare with a direct lookup of each voxel
+    vox_to_vox = np.dot(np.linalg.inv(src_aff), dst_aff)
+    ref = np.empty(dst_shape, np.int32)
+    for ijk in np.ndindex(*dst_shape):
+        sijk = (np.dot(vox_to_vox[:3,:3], ijk) + vox_to_vox[:3,3]).astype('i')
+        if ((sijk >= 0) & (sijk < src.shape)).all():
+            ref[ijk] = src[tuple(sijk)]
+        else:
+            ref[ijk] = -1
+    yield nt.assert_true, (resamp == ref).all()
+    # the same geometry reuses the same map
+    gmap2 = grid_map(src_aff.copy(), src.shape, dst_aff.copy(), dst_shape)
+    yield nt.assert_true, gmap2 is gmap
+    clear_grid_maps()
+    gmap3 = grid_map(src_aff, src.shape, dst_aff, dst_shape)
+    yield nt.assert_false, gmap3 is gmap
+
+def test_grid_map_put():
+    src = np.random.randint(0, 256, size=(6,7,8)).astype(np.int32)
+    src_aff = np.diag([2., 2., 3., 1.])
+    src_aff[:3,3] = -5, 0, 4
+    dst_aff = np.diag([1., 1.5, 1., 1.])
+    dst_aff[:3,3] = -8, 1, 2
+    gmap = grid_map(src_aff, src.shape, dst_aff, (16,12,20))
+    resamp = gmap.take(src, cval=-1)
+    # change a few source voxels, and patch them into the resampled array
+    idx = np.random.permutation(src.size)[:20]
+    vals = np.random.randint(300, 400, size=20)
+    src.flat[idx] = vals
+    region = gmap.put(resamp, idx, vals)
+    ref = gmap.take(src, cval=-1)
+    yield npt.assert_array_equal, resamp, ref
+    # and the region covers the changes
+    changed = np.zeros(ref.shape, np.bool)
+    changed[region] = True
+    yield nt.assert_true, (resamp[~changed] == ref[~changed]).all()
+    yield nt.assert_true, gmap.put(resamp, [], []) is None
+
+def test_threshold_mask():
+    vals = np.random.randn(10,10,10)
+    limits = (-0.5, 0.5)
+    for mode in ('mask lower', 'mask higher', 'mask between', 'mask outside'):
+        neg = threshold_mask(vals, mode, limits)
+        pos = threshold_mask(vals, mode, limits, type='positive')
+        yield nt.assert_true, (neg == ~pos).all()
+    yield (nt.assert_true,
+           (threshold_mask(vals, 'mask outside', limits) == \
+            ((vals < -0.5) | (vals > 0.5))).all())
@@ -0,0 +1,69 @@
+import threading
+import nose.tools as nt
+
+from xipy.workers import WorkerPool, direct_deliver, checkpoint
+
+def test_stages_and_delivery():
+    pool = WorkerPool(nthreads=2, deliver=direct_deliver)
+    results = []
+    pool.submit('a', (lambda x, y: x+y, lambda z: 2*z),
+                args=(1, 2), callback=results.append)
+    pool.wait()
+    yield nt.assert_equal, results, [6]
+    pool.shutdown()
+
+def test_superseded_jobs():
+    pool = WorkerPool(nthreads=2, deliver=direct_deliver)
+    results = []
+    started = threading.Event()
+    release = threading.Event()
+    def blocking_stage(n):
+        started.set()
+        release.wait()
+        return n
+    # the first job is running when the others are submitted
+    pool.submit('a', (blocking_stage, lambda n: n),
+                args=(0,), callback=results.append)
+    started.wait()
+    for n in xrange(1, 5):
+        pool.submit('a', (lambda n: n,), args=(n,), callback=results.append)
+    # another channel is not affected
+    pool.submit('b', (lambda n: n,), args=(10,), callback=results.append)
+    release.set()
+    pool.wait()
+    # the running job was cancelled, and only the last waiting job ran
+    yield nt.assert_equal, sorted(results), [4, 10]
+    pool.shutdown()
+
+def test_generations_and_checkpoints():
+    pool = WorkerPool(nthreads=1, deliver=direct_deliver)
+    results = []
+    started = threading.Event()
+    release = threading.Event()
+    current = [1]
+    def long_stage(n):
+        started.set()
+        release.wait()
+        # a long computation checks in periodically
+        checkpoint()
+        results.append('not abandoned')
+        return n
+    job1 = pool.submit('a', (long_stage,), args=(1,),
+                       callback=results.append,
+                       valid=lambda: current[0]==1)
+    started.wait()
+    # a newer request makes the running job invalid, even before
+    # it is submitted to the pool
+    current[0] = 2
+    release.set()
+    pool.wait()
+    yield nt.assert_equal, results, []
+    job2 = pool.submit('a', (lambda n: n,), args=(2,),
+                       callback=results.append,
+                       valid=lambda: current[0]==2)
+    pool.wait()
+    yield nt.assert_equal, results, [2]
+    yield nt.assert_equal, (job1.generation, job2.generation), (1, 2)
+    yield nt.assert_equal, pool.generation('a'), 2
+    yield nt.assert_equal, (pool.jobs_finished, pool.jobs_abandoned), (1, 1)
+    pool.shutdown()
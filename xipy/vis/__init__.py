@@ -1,5 +1,7 @@
 # affects some mpl based classes
 BLITTING=True
+# draw RGBA byte planes with the direct RGBAImage artist
+FAST_RGBA=True
 
 def quick_plot_image_slicer(isl, loc, **kwargs):
     x, y, z = isl.cut_image(loc)
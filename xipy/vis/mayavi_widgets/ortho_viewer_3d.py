@@ -24,6 +24,7 @@ from xipy.colors.rgba_blending import BlendedImages
 import xipy.volume_utils as vu
 
 from xipy.vis.mayavi_widgets import VisualComponent
+from xipy.vis.mayavi_widgets.render_scheduler import RenderScheduler
 from xipy.colors.mayavi_tools import MasterSource, disable_render
 
 def three_plane_pt(n1, n2, n3, x1, x2, x3):
@@ -75,6 +76,9 @@ class OrthoViewer3D(HasTraits):
         )
     _volume_function = Instance(tvtk.ImplicitVolume, ())
     info = Instance(Text)
+
+    # batches the pipeline updates and renders requested by components
+    render_scheduler = Instance(RenderScheduler)
     
     _axis_index = dict(x=0, y=1, z=2)
 
@@ -120,8 +124,11 @@ class OrthoViewer3D(HasTraits):
 ##         s.scalar_name = 'ipw_colors'
 ##         b_src = mlab.pipeline.add_dataset(s, figure=self.scene.mayavi_scene)
 ##         return b_src
+    def _render_scheduler_default(self):
+        return RenderScheduler(self.scene)
     def _master_src_default(self):
-        s = MasterSource(blender = self.blender)
+        s = MasterSource(blender = self.blender,
+                         render_scheduler = self.render_scheduler)
         # make sure that the image blender is sync'd up
         self.sync_trait('blender', s, mutual=False)
         return mlab.pipeline.add_dataset(s, figure=self.scene.mayavi_scene)
@@ -230,7 +237,6 @@ class OrthoViewer3D(HasTraits):
     def _snap_to_position(self, pos):
         if self._ipw_x('x') is None:
             return
-        print 'snapping to', pos
 ##         self._stop_scene()
         anames = ('x', 'y', 'z')
         pd = dict(zip( anames, pos ))
@@ -241,7 +247,6 @@ class OrthoViewer3D(HasTraits):
 ##         self._start_scene()
 
     def _register_position(self, pos):
-        print 'registering pos', pos
         if self.func_man:
             self.func_man.world_position = pos
 ##         self.master_src.update()        
@@ -11,6 +11,7 @@ from enthought.traits.ui.api import View, Item, Group
 # XIPY imports
 from xipy.vis.mayavi_widgets import VisualComponent
 from xipy.colors.rgba_blending import quick_convert_rgba_to_vtk
+import xipy.instrumentation as instr
 
 class ImageBlendingComponent(VisualComponent):
     """
@@ -46,7 +47,9 @@ class ImageBlendingComponent(VisualComponent):
         if watch_overlay:
             # only attach these listeners if the BlendedImages object
             # is not being controlled elsewhere
-            self.on_trait_change(self._alpha_scale, 'func_man.alpha_scale',
+            self.on_trait_change(self._alpha_scale,
+                                 'func_man.alpha_scale, '\
+                                 'func_man.alpha_threshold',
                                  dispatch='new')
             self.on_trait_change(self._set_over_cmap, 'func_man.cmap_option',
                                  dispatch='new')
@@ -67,7 +70,6 @@ class ImageBlendingComponent(VisualComponent):
         self.blender.over_alpha = self.func_man.alpha()
 
     def _set_over_norm(self):
-        print 'resetting scalar normalization from func_man.norm'
         self.blender.over_norm = self.func_man.norm
     
     def _set_over_cmap(self):
@@ -76,7 +78,7 @@ class ImageBlendingComponent(VisualComponent):
     def _update_colors_from_func_man(self):
         """ When a new overlay is signaled, update the overlay color bytes
         """
-        print 'saw func_man overlay_updated fire'
+        instr.count('mayavi.overlay_updates')
         if not self.func_man or not self.func_man.overlay:
             return
         # this could potentially change scalar mapping properties too
@@ -109,27 +111,22 @@ class ImageBlendingComponent(VisualComponent):
                 if over_chan not in all_rgba:
                     self.show_func = False
                     return
-            print 'will plot blended'
             color = blnd_chan
         elif self.show_func:
             if over_chan not in all_rgba:
                 self.show_func = False
                 return
-            print 'will plot over plot'
             color = over_chan
         elif self.show_anat:
             if main_chan not in all_rgba:
                 self.show_anat = False
                 return
-            print 'will plot anatomical'
             color = main_chan
         else:
-            print 'turning off plots'
             color = ''
 
-        print 'changing'
+        instr.count('mayavi.plane_color_changes')
         self.principle_plane_colors.point_scalars_name = color
-        print 'done'
 
         if not color:
             self.display.toggle_planes_visible(False)
@@ -141,6 +138,6 @@ class ImageBlendingComponent(VisualComponent):
         elif not ipwx.visible:
             self.display.toggle_planes_visible(True)
 
-        self.display.scene.render()
+        self.display.render_scheduler.request_render()
  
             
@@ -14,6 +14,7 @@ from enthought.mayavi import mlab
 from xipy.colors.mayavi_tools import ArraySourceRGBA
 from xipy.colors.rgba_blending import BlendedImages, quick_convert_rgba_to_vtk
 from xipy.vis.mayavi_widgets import VisualComponent
+import xipy.instrumentation as instr
 
 class OverlayThresholdingSurfaceComponent(VisualComponent):
     """A class to take control of thresholding the overlay, and creating
@@ -60,11 +61,13 @@ class OverlayThresholdingSurfaceComponent(VisualComponent):
         # Turn on/off threshold tracking.. be sneaky and wait until
         # the main BlendedImages over_rgba changes. At that ponit the
         # "over" attribute will be fully resampled
-        self.on_trait_change(self._update_mask_channel,
-                             'display.blender.over_rgba',
+        self.on_trait_change(self._schedule_mask_update,
+                             'display.blender.over_rgba, '\
+                             'display.blender.rgba_region_changed',
                              remove=not (self.show_tsurfs or self.show_csurfs))
-        self.on_trait_change(self._update_overlay_threshold,
-                             'display.blender.over_rgba',
+        self.on_trait_change(self._schedule_threshold_update,
+                             'display.blender.over_rgba, '\
+                             'display.blender.rgba_region_changed',
                              remove = not self.show_tsurfs)
         if self.show_tsurfs and not self.display.blender.over:
             print 'no overlay thresholding available'
@@ -81,11 +84,13 @@ class OverlayThresholdingSurfaceComponent(VisualComponent):
         # Turn on/off threshold tracking.. be sneaky and wait until
         # the main BlendedImages over_rgba changes. At that ponit the
         # "over" attribute will be fully resampled
-        self.on_trait_change(self._update_mask_channel,
-                             'display.blender.over_rgba',
+        self.on_trait_change(self._schedule_mask_update,
+                             'display.blender.over_rgba, '\
+                             'display.blender.rgba_region_changed',
                              remove=not (self.show_tsurfs or self.show_csurfs))
-        self.on_trait_change(self._update_overlay_contour,
-                             'display.blender.over_rgba',
+        self.on_trait_change(self._schedule_contour_update,
+                             'display.blender.over_rgba, '\
+                             'display.blender.rgba_region_changed',
                              remove = not self.show_csurfs)
         if self.show_csurfs and not self.display.blender.over:
             print 'no overlay thresholding available'
@@ -98,6 +103,39 @@ class OverlayThresholdingSurfaceComponent(VisualComponent):
             self.contour_surf.visible = self.show_csurfs
     
 
+    # -- Scheduled updates ---------------------------------------------------
+    # The mask channel and both surfaces are all triggered by the same
+    # blender events, so route their updates through the display's
+    # RenderScheduler to run each one once per frame (in order)
+    def _schedule_mask_update(self, name, new):
+        if self._touches_over(name, new):
+            self.display.render_scheduler.request_update(
+                self._update_mask_channel
+                )
+
+    def _schedule_threshold_update(self, name, new):
+        if self._touches_over(name, new):
+            self.display.render_scheduler.request_update(
+                self._update_overlay_threshold
+                )
+
+    def _schedule_contour_update(self, name, new):
+        if self._touches_over(name, new):
+            self.display.render_scheduler.request_update(
+                self._update_overlay_contour
+                )
+
+    def _touches_over(self, name, new):
+        # The mask channel only follows the overlay colors, so region
+        # changes in the main (or only the blended) colors are ignored
+        if name != 'rgba_region_changed':
+            return True
+        names, region = new
+        if 'over_rgba' in names:
+            return True
+        instr.count('surfaces.ignored_region_changes')
+        return False
+    
     def _update_mask_channel(self):
         bi = self.func_blender
 
@@ -0,0 +1,118 @@
+"""A render scheduler for the Mayavi scene. VisualComponents and sources
+may request pipeline updates and renders as often as their trait
+listeners fire. Requests made within one frame interval are batched,
+duplicate updates are coalesced, and a single render is issued for the
+whole batch.
+"""
+import threading
+
+# Enthought library
+import enthought.traits.api as t
+from enthought.pyface.api import GUI
+
+class RenderScheduler(t.HasTraits):
+
+    # the scene (MlabSceneModel) to render
+    scene = t.Any
+
+    # the frame interval (in ms) within which requests are batched.
+    # If None, then requests are flushed immediately
+    interval = t.Any(30)
+
+    # Counters of the requests, and the work actually done
+    render_requests = t.Int(0)
+    renders = t.Int(0)
+    renders_saved = t.Property(depends_on='render_requests, renders')
+    update_requests = t.Int(0)
+    updates = t.Int(0)
+    updates_saved = t.Property(depends_on='update_requests, updates')
+
+    def __init__(self, scene=None, **traits):
+        t.HasTraits.__init__(self, scene=scene, **traits)
+        # the pending updates, in the order they were first requested
+        self._pending = []
+        self._render_pending = False
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+
+    def _get_renders_saved(self):
+        return self.render_requests - self.renders
+
+    def _get_updates_saved(self):
+        return self.update_requests - self.updates
+
+    def request_render(self):
+        """Request a render of the scene at the end of this frame
+        """
+        self._lock.acquire()
+        try:
+            self.render_requests += 1
+            self._render_pending = True
+        finally:
+            self._lock.release()
+        self._schedule_flush()
+
+    def request_update(self, update, render=True):
+        """Request that the callable `update` is run at the end of this
+        frame (followed by a render, if `render` is True). The same
+        update requested many times within a frame is run once, in
+        the order in which it was first requested.
+        """
+        self._lock.acquire()
+        try:
+            self.update_requests += 1
+            if update not in self._pending:
+                self._pending.append(update)
+            if render:
+                self.render_requests += 1
+                self._render_pending = True
+        finally:
+            self._lock.release()
+        self._schedule_flush()
+
+    def reset_counters(self):
+        self.trait_set(render_requests=0, renders=0,
+                       update_requests=0, updates=0)
+
+    def _schedule_flush(self):
+        if self.interval is None:
+            self.flush()
+            return
+        self._lock.acquire()
+        try:
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        finally:
+            self._lock.release()
+        # invoke_after is safe to call from any thread, and the flush
+        # will always run in the GUI thread
+        GUI.invoke_after(self.interval, self.flush)
+
+    def flush(self):
+        """Run all pending updates, and render once if requested
+        """
+        self._lock.acquire()
+        try:
+            pending = self._pending
+            self._pending = []
+            render = self._render_pending
+            self._render_pending = False
+            self._flush_scheduled = False
+        finally:
+            self._lock.release()
+        scene = self.scene
+        if pending:
+            render_state = getattr(scene, 'disable_render', None)
+            if render_state is not None:
+                scene.disable_render = True
+            try:
+                for update in pending:
+                    update()
+                    self.updates += 1
+            finally:
+                if render_state is not None:
+                    scene.disable_render = render_state
+        if render and scene is not None:
+            scene.render()
+            self.renders += 1
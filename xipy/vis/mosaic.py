@@ -0,0 +1,214 @@
+"""Lightbox (mosaic) rendering of many parallel slices of a volume, into
+one RGBA byte array, without any GUI. This is meant for quality control
+montages made in batch, eg:
+
+    canvas, coords = render_mosaic(blender, 'subject01_axial.png',
+                                   axis=AXI, nslices=20, ncols=5)
+"""
+import numpy as np
+
+from xipy.slicing import SAG, COR, AXI, xipy_ras, enumerated_axes
+from xipy.slicing.image_slicers import orient_plane
+import xipy.colors.color_mapping as cm
+
+def slice_coords(slicer, axis=AXI, nslices=16):
+    """Find nslices evenly spaced coordinates along an axis, inside of
+    the slicer's bounding box (leaving out the two faces of the box)
+    """
+    lo, hi = slicer.bbox[axis]
+    return np.linspace(lo, hi, nslices+2)[1:-1]
+
+def slice_stack(slicer, axis=AXI, coords=None, nslices=16):
+    """Cut planes normal to an axis at many coordinates.
+
+    For slicers whose planes are cut straight out of an array (such as
+    ResampledVolumeSlicers and BlendedImages), all planes are taken from
+    the array in one operation along its axis -- a strided view when the
+    planes are evenly spaced in the array. (The planes of a bit-packed
+    mask are unpacked one at a time.) Any other VolumeSlicerInterface
+    is cut one plane at a time.
+
+    Parameters
+    ----------
+    slicer : a VolumeSlicerInterface
+    axis : int or str
+        the axis normal to the planes (SAG, COR, AXI, or a name)
+    coords : sequence, optional
+        the coordinates of the planes along the axis (by default, see
+        slice_coords)
+    nslices : int, optional
+        the number of planes, if coords is not given
+
+    Returns
+    -------
+    planes : ndarray
+        the (nplanes, rows, cols[, 4]) stack of planes, each in the
+        canonical orientation of cut_image
+    coords : ndarray
+        the coordinates of the planes that were inside of the volume
+    """
+    axis = enumerated_axes([axis])[0]
+    if coords is None:
+        coords = slice_coords(slicer, axis=axis, nslices=nslices)
+    coords = np.asarray(coords, 'd')
+    arr = getattr(slicer, 'image_arr', None)
+    ax_lookup = getattr(slicer, '_ax_lookup', None)
+    if arr is None or ax_lookup is None or \
+           not hasattr(slicer, 'null_planes'):
+        planes = [slicer.cut_image(loc, axes=[axis])[0]
+                  for loc in _plane_locations(slicer, axis, coords)]
+        # (keeping the masks of any masked planes)
+        return np.ma.array(planes), coords
+
+    ax_name = xipy_ras[axis]
+    arr_ax = ax_lookup[ax_name]
+    locs = _plane_locations(slicer, axis, coords)
+    # the array index of each plane, as found by _cut_plane
+    idx = slicer.coordmap.inverse()(locs)[:,arr_ax].astype('i')
+    inside = (idx >= 0) & (idx < arr.shape[arr_ax])
+    idx = idx[inside]
+    coords = coords[inside]
+    if not len(idx):
+        # (the empty stack of RGBA planes keeps its color dimension)
+        return np.empty((0,0,0) + arr.shape[3:], arr.dtype), coords
+    steps = np.diff(idx)
+    if len(idx) > 1 and (steps == steps[0]).all() and steps[0] > 0:
+        slicer_tuple = [slice(None)]*arr.ndim
+        slicer_tuple[arr_ax] = slice(idx[0], idx[-1]+1, steps[0])
+        stack = arr[tuple(slicer_tuple)]
+    else:
+        stack = np.take(arr, idx, axis=arr_ax)
+    stack = np.rollaxis(stack, arr_ax, 0)
+    packed = getattr(slicer, 'packed_mask', None)
+    if packed is not None:
+        # the mask is kept bit-packed, apart from the array
+        mask = np.array([packed.plane(arr_ax, int(i)) for i in idx])
+        stack = np.ma.masked_array(
+            stack, mask=np.ma.getmaskarray(stack) | mask
+            )
+    # orient the planes together, as orient_plane would orient each one
+    oriented = orient_plane(stack.swapaxes(0,2).swapaxes(0,1),
+                            ax_name, slicer.coordmap)
+    return np.rollaxis(oriented, 2, 0), coords
+
+def _plane_locations(slicer, axis, coords):
+    # points on the planes, at the center of the slicer's box
+    center = np.array(slicer.bbox, 'd').mean(axis=1)
+    locs = np.tile(center, (len(coords), 1))
+    locs[:,axis] = coords
+    return locs
+
+def to_rgba_bytes(planes, cmap=None, norm=None):
+    """Color map a stack of scalar planes to RGBA bytes (planes that are
+    already RGBA bytes are returned as they are)
+
+    Parameters
+    ----------
+    planes : ndarray
+        the (nplanes, rows, cols) scalar planes
+    cmap : a matplotlib Colormap, optional
+        by default, gray
+    norm : (black-pt, white-pt) pair, optional
+        by default, the limits of the planes
+    """
+    if planes.dtype.char == 'B' and planes.shape[-1] == 4:
+        return planes
+    if cmap is None:
+        cmap = cm.gray
+    planes = np.ma.masked_invalid(planes)
+    if norm is None:
+        norm = (planes.min(), planes.max())
+    lo, hi = map(float, norm)
+    scaled = (planes - lo) / (hi - lo) if hi > lo else planes*0.0
+    return cmap(scaled, bytes=True)
+
+def tile_planes(planes, ncols=None, pad=2, bg=(0,0,0,255), flip=True):
+    """Composite a stack of RGBA byte planes into one mosaic canvas.
+
+    Parameters
+    ----------
+    planes : ndarray
+        the (nplanes, rows, cols, 4) stack
+    ncols : int, optional
+        the number of tiles in each row of the mosaic (by default, about
+        the square root of the number of planes)
+    pad : int, optional
+        the number of background pixels between tiles
+    bg : RGBA bytes, optional
+        the background color
+    flip : bool, optional
+        put the first row of each plane at the bottom of its tile (as the
+        ortho plots do, with origin='lower')
+
+    Returns
+    -------
+    an (height, width, 4) RGBA byte array
+    """
+    nplanes, rows, cols = planes.shape[:3]
+    if ncols is None:
+        ncols = int(np.ceil(np.sqrt(nplanes)))
+    ncols = max(1, min(ncols, nplanes))
+    nrows = int(np.ceil(nplanes / float(ncols)))
+    height = nrows*rows + (nrows+1)*pad
+    width = ncols*cols + (ncols+1)*pad
+    canvas = np.empty((height, width, 4), 'B')
+    canvas[:] = bg
+    if flip:
+        planes = planes[:,::-1]
+    # place the tiles a row of tiles at a time, in one assignment per row
+    for r in xrange(nrows):
+        tiles = planes[r*ncols:(r+1)*ncols]
+        y0 = pad + r*(rows + pad)
+        block = canvas[y0:y0+rows, pad:pad+len(tiles)*(cols+pad)]
+        block.shape = (rows, len(tiles), cols+pad, 4)
+        block[:,:,:cols] = tiles.transpose(1,0,2,3)
+    return canvas
+
+def write_png(fname, canvas, dpi=100):
+    """Write an RGBA byte canvas to a PNG file, with the Agg backend
+    (pixel for pixel)
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    height, width = canvas.shape[:2]
+    fig = Figure(figsize=(width/float(dpi), height/float(dpi)), dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.figimage(canvas, xo=0, yo=0, origin='upper')
+    fig.savefig(fname, dpi=dpi)
+
+def render_mosaic(slicer, fname=None, axis=AXI, coords=None, nslices=16,
+                  ncols=None, cmap=None, norm=None, **tile_kws):
+    """Slice a volume along an axis, and tile the planes into a mosaic.
+
+    Parameters
+    ----------
+    slicer : a VolumeSlicerInterface (eg, BlendedImages)
+    fname : str, optional
+        if given, the mosaic is written to this PNG file
+    axis, coords, nslices :
+        see slice_stack
+    ncols : int, optional
+        the number of tiles in each row of the mosaic
+    cmap, norm : optional
+        the color mapping of scalar planes (see to_rgba_bytes)
+    tile_kws : dict
+        other arguments of tile_planes
+
+    Returns
+    -------
+    the mosaic RGBA byte array, and the coordinates of its planes
+
+    Raises
+    ------
+    ValueError, if none of the planes are inside of the volume
+    """
+    planes, coords = slice_stack(slicer, axis=axis, coords=coords,
+                                 nslices=nslices)
+    if not len(coords):
+        raise ValueError('none of the planes along axis %s are inside '\
+                         'of the volume'%xipy_ras[enumerated_axes([axis])[0]])
+    planes = to_rgba_bytes(np.asanyarray(planes), cmap=cmap, norm=norm)
+    canvas = tile_planes(planes, ncols=ncols, **tile_kws)
+    if fname:
+        write_png(fname, canvas)
+    return canvas, coords
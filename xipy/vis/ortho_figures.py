@@ -0,0 +1,252 @@
+"""The display logic of three SliceFigures cutting into the orthogonal
+planes of a volume, with no dependence on a GUI toolkit.
+"""
+import numpy as np
+
+from xipy.volume_utils import limits_to_extents
+from xipy.utils import with_attribute
+from xipy.slicing import SAG, COR, AXI, transverse_plane_lookup
+from xipy.vis import BLITTING
+import xipy.vis.single_slice_plot as ssp
+import xipy.instrumentation as instr
+
+class OrthoFigures(object):
+    """Three SliceFigures which cut into the standard orthogonal planes of
+    a volumetric medical image. The voxel of intersection is shared by
+    the crosshairs of each SliceFigure, and main images and overlay images
+    are plotted into all three figures.
+
+    Crosshair and image updates are not painted at once. They are painted
+    together by paint_frame(), which a subclass arranges to call from
+    _schedule_paint(). A subclass may also announce changes of the
+    intersecting voxel in emit_states().
+    """
+
+    # this will allow a "read-only" ortho_figs.active_voxel inquiry
+    active_voxel = property(lambda x: x._xyz_position, None)
+    # this is to keep track of zooming to the full FOV
+    _full_fov_lims = [(-1,1), (-1,1), (-1,1)]
+
+    def _init_figures(self, figures, blit=BLITTING):
+        """Set up a SliceFigure on each of the sagittal, coronal and axial
+        matplotlib Figures (which must already have canvases).
+        """
+        extents = limits_to_extents(self._full_fov_lims)
+        self.sag_fig, self.cor_fig, self.axi_fig = \
+            [ssp.SliceFigure(fig, extents[ax], blit=blit)
+             for fig, ax in zip(figures, (SAG, COR, AXI))]
+        # put down figures in x, y, z order
+        self.figs = [self.sag_fig, self.cor_fig, self.axi_fig]
+        self.canvas_lookup = dict( ((f.canvas, f) for f in self.figs) )
+        self._xyz_position = [0,0,0]
+        self.main_plots = []
+        self.over_plots = []
+
+    def update_plot_data(self, data_list, fig_labels=[]):
+        """Update the data in each plot in each figure.
+        Parameters
+        ----------
+        data_list : list
+            a nested list of ndarrays, one for each fig indicated in fig_labels
+            (or length-3, if fig_labels is empty). Each nested list will contain
+            as many arrays as the corresponding figure has images.
+        fig_labels : list
+            the labels (SAG, COR, and/or AXI) of the figures to update
+        """
+        if fig_labels:
+            figs = [self.figs[idx] for idx in fig_labels]
+        else:
+            figs = self.figs
+        for fig, data in zip(figs, data_list):
+            fig.set_data(data)
+
+    @with_attribute('main_plots')
+    def update_main_plot_data(self, data_list, fig_labels=[]):
+        """Update the data in each main plot.
+        Parameters
+        ----------
+        data_list : list
+            a list of ndarrays, one for each fig indicated in fig_labels
+            (or length-3, if fig_labels is empty)
+        fig_labels : list
+            the labels (SAG, COR, and/or AXI) of the figures to update
+        """
+        if fig_labels:
+            imgs = [self.main_plots[idx] for idx in fig_labels]
+        else:
+            imgs = self.main_plots
+        t0 = instr.start()
+        for img, data in zip(imgs, data_list):
+            img.set_data(data, redraw=False)
+        instr.stop('mpl.update_main_plots', t0)
+        self._schedule_paint()
+
+    @with_attribute('over_plots')
+    def update_over_data(self, data_list, fig_labels=[]):
+        """Update the data in each overlay plot.
+        Parameters
+        ----------
+        data_list : list
+            a list of ndarrays, one for each fig indicated in fig_labels
+            (or length-3, if fig_labels is empty)
+        fig_labels : list
+            the labels (SAG, COR, and/or AXI) of the figures to update
+        """
+        if fig_labels:
+            imgs = [self.over_plots[idx] for idx in fig_labels]
+        else:
+            imgs = self.over_plots
+        for img, data in zip(imgs, data_list):
+            img.set_data(data, redraw=False)
+        self._schedule_paint()
+
+    def initialize_plots(self, data_list, loc, ax_lims, **img_kw):
+        """Initialize the main plots of each orthogonal plane with the
+        images given in data_list.
+
+        Parameters
+        ----------
+        data_list : list-like
+            a list of images for the sagittal, coronal, and axial planes
+        loc : list-like
+            the (x,y,z) position at the intersection of the planes
+        ax_lims : list-like
+            a list of limit pairs, ie: [(xmin,xmax), (ymin,ymax), (zmin,zmax)]
+        img_kw : optional
+            any AxesImage image properties
+        """
+        self.unload_main_plots(draw=False)
+        self.unload_overlay_plots(draw=False)
+        # these are the new extents for each plot (sag, cor, axial)
+        self._full_fov_lims = ax_lims
+        plot_extents = limits_to_extents(ax_lims)
+        x,y,z = loc
+        self._xyz_position[:] = x,y,z
+        self.emit_states(SAG,COR,AXI)
+        fig_locs = [ (y,z), (x,z), (x,y) ]
+        for n, fig in enumerate(self.figs):
+            fig.set_limits(plot_extents[n])
+        self.main_plots = [f.spawn_image(p, loc=l, extent=e, **img_kw)
+                           for  f, p, l, e in zip(self.figs, data_list,
+                                                  fig_locs, plot_extents)]
+        self.draw()
+
+    @with_attribute('main_plots')
+    def update_main_plot_extents(self, ax_lims):
+        """Change the extents of the main plots, and the full FOV
+        limits, without re-making the plots (eg, when a finer level of
+        the main image arrives).
+
+        Parameters
+        ----------
+        ax_lims : list-like
+            a list of limit pairs, ie: [(xmin,xmax), (ymin,ymax), (zmin,zmax)]
+        """
+        ax_lims = [tuple(lim) for lim in ax_lims]
+        if ax_lims == [tuple(lim) for lim in self._full_fov_lims]:
+            return
+        self._full_fov_lims = ax_lims
+        plot_extents = limits_to_extents(ax_lims)
+        for fig, img, e in zip(self.figs, self.main_plots, plot_extents):
+            fig.set_limits(e)
+            img.img.set_extent(e)
+        self.draw()
+
+    def initialize_overlay_plots(self, data_list, ax_lims, **img_kw):
+        self.unload_overlay_plots(draw=False)
+        # these are the new extents for each plot (sag, cor, axial)
+        plot_extents = limits_to_extents(ax_lims)
+        self.over_plots = [f.spawn_image(p, extent=e, **img_kw)
+                           for  f, p, e in zip(self.figs, data_list,
+                                               plot_extents)]
+
+    def unload_main_plots(self, draw=True):
+        if self.main_plots:
+            for fig, im_plot in zip(self.figs, self.main_plots):
+                fig.pop_image(im_plot)
+        if draw:
+            self.draw()
+
+    def unload_overlay_plots(self, draw=True):
+        if self.over_plots:
+            for fig, im_plot in zip(self.figs, self.over_plots):
+                fig.pop_image(im_plot)
+        if draw:
+            self.draw()
+
+    @with_attribute('main_plots')
+    def coord_event_handling(self, event, emitting=True):
+        """Move the voxel of intersection to the point of a mouse event
+        on one of the figures. Returns the axes (ui, vi) whose coordinates
+        changed, which are emitted if `emitting` is True.
+        """
+        # 1) get two coords from the event canvas, and 3rd from the fixed axis
+        # 2) determine which are the transverse images
+        if event.xdata == None or event.ydata == None:
+            # must have been a stray hit
+            return
+        fig = self.canvas_lookup[event.canvas]
+        fig_limits = fig.xlim + fig.ylim
+        # be safe with the coordinates
+        pu = np.clip(event.xdata, fig_limits[0], fig_limits[1])
+        pv = np.clip(event.ydata, fig_limits[2], fig_limits[3])
+        fig_idx = self.figs.index(fig)
+        # these will be the indices in an xyz list that correspond to pu,pv,
+        # and also to the indices of the figures/images to update
+        ui, vi = transverse_plane_lookup(fig_idx)
+        xyz = self._xyz_position[:]
+        xyz[ui] = pu
+        xyz[vi] = pv
+        self._xyz_position = xyz[:]
+
+        self._update_crosshairs()
+
+        if emitting:
+            self.emit_states(ui, vi)
+        return ui, vi
+
+    def _update_crosshairs(self):
+        xyz = self.active_voxel
+        # now move the crosshairs on each plot
+        self.figs[SAG].move_crosshairs(xyz[COR], xyz[AXI], redraw=False)
+        self.figs[COR].move_crosshairs(xyz[SAG], xyz[AXI], redraw=False)
+        self.figs[AXI].move_crosshairs(xyz[SAG], xyz[COR], redraw=False)
+        self._schedule_paint()
+
+    def set_limits(self, limits):
+        """Set the axes limits on each SliceFigure.
+
+        Paramters
+        ---------
+        limits : iterable
+            the min/max limits (in mm units) for each SliceFigure in
+            sagittal, coronal, axial order
+        """
+        extents = limits_to_extents(limits)
+        for fig, lim in zip(self.figs, extents):
+            fig.set_limits(lim)
+
+    def toggle_crosshairs_visible(self, mode):
+        for fig in self.figs:
+            fig.toggle_crosshairs_visible(mode=mode)
+
+    def draw(self):
+        for fig in self.figs:
+            fig.draw()
+
+    def paint_frame(self):
+        """Paint all crosshair and image updates since the last frame,
+        once per figure.
+        """
+        t0 = instr.start()
+        for fig in self.figs:
+            fig.redraw_invalid()
+        instr.stop('ortho.paint_frame', t0)
+
+    def _schedule_paint(self):
+        # paint_frame() is called directly, unless a subclass schedules it
+        pass
+
+    def emit_states(self, *indices):
+        # the intersecting voxel changed along these axes
+        pass
@@ -27,6 +27,8 @@ from xipy.overlay.interface import overlay_thresholding_function, \
      make_mpl_image_properties
 from xipy.overlay.plugins import all_registered_plugins
 from xipy.io import load_spatial_image
+from xipy.workers import WorkerPool
+import xipy.instrumentation as instr
 
 interpolations = ['nearest', 'bilinear', 'sinc']
 cmaps = cm.cmap_d.keys()
@@ -49,9 +51,21 @@ class OrthoViewer(XIPYWindowApp):
         self.extra_setup_ui()
         self._image_loaded = False
         self._overlay_active = False
-
+        # counts the overlay resamplings submitted (or called off), and
+        # the overlay manager whose resampling is still pending
+        self._blend_generation = 0
+        self._blend_source = None
+        # the (overlay manager, overlay version) of the over image
+        self._over_source = None
+
+        # resample new overlays, and the finer levels of large images,
+        # in the background
+        self.workers = WorkerPool(nthreads=2)
         # only enforce vtk_order if necessary for Mayavi
-        self.blender = BlendedImages(vtk_order=mayavi_viewer)
+        self.blender = BlendedImages(vtk_order=mayavi_viewer,
+                                     workers=self.workers)
+        self.blender.on_trait_change(self._main_level_changed, 'main_level')
+        self.blender.on_trait_change(self._over_level_changed, 'over_level')
 
         if mayavi_viewer:
             # Creates Mayavi 3D view
@@ -166,23 +180,91 @@ class OrthoViewer(XIPYWindowApp):
         self._update_plugin_params()
         planes = self.blender.cut_image((0,0,0))
 
-        self.ortho_figs_widget.initialize_plots(planes, (0,0,0), limits)
+        interp = str(self.interp_box.currentText()) or 'nearest'
+        self.ortho_figs_widget.initialize_plots(planes, (0,0,0), limits,
+                                                interpolation=interp)
 
         if hasattr(self, 'mayavi_widget') and self.mayavi_widget is not None:
             self.mayavi_widget.mr_vis.blender = self.blender
 
+    @with_attribute('_image_loaded')
+    def _main_level_changed(self):
+        # a finer level of the main image has arrived (its bbox may be
+        # a little smaller than the preview's, but the slider ranges are
+        # left alone so that the current location is not reset)
+        self.image = self.blender.main
+        self._update_plugin_params()
+        # the plots are kept, with new data and extents
+        self.update_fig_data()
+        self.ortho_figs_widget.update_main_plot_extents(self.blender.bbox)
+
+    def _over_level_changed(self):
+        self.update_fig_data()
+
     def triggered_overlay_update(self, func_man):
-        print 'heard overlay upate signal'
-        self.blender.over = func_man.overlay
+        instr.count('ortho.overlay_updates')
+        if func_man.overlay is None:
+            self._set_over_slicer(None)
+            return
+        self._overlay_active = True
+        if self._patch_over_image(func_man):
+            return
+        # resample with the overlay properties as they are now (if they
+        # change before the result arrives, this is submitted again)
+        b = self.blender
+        self._blend_generation += 1
+        self._blend_source = func_man
+        # abandon this resampling as soon as the overlay manager starts
+        # on a newer overlay, or the overlay is removed
+        generation = func_man.overlay_generation
+        blend_generation = self._blend_generation
+        source = (func_man, func_man.overlay_version)
+        params = b.slicer_params('over')
+        self.workers.submit(
+            'blend', (lambda image: b.make_over_slicer(image, **params),),
+            args=(func_man.overlay,),
+            callback=lambda over: self._set_over_slicer(over, source),
+            valid=lambda: func_man.overlay_generation==generation and \
+                  self._blend_generation==blend_generation
+            )
+
+    def _patch_over_image(self, func_man):
+        # If the new overlay only changes the masking of a few points of
+        # the overlay on display (eg, the threshold moved a little), then
+        # only those points of the over image are updated
+        idx = func_man.changed_idx
+        if idx is None or self._blend_source is not None or \
+               self._over_source != (func_man, func_man.changed_from):
+            return False
+        data = func_man.overlay._data
+        mask = np.ma.getmask(data)
+        masked = None if mask is np.ma.nomask else mask.flat[idx]
+        values = np.ma.getdata(data).flat[idx]
+        if not self.blender.patch_over(idx, values, masked=masked):
+            return False
+        instr.count('ortho.overlay_patches')
+        self._over_source = (func_man, func_man.overlay_version)
+        self.update_fig_data()
+        return True
+
+    def _set_over_slicer(self, over, source=None):
+        self._blend_source = None
+        self._over_source = source
+        self.blender.over = over
         self.update_fig_data()
 
     def change_overlay_props(self, func_man):
         pdict = make_mpl_image_properties(func_man)
-        print 'heard props change'
+        instr.count('ortho.overlay_prop_changes')
         if 'norm' in pdict:
             n = pdict['norm']
             pdict['norm'] = (n.vmin, n.vmax)
+        old_norm = self.blender.over_norm
         self.blender.update_over_props(**pdict)
+        if self._blend_source is not None and \
+               self.blender.over_norm != old_norm:
+            # the pending resampling used the old normalization
+            self.triggered_overlay_update(self._blend_source)
         self.update_fig_data()
 
     @QtCore.pyqtSlot(str)
@@ -195,8 +277,12 @@ class OrthoViewer(XIPYWindowApp):
     @with_attribute('_overlay_active')
     def remove_overlay(self, bool):
         print 'unloading MR overlays'
+        # call off any pending resampling of the overlay
+        self._blend_generation += 1
+        self._blend_source = None
+        self._over_source = None
         self.blender.over = None
-        del self.over_img
+        self.over_img = None
         self._overlay_active = False
         self.update_fig_data()
         for tool in self._active_tools:
@@ -246,7 +332,19 @@ class OrthoViewer(XIPYWindowApp):
     def update_fig_data(self, xyz_loc=None, axes=(SAG, COR, AXI)):
         if xyz_loc is None:
             xyz_loc = self.ortho_figs_widget.active_voxel
-        planes = self.blender.cut_image(xyz_loc, axes=axes)
+        # a slicer may return preview planes while the location moves,
+        # and hand back the full quality planes (in this thread) later
+        planes = self.blender.cut_image_progressive(
+            xyz_loc, lambda refined: self._set_refined_planes(refined, axes),
+            axes=axes
+            )
+        self.ortho_figs_widget.update_main_plot_data(
+            planes, fig_labels=axes
+            )
+
+    @with_attribute('_image_loaded')
+    def _set_refined_planes(self, planes, axes):
+        instr.count('ortho.refined_planes')
         self.ortho_figs_widget.update_main_plot_data(
             planes, fig_labels=axes
             )
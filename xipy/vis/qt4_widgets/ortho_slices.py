@@ -1,10 +1,10 @@
 from PyQt4 import QtGui, QtCore
-from xipy.volume_utils import limits_to_extents
 from xipy.utils import with_attribute
-from xipy.slicing import SAG, COR, AXI, transverse_plane_lookup
+from xipy.slicing import SAG, COR, AXI
 from xipy.vis.qt4_widgets.auxiliary_window import TopLevelAuxiliaryWindow
+from xipy.vis.ortho_figures import OrthoFigures
 from xipy.vis import BLITTING
-import xipy.vis.single_slice_plot as ssp
+import xipy.instrumentation as instr
 
 import numpy as np
 
@@ -20,7 +20,7 @@ class FakeMPLEvent(object):
         self.xdata = x
         self.ydata = y
 
-class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
+class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow, OrthoFigures):
     """This class is a Qt4 panel displaying three SliceFigures which cut
     into the standard orthogonal planes of a volumetric medical image. The
     voxel of intersection is manipulated by moving crosshairs belonging to
@@ -28,6 +28,7 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
 
     This class can load/refresh base images and overlay images into the three
     SliceFigures, and emits PyQt4 signals when the intersecting voxel changes.
+    The display logic itself is in OrthoFigures.
     """
 
     
@@ -52,10 +53,6 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
     x_state = QtCore.pyqtSignal((int,), (float,), (float, float, float))
     y_state = QtCore.pyqtSignal((int,), (float,), (float, float, float))
     z_state = QtCore.pyqtSignal((int,), (float,), (float, float, float))
-    # this will allow a "read-only" ortho_figs.active_voxel inquiry
-    active_voxel = property(lambda x: x._xyz_position, None)
-    # this is to keep track of zooming to the full FOV
-    _full_fov_lims = [(-1,1), (-1,1), (-1,1)]
     # keep track of when to re-save the background plots after a resize
     _was_resized = False
     
@@ -64,53 +61,41 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
         dpi = kwargs.pop('dpi', 100)
         if 'limits' in kwargs:
             self._full_fov_lims = kwargs.pop('limits')
-        extents = limits_to_extents(self._full_fov_lims)
         QtGui.QWidget.__init__(self, parent)
         # set up the Sag, Cor, Axi SliceFigures
         self.horizontalLayout = QtGui.QHBoxLayout(self)
         self.horizontalLayout.setObjectName("FigureLayout")
 
-
-        # set axial figure
-        fig = Figure(figsize=figsize, dpi=dpi)
-        fig.canvas = Canvas(fig)
-        Canvas.setSizePolicy(fig.canvas, QtGui.QSizePolicy.Expanding,
-                             QtGui.QSizePolicy.Expanding)
-        Canvas.updateGeometry(fig.canvas)
-        fig.canvas.setParent(self)
-        self.axi_fig = ssp.SliceFigure(fig, extents[AXI], blit=BLITTING)
+        figures = []
+        for ax in (SAG, COR, AXI):
+            fig = Figure(figsize=figsize, dpi=dpi)
+            fig.canvas = Canvas(fig)
+            Canvas.setSizePolicy(fig.canvas, QtGui.QSizePolicy.Expanding,
+                                 QtGui.QSizePolicy.Expanding)
+            Canvas.updateGeometry(fig.canvas)
+            fig.canvas.setParent(self)
+            figures.append(fig)
+        self._init_figures(figures, blit=BLITTING)
         self.axi_fig.ax.set_xlabel('left to right', fontsize=8)
         self.axi_fig.ax.set_ylabel('posterior to anterior', fontsize=8)
-        self.horizontalLayout.addWidget(fig.canvas)
-        # set coronal figure
-        fig = Figure(figsize=figsize, dpi=dpi)
-        fig.canvas = Canvas(fig)
-        Canvas.setSizePolicy(fig.canvas, QtGui.QSizePolicy.Expanding,
-                             QtGui.QSizePolicy.Expanding)
-        Canvas.updateGeometry(fig.canvas)
-        fig.canvas.setParent(self)
-        self.cor_fig = ssp.SliceFigure(fig, extents[COR], blit=BLITTING)
         self.cor_fig.ax.set_xlabel('left to right', fontsize=8)
         self.cor_fig.ax.set_ylabel('inferior to superior', fontsize=8)
-        self.horizontalLayout.addWidget(fig.canvas)        
-        # set sagittal figure
-        fig = Figure(figsize=figsize, dpi=dpi)
-        fig.canvas = Canvas(fig)
-        Canvas.setSizePolicy(fig.canvas, QtGui.QSizePolicy.Expanding,
-                             QtGui.QSizePolicy.Expanding)
-        Canvas.updateGeometry(fig.canvas)
-        fig.canvas.setParent(self)
-        self.sag_fig = ssp.SliceFigure(fig, extents[SAG], blit=BLITTING)
         self.sag_fig.ax.set_xlabel('posterior to anterior', fontsize=8)
         self.sag_fig.ax.set_ylabel('inferior to superior', fontsize=8)        
-        self.horizontalLayout.addWidget(fig.canvas)
+        # lay out the figures in axial, coronal, sagittal order
+        for fig in (self.axi_fig, self.cor_fig, self.sag_fig):
+            self.horizontalLayout.addWidget(fig.canvas)
         
-        # put down figures in x, y, z order
-        self.figs = [self.sag_fig, self.cor_fig, self.axi_fig]
-        self.canvas_lookup = dict( ((f.canvas, f) for f in self.figs) )
         self._mouse_dragging = False
-        # this should be something like a signal too, which can emit status
-        self._xyz_position = [0,0,0]
+        # All crosshair and image updates caused by one event are painted
+        # together, once per canvas, when the event loop is next idle.
+        # Motion events that arrive before then are dropped, except for
+        # the latest one, which is handled after the paint.
+        self._paint_timer = QtCore.QTimer(self)
+        self._paint_timer.setSingleShot(True)
+        self._paint_timer.setInterval(0)
+        self._paint_timer.timeout.connect(self._paint_frame)
+        self._pending_event = None
         self._connect_events()
 
         self.setParent(parent)
@@ -118,9 +103,7 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
                                     QtGui.QSizePolicy.Expanding)
         QtGui.QWidget.updateGeometry(self)
         self._main_plotted = False
-        self.main_plots = []
         self._over_plotted = False
-        self.over_plots = []
 
     def _connect_events(self):
         for f in self.figs:
@@ -131,117 +114,13 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
             f.canvas.mpl_connect('motion_notify_event',
                                  self.xhair_motion)
 
-    def update_plot_data(self, data_list, fig_labels=[]):
-        """Update the data in each plot in each figure.
-        Parameters
-        ----------
-        data_list : list
-            a nested list of ndarrays, one for each fig indicated in fig_labels
-            (or length-3, if fig_labels is empty). Each nested list will contain
-            as many arrays as the corresponding figure has images.
-        fig_labels : list
-            the labels (SAG, COR, and/or AXI) of the figures to update
-        """
-        if fig_labels:
-            figs = [self.figs[idx] for idx in fig_labels]
-        else:
-            figs = self.figs
-##         print 'updating all data at figs:', fig_labels
-        for fig, data in zip(figs, data_list):
-            fig.set_data(data)
-
-    @with_attribute('main_plots')
-    def update_main_plot_data(self, data_list, fig_labels=[]):
-        """Update the data in each main plot.
-        Parameters
-        ----------
-        data_list : list
-            a list of ndarrays, one for each fig indicated in fig_labels
-            (or length-3, if fig_labels is empty)
-        fig_labels : list
-            the labels (SAG, COR, and/or AXI) of the figures to update
-        """
-        if fig_labels:
-            imgs = [self.main_plots[idx] for idx in fig_labels]
-        else:
-            imgs = self.main_plots
-        print 'updating main data at figs:', fig_labels
-        for img, data in zip(imgs, data_list):
-            img.set_data(data)
-
-    @with_attribute('over_plots')
-    def update_over_data(self, data_list, fig_labels=[]):
-        """Update the data in each overlay plot.
-        Parameters
-        ----------
-        data_list : list
-            a list of ndarrays, one for each fig indicated in fig_labels
-            (or length-3, if fig_labels is empty)
-        fig_labels : list
-            the labels (SAG, COR, and/or AXI) of the figures to update
-        """
-        if fig_labels:
-            imgs = [self.over_plots[idx] for idx in fig_labels]
-        else:
-            imgs = self.over_plots
-##         print 'updating overlay data at figs:', fig_labels
-        for img, data in zip(imgs, data_list):
-            img.set_data(data)
-
-    def initialize_plots(self, data_list, loc, ax_lims, **img_kw):
-        """Initialize the main plots of each orthogonal plane with the
-        images given in data_list.
-
-        Parameters
-        ----------
-        data_list : list-like
-            a list of images for the sagittal, coronal, and axial planes
-        extents : list-like
-            a list of extent pairs, ie: [(xmin,xmax), (ymin,ymax), (zmin,zmax)]
-        loc : list-like
-            the (x,y,z) position at the intersection of the planes
-        img_kw : optional
-            any AxesImage image properties
-        """
-        
-        self.unload_main_plots(draw=False)
-        self.unload_overlay_plots(draw=False)
-        # these are the new extents for each plot (sag, cor, axial)
-        self._full_fov_lims = ax_lims
-        plot_extents = limits_to_extents(ax_lims)
-        x,y,z = loc
-        self._xyz_position[:] = x,y,z
-        self.emit_states(SAG,COR,AXI)
-        fig_locs = [ (x,y), (y,z), (x,z) ]
-        for n, fig in enumerate(self.figs):
-            fig.set_limits(plot_extents[n])
-        self.main_plots = [f.spawn_image(p, loc=l, extent=e, **img_kw)
-                           for  f, p, l, e in zip(self.figs, data_list,
-                                                  fig_locs, plot_extents)]
-        self.draw()
-        
-    def initialize_overlay_plots(self, data_list, ax_lims, **img_kw):
-        self.unload_overlay_plots(draw=False)
-        # these are the new extents for each plot (sag, cor, axial)
-        plot_extents = limits_to_extents(ax_lims)
-        self.over_plots = [f.spawn_image(p, extent=e, **img_kw)
-                           for  f, p, e in zip(self.figs, data_list,
-                                               plot_extents)]
     @QtCore.pyqtSlot()
     def unload_main_plots(self, draw=True):
-        if self.main_plots:
-            for fig, im_plot in zip(self.figs, self.main_plots):
-                fig.pop_image(im_plot)
-        if draw:
-            self.draw()
+        OrthoFigures.unload_main_plots(self, draw=draw)
         
     @QtCore.pyqtSlot()
     def unload_overlay_plots(self, draw=True):
-        if self.over_plots:
-            for fig, im_plot in zip(self.figs, self.over_plots):
-                fig.pop_image(im_plot)
-        if draw:
-            self.draw()
+        OrthoFigures.unload_overlay_plots(self, draw=draw)
 
     def xhair_mousedn(self, event):
         self._mouse_dragging = event.inaxes is not None
@@ -249,53 +128,38 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
     def xhair_motion(self, event):
         if not self._mouse_dragging:
             return
+        if self._paint_timer.isActive():
+            # the last frame is still waiting to be painted
+            instr.count('ortho.dropped_motion_events')
+            self._pending_event = event
+            return
         self.coord_event_handling(event)
     def xhair_mouseup(self, event):
         if not self._mouse_dragging:
             return
+        self._pending_event = None
         self.coord_event_handling(event)
         self._mouse_dragging = False
 
-    @with_attribute('main_plots')
+    def _schedule_paint(self):
+        if not self._paint_timer.isActive():
+            self._paint_timer.start()
+
+    def _paint_frame(self):
+        self.paint_frame()
+        event = self._pending_event
+        self._pending_event = None
+        if event is not None and self._mouse_dragging:
+            self.coord_event_handling(event)
+
     def coord_event_handling(self, event, emitting=True):
-        # 1) get two coords from the event canvas, and 3rd from the fixed axis
-        # 2) determine which are the transverse images
-        if event.xdata == None or event.ydata == None:
-            # must have been a stray hit
-            return
-        if self._was_resized:
+        if self._was_resized and self.main_plots:
             for fig in self.figs:
                 fig.draw(save=True)
-            print 'saved plots'
             self._was_resized = False
-        fig = self.canvas_lookup[event.canvas]
-        fig_limits = fig.xlim + fig.ylim
-        # be safe with the coordinates
-        pu = np.clip(event.xdata, fig_limits[0], fig_limits[1])
-        pv = np.clip(event.ydata, fig_limits[2], fig_limits[3])
-        fig_idx = self.figs.index(fig)
-        # these will be the indices in an xyz list that correspond to pu,pv,
-        # and also to the indices of the figures/images to update
-        ui, vi = transverse_plane_lookup(fig_idx)
-        xyz = self._xyz_position[:]
-        xyz[ui] = pu
-        xyz[vi] = pv
-        self._xyz_position = xyz[:]
-
-        self._update_crosshairs()
-
-        # THE REST SHOULD BE TRIGGERED ON SOME KIND OF XYZ SIGNAL
-        if emitting:
-            self.emit_states(ui, vi)
-        
-    def _update_crosshairs(self):
-        xyz = self.active_voxel
-        # now move the crosshairs on each plot
-        self.figs[SAG].move_crosshairs(xyz[COR], xyz[AXI]) # sag gets yz
-        self.figs[COR].move_crosshairs(xyz[SAG], xyz[AXI]) # cor get xz
-        self.figs[AXI].move_crosshairs(xyz[SAG], xyz[COR]) # ax gets xy
+        return OrthoFigures.coord_event_handling(self, event,
+                                                 emitting=emitting)
         
-
     # for the SliceFigures, want to access:
     # PROPERTIES:
     # -- xlim, ylim (not wrapped here)
@@ -309,19 +173,6 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
     # -- draw(when=not now, save=False) (maybe?)
     #
 
-    def set_limits(self, limits):
-        """Set the axes limits on each SliceFigure.
-
-        Paramters
-        ---------
-        limits : iterable
-            the min/max limits (in mm units) for each SliceFigure in
-            sagittal, coronal, axial order
-        """
-        extents = limits_to_extents(limits)
-        for fig, lim in zip(self.figs, extents):
-            fig.set_limits(lim)
-
     @QtCore.pyqtSlot(int)
     def zoom_slices(self, zoom_idx):
         zooms = [-1, 160, 80, 40, 20, 10]
@@ -379,13 +230,11 @@ class MplQT4OrthoSlicesWidget(TopLevelAuxiliaryWindow):
 
     @QtCore.pyqtSlot(bool, name='toggleCrosshairsVisible')
     def toggle_crosshairs_visible(self, mode):
-        for fig in self.figs:
-            fig.toggle_crosshairs_visible(mode=mode)
+        OrthoFigures.toggle_crosshairs_visible(self, mode)
 
     @QtCore.pyqtSlot()
     def draw(self):
-        for fig in self.figs:
-            fig.draw()
+        OrthoFigures.draw(self)
 
     # for the SliceImage, want to access:
     # PROPERTIES:
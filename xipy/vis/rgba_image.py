@@ -0,0 +1,120 @@
+"""An AxesImage for planes of pre-colored RGBA bytes (such as the planes
+cut from BlendedImages). Instead of going through matplotlib's image
+pipeline, the plane is scaled to the pixels of the axes by nearest
+neighbor lookup tables, which only depend on the plane shape, the
+image extent, the view limits and the axes size, and are reused until
+one of those changes. No normalization, color mapping or interpolation
+is done when drawing (though the image's alpha is applied).
+
+Any other data, any interpolation but 'nearest' (or a matplotlib without
+the needed image factory) is drawn by the usual AxesImage methods.
+"""
+import numpy as np
+from matplotlib.image import AxesImage
+try:
+    from matplotlib import _image
+    _frombyte = _image.frombyte
+except (ImportError, AttributeError):
+    _frombyte = None
+
+def is_rgba_bytes(arr):
+    return arr.dtype.char == 'B' and arr.ndim == 3 and arr.shape[-1] == 4
+
+def nearest_pixel_tables(shape, extent, view, width, height, origin='lower'):
+    """Find the plane rows and columns seen at the centers of the
+    pixels of an axes box.
+
+    Parameters
+    ----------
+    shape : pair
+        the (rows, columns) shape of the plane
+    extent : iterable
+        the (left, right, bottom, top) extent of the plane, in data units
+    view : iterable
+        the (xmin, xmax, ymin, ymax) view limits of the axes
+    width, height : ints
+        the pixel size of the axes box
+    origin : 'lower' or 'upper'
+        the corner of the plane's [0,0] index
+
+    Returns
+    -------
+    rows, cols : the plane row of each pixel row, counting from the top
+        of the axes, and the plane column of each pixel column (or -1,
+        where the pixel is outside of the plane)
+    """
+    nrows, ncols = shape
+    x0, x1, y0, y1 = map(float, extent)
+    xmin, xmax, ymin, ymax = map(float, view)
+    x = xmin + (np.arange(width) + 0.5)*(xmax - xmin)/width
+    y = ymax - (np.arange(height) + 0.5)*(ymax - ymin)/height
+    cols = np.floor((x - x0)*ncols/(x1 - x0)).astype(np.intp)
+    if origin == 'upper':
+        rows = np.floor((y1 - y)*nrows/(y1 - y0)).astype(np.intp)
+    else:
+        rows = np.floor((y - y0)*nrows/(y1 - y0)).astype(np.intp)
+    cols[(cols < 0) | (cols >= ncols)] = -1
+    rows[(rows < 0) | (rows >= nrows)] = -1
+    return rows, cols
+
+def scale_rgba_plane(plane, rows, cols):
+    """Make the pixels of an axes box from an RGBA plane and its
+    nearest_pixel_tables(); pixels outside of the plane are transparent.
+    """
+    out = plane[rows.clip(0)][:,cols.clip(0)]
+    if (rows < 0).any():
+        out[rows < 0] = 0
+    if (cols < 0).any():
+        out[:,cols < 0] = 0
+    return out
+
+def apply_alpha(pixels, alpha):
+    """Scale the alpha channel of RGBA byte pixels by alpha, in place"""
+    a = pixels[...,3]
+    a[:] = (a * float(alpha)).round().clip(0, 255)
+    return pixels
+
+class RGBAImage(AxesImage):
+    """An AxesImage which draws RGBA byte planes directly, with nearest
+    neighbor scaling
+    """
+
+    def __init__(self, ax, **kwargs):
+        AxesImage.__init__(self, ax, **kwargs)
+        self._table_key = None
+        self._tables = None
+
+    def _pixel_tables(self, shape, width, height):
+        view = self.axes.viewLim
+        key = (shape, tuple(self.get_extent()),
+               (view.x0, view.x1, view.y0, view.y1),
+               width, height, self.origin)
+        if key != self._table_key:
+            self._tables = nearest_pixel_tables(
+                shape, key[1], key[2], width, height, origin=self.origin
+                )
+            self._table_key = key
+        return self._tables
+
+    def make_image(self, magnification=1.0, *args, **kwargs):
+        A = getattr(self, '_A', None)
+        if _frombyte is None or A is None or \
+               not isinstance(magnification, (int, float)):
+            return AxesImage.make_image(self, magnification, *args, **kwargs)
+        A = np.asarray(A)
+        if not is_rgba_bytes(A) or self.get_interpolation() != 'nearest':
+            return AxesImage.make_image(self, magnification, *args, **kwargs)
+        bbox = self.axes.bbox
+        width = int(round(bbox.width*magnification))
+        height = int(round(bbox.height*magnification))
+        if width <= 0 or height <= 0:
+            return None
+        rows, cols = self._pixel_tables(A.shape[:2], width, height)
+        pixels = np.ascontiguousarray(scale_rgba_plane(A, rows, cols))
+        alpha = self.get_alpha()
+        if alpha is not None and alpha != 1:
+            apply_alpha(pixels, alpha)
+        # the pixels are already at the output size (isoutput=1)
+        im = _frombyte(pixels, 1)
+        im.is_grayscale = False
+        return im
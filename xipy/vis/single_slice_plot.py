@@ -4,6 +4,9 @@ from matplotlib.image import AxesImage
 import numpy as np
 
 import xipy.colors.color_mapping as cm
+import xipy.instrumentation as instr
+from xipy.vis import FAST_RGBA
+from xipy.vis.rgba_image import RGBAImage, is_rgba_bytes
 
 now = True
 
@@ -28,14 +31,28 @@ class SliceFigure(object):
     matplotlib.figure.Figure object with one Axes. The figure will be drawn
     in some graphical backend that is determined a priori (such that
     fig.canvas is already a set attribute).
+
+    When blitting, the images and crosshairs are animated artists, which
+    full canvas draws leave out. After each full draw, the bare axes are
+    saved as the background, and new image data or crosshair positions
+    are redrawn into that region alone. The axes with the images (but
+    not the crosshairs) are also saved, so that moving the crosshairs
+    does not redraw the images. Blitting is only done on canvases which
+    support it (such as the Agg based canvases), and figures saved in
+    other formats must be saved with savefig(), which draws the animated
+    artists too.
     """
     img_num = 0
     def __init__(self, fig, limits, blit=True, px=0, py=0):
-        self._blit = blit
         self.fig = fig
         self.canvas = fig.canvas
+        self._blit = blit and hasattr(self.canvas, 'copy_from_bbox')
+        # the saved axes region without, and with, the images
         self.bkgrnd = None
-        self._noblit_list = []
+        self.img_bkgrnd = None
+        # redraws put off until redraw_invalid() is called
+        self._invalid = False
+        self._invalid_images = False
         self._slice_images = []
         self.px, self.py = px, py
         if not fig.axes:
@@ -43,6 +60,8 @@ class SliceFigure(object):
                                            adjustable='box')
         else:
             self.ax = self.fig.axes[-1]
+        if self._blit:
+            self.canvas.mpl_connect('draw_event', self._on_draw)
         self.set_limits(limits)
         self._init_crosshairs(px,py)
         self._saved_size = self.ax.bbox.size
@@ -83,11 +102,12 @@ class SliceFigure(object):
         col_line = Line2D(col_data[0], col_data[1],
                           color="r", linewidth=0.75, alpha=.5)
         self.crosshairs = (row_line, col_line)
+        if self._blit:
+            row_line.set_animated(True)
+            col_line.set_animated(True)
         ax = self.ax
         ax.add_artist(row_line)
         ax.add_artist(col_line)
-        self._noblit_list.append(row_line)
-        self._noblit_list.append(col_line)
 
     def _crosshairs_data(self, px, py):
         ylim = self.ylim
@@ -99,15 +119,48 @@ class SliceFigure(object):
         col_data = ((px, px), (py-xhair_len, py+xhair_len))
         return row_data, col_data
 
+    @instr.timed('mpl.draw_crosshairs')
     def _draw_crosshairs(self):
-        if hasattr(self, 'crosshairs') and self._blit:
-            if self.bkgrnd is not None:
-                self.canvas.restore_region(self.bkgrnd)
-            self.ax.draw_artist(self.crosshairs[0])
-            self.ax.draw_artist(self.crosshairs[1])
-            self.canvas.blit(self.ax.bbox)
-        else:
+        if not hasattr(self, 'crosshairs'):
+            return
+        if not self._can_blit():
             self.draw(when=now)
+            return
+        if self.img_bkgrnd is not None:
+            self.canvas.restore_region(self.img_bkgrnd)
+        else:
+            self._blit_images()
+        self._blit_crosshairs()
+
+    def _can_blit(self):
+        # blit only into a background saved at the current axes size
+        return self._blit and self.bkgrnd is not None and \
+               (self.ax.bbox.size == self._saved_size).all()
+
+    def _blit_images(self):
+        # restore the bare axes, draw the images into it, and save that
+        self.canvas.restore_region(self.bkgrnd)
+        for img in self.ax.images:
+            if img.get_visible():
+                self.ax.draw_artist(img)
+        self.img_bkgrnd = self.canvas.copy_from_bbox(self.ax.bbox)
+
+    def _blit_crosshairs(self):
+        for line in self.crosshairs:
+            if line.get_visible():
+                self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+    @instr.timed('mpl.update_images')
+    def update_images(self):
+        """Redraw the images, after their data or color properties have
+        changed. When blitting, only the axes region is redrawn.
+        """
+        if not self._can_blit():
+            self.draw()
+            return
+        self._blit_images()
+        self._blit_crosshairs()
             
     def set_limits(self, lims):
         self.xlim = lims[:2]
@@ -118,7 +171,7 @@ class SliceFigure(object):
 ##             im._extent = extent
 ##         self.set_limits(extent[:2], extent[2:])
     
-    def move_crosshairs(self, px, py):
+    def move_crosshairs(self, px, py, redraw=True):
         # if event happens outside of axes, px and/or py may be None
         if px is not None: self.px = px
         if py is not None: self.py = py
@@ -126,14 +179,43 @@ class SliceFigure(object):
         row_line, col_line = self.crosshairs
         row_line.set_data(*row_data)
         col_line.set_data(*col_data)
-        self._draw_crosshairs()
+        if redraw:
+            self._draw_crosshairs()
+        else:
+            self.invalidate()
+
+    def invalidate(self, images=False):
+        """Mark the crosshairs (and the images, if `images` is True) as
+        changed, to be redrawn at the next redraw_invalid() call
+        """
+        self._invalid = True
+        self._invalid_images = self._invalid_images or images
+
+    def redraw_invalid(self):
+        """Do any redrawing put off since the last call, once. Returns
+        True if anything was redrawn.
+        """
+        if not self._invalid:
+            return False
+        images = self._invalid_images
+        self._invalid = self._invalid_images = False
+        if images:
+            self.update_images()
+        else:
+            self._draw_crosshairs()
+        return True
 
     def toggle_crosshairs_visible(self, mode=True):
         for line in self.crosshairs:
             line.set_visible(mode)
         self.draw(when=now)
     
-    def spawn_image(self, sl_data, loc=None, **img_kws):
+    def spawn_image(self, sl_data, loc=None, fast_rgba=FAST_RGBA, **img_kws):
+        """Add an image of sl_data to the axes. Planes of RGBA bytes
+        are drawn by an RGBAImage, unless fast_rgba is False. Its direct
+        drawing is only done with 'nearest' interpolation, which is the
+        default for these planes.
+        """
         ax = self.ax
         ax.hold(True)
         if 'origin' not in img_kws:
@@ -143,7 +225,14 @@ class SliceFigure(object):
         if 'cmap' not in img_kws:
             # important to make SURE this is a home-grown colormap!
             img_kws['cmap'] = cm.jet
-        img = AxesImage(ax, **img_kws)
+        if fast_rgba and is_rgba_bytes(np.asarray(sl_data)):
+            if 'interpolation' not in img_kws:
+                img_kws['interpolation'] = 'nearest'
+            img = RGBAImage(ax, **img_kws)
+        else:
+            img = AxesImage(ax, **img_kws)
+        if self._blit:
+            img.set_animated(True)
         ax.images.append(img)
         s_img = SliceImage(self, img, sl_data)
         self._slice_images.append(s_img)
@@ -159,12 +248,16 @@ class SliceFigure(object):
         except:
             pass
 
-    def set_data(self, slice_list):
+    def set_data(self, slice_list, redraw=True):
         # be lax if slice_list comes in as a non-nested list of arrays
         if len(self._slice_images)==1 and type(slice_list) not in (list,tuple):
             slice_list = [slice_list]
         for img, data in zip(self._slice_images, slice_list):
-            img.set_data(data)
+            img.set_data(data, redraw=False)
+        if redraw:
+            self.update_images()
+        else:
+            self.invalidate(images=True)
 
     def get_imageobj(self, num=-1):
         if num < 0:
@@ -172,32 +265,54 @@ class SliceFigure(object):
         images = self.ax.images
         return images[num] if len(images) > num else None
 
+    def _on_draw(self, event):
+        # a full draw has left out the animated images and crosshairs
+        self._savebbox()
+        if self.bkgrnd is None:
+            return
+        self._blit_images()
+        for line in getattr(self, 'crosshairs', ()):
+            if line.get_visible():
+                self.ax.draw_artist(line)
+
+    @instr.timed('mpl.save_background')
     def _savebbox(self):
         if not self._blit:
             return
-        state = [artist.get_visible() for artist in self._noblit_list]
-        if any(state):
-            # should act NOW, but skip this section of the callback
-            for s, artist in zip(state, self._noblit_list):
-                if s:
-                    artist.set_visible(False)
-            self.draw(when=now)
-
         self.bkgrnd = self.canvas.copy_from_bbox(self.ax.bbox)
-        if any(state):
-            for s, artist in zip(state, self._noblit_list):
-                if s:
-                    artist.set_visible(True)
+        self._saved_size = self.ax.bbox.size
+
+    def _animated_artists(self):
+        return list(self.ax.images) + list(getattr(self, 'crosshairs', ()))
 
+    def savefig(self, *args, **kwargs):
+        """Save the figure (see matplotlib.figure.Figure.savefig). Unlike
+        fig.savefig, this includes the images and crosshairs in any format,
+        although they are animated when blitting.
+        """
+        artists = self._animated_artists()
+        for artist in artists:
+            artist.set_animated(False)
+        try:
+            self.fig.savefig(*args, **kwargs)
+        finally:
+            for artist in artists:
+                artist.set_animated(self._blit)
+        # the canvas was drawn for the saved figure
+        self.draw(save=True)
+
+    @instr.timed('mpl.draw')
     def draw(self, when=not now, save=False):
+        """Draw the whole canvas. The background is saved by each full
+        draw, but if `save` is True the draw is done at once (otherwise
+        the draw is idle, unless `when` is True).
+        """
         # if the axes have been resized, then force a save of the image
         if not (self.ax.bbox.size == self._saved_size).all():
-            print 'forcing a save'
+            instr.count('mpl.forced_save')
             self._saved_size = self.ax.bbox.size
             save = True
-        if save:
-            self._savebbox()
-        if when:
+        if when or save:
             # do blocking draw
             self.canvas.draw()
         else:
@@ -238,21 +353,21 @@ class SliceImage(object):
     @try_or_pass()
     def _set_cmap(self, cmap):
         self.img.set_cmap(cmap)
-        self.fig.draw(save=True)
+        self.fig.update_images()
     @try_or_pass()
     def _get_cmap(self):
         return self.img.get_cmap()        
     @try_or_pass()
     def _set_interp(self, interp):
         self.img.set_interpolation(interp)
-        self.fig.draw(save=True)
+        self.fig.update_images()
     @try_or_pass()
     def _get_interp(self):
         return self.img._interpolation
     @try_or_pass()
     def _set_norm(self, norm):
         self.img.set_norm(norm)
-        self.fig.draw(save=True)
+        self.fig.update_images()
     @try_or_pass()
     def _get_norm(self):
         return self.img.norm
@@ -260,7 +375,7 @@ class SliceImage(object):
     def _set_alpha(self, alpha):
         self.img.set_data(self.data)
         self.img.set_alpha(alpha)
-        self.fig.draw(save=True)
+        self.fig.update_images()
     @try_or_pass(default=1)
     def _get_alpha(self):
         return self.img.get_alpha()
@@ -281,13 +396,18 @@ class SliceImage(object):
             self.img.set_norm(props['norm'])
         if 'alpha' in props:
             self.img.set_alpha(props['alpha'])
-        self.fig.draw(save=True)
+        if 'extent' in props:
+            self.fig.draw(save=True)
+        else:
+            self.fig.update_images()
     
-    def set_data(self, data):
+    def set_data(self, data, redraw=True):
         self.data = data
         self.img.set_data(data)
-        self.fig.draw(save=True)
-##         self.fig.draw(save=True, when=now)
+        if redraw:
+            self.fig.update_images()
+        else:
+            self.fig.invalidate(images=True)
 
 
     
@@ -0,0 +1,258 @@
+"""Ortho snapshots of overlays (such as statistical maps) on an anatomical
+image, cut through the peak of each thresholded overlay, and made without
+any GUI -- no Qt application or Mayavi scene is created, and the figures
+are drawn with the Agg backend. This is meant for quality control figures
+made in batch, eg:
+
+    rows = snapshot_overlays('T1.nii', overlay_files, 'qc',
+                             tval=3.0, processes=8)
+    write_peak_table('qc/peaks.txt', rows)
+
+Each worker process loads (and resamples) the anatomical image once, and
+reuses it for all of the overlays that it is given.
+"""
+import os
+import multiprocessing
+
+import numpy as np
+import nipy.core.api as ni_api
+
+from xipy.slicing import SAG, COR, AXI
+from xipy.io import load_spatial_image
+from xipy.colors.rgba_blending import BlendedImages
+import xipy.colors.color_mapping as cm
+import xipy.volume_utils as vu
+
+peak_table_columns = ('overlay', 'snapshot', 'x', 'y', 'z',
+                      'i', 'j', 'k', 'value', 'unmasked', 'error')
+
+def threshold_overlay(image, tval=None, comp='less than'):
+    """Mask an overlay image as ImageOverlayManager does with its
+    threshold controls.
+
+    Parameters
+    ----------
+    image : NIPY Image
+        the overlay
+    tval : float, optional
+        the threshold value (if None, the overlay is not thresholded)
+    comp : str, optional
+        mask the values 'greater than' or 'less than' tval
+
+    Returns
+    -------
+    the masked array of overlay values
+    """
+    data = np.ma.masked_invalid(np.asarray(image))
+    if tval is None:
+        return data
+    if comp == 'greater than':
+        m = vu.threshold_mask(data.data, 'mask higher', (None, tval))
+    else:
+        m = vu.threshold_mask(data.data, 'mask lower', (tval, None))
+    return np.ma.masked_array(data.data, mask=np.ma.getmaskarray(data) | m,
+                              copy=False)
+
+def find_peak(work_arr, coordmap, ana_xform='absmax'):
+    """Find the peak of a masked overlay array, as
+    ImageOverlayManager.find_peak does for its first feature.
+
+    Parameters
+    ----------
+    work_arr : MaskedArray
+        the thresholded overlay values
+    coordmap : NIPY AffineTransform
+        the mapping of the array indices to world coordinates
+    ana_xform : str, optional
+        the feature transform: 'max', 'min' or 'absmax'
+
+    Returns
+    -------
+    the voxel index, the world coordinates of the voxel center and the
+    value of the peak (or Nones, if all of the values are masked)
+    """
+    if work_arr.count() == 0:
+        return None, None, None
+    if ana_xform == 'absmax':
+        pk_flat_idx = np.abs(work_arr).argmax()
+    elif ana_xform == 'max':
+        pk_flat_idx = work_arr.argmax()
+    else:
+        pk_flat_idx = work_arr.argmin()
+    vol_idx = np.array(np.lib.index_tricks.unravel_index(
+        pk_flat_idx, work_arr.shape))
+    xyz_a = coordmap(vol_idx)
+    xyz_b = coordmap(vol_idx+1)
+    pk_val = work_arr.data[tuple(vol_idx)]
+    return vol_idx, (xyz_a + xyz_b)/2, pk_val
+
+def ortho_figure(planes, bbox, loc, title='', dpi=80, size=3.0):
+    """Draw the sagittal, coronal and axial planes of a BlendedImages
+    (in that order, as cut_image returns them) side by side in an Agg
+    figure, with crosshairs at loc.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    extents = vu.limits_to_extents(bbox)
+    fig = Figure(figsize=(3*size, size + 0.4), dpi=dpi, facecolor='k')
+    FigureCanvasAgg(fig)
+    # plot positions, and the crosshair coordinates, of each plane
+    ax_spec = [ (AXI, (loc[0], loc[1])),
+                (COR, (loc[0], loc[2])),
+                (SAG, (loc[1], loc[2])) ]
+    for n, (ax_idx, (px, py)) in enumerate(ax_spec):
+        ax = fig.add_axes([n/3.0, 0, 1/3.0, size/(size + 0.4)],
+                          aspect='equal', axisbg='k')
+        ax.imshow(planes[ax_idx], extent=extents[ax_idx], origin='lower',
+                  interpolation='nearest')
+        ax.axhline(py, color='r', linewidth=0.75, alpha=.5)
+        ax.axvline(px, color='r', linewidth=0.75, alpha=.5)
+        ax.set_xlim(extents[ax_idx][:2])
+        ax.set_ylim(extents[ax_idx][2:])
+        ax.set_axis_off()
+    if title:
+        fig.text(.5, 1 - 0.2/(size + 0.4), title, color='w',
+                 ha='center', va='center', fontsize=9)
+    return fig
+
+class OverlaySnapshots(object):
+    """Makes the snapshots of overlays on one anatomical image. The
+    anatomical is loaded, and resampled into a BlendedImages, only once.
+    """
+
+    def __init__(self, anatomical, outdir='.', tval=None, comp='less than',
+                 ana_xform='absmax', over_cmap=None, over_alpha=1.0,
+                 dpi=80):
+        if isinstance(anatomical, basestring):
+            anatomical = load_spatial_image(anatomical)
+        self.blender = BlendedImages(main=anatomical)
+        self.outdir = outdir
+        self.tval = tval
+        self.comp = comp
+        self.ana_xform = ana_xform
+        self.over_cmap = over_cmap or cm.jet
+        self.over_alpha = over_alpha
+        self.dpi = dpi
+
+    def snapshot(self, overlay_file, fname=None):
+        """Threshold an overlay, find its peak, and write an ortho
+        snapshot cut at the peak to a PNG file.
+
+        Returns
+        -------
+        a dictionary of the peak_table_columns
+        """
+        if fname is None:
+            base = os.path.basename(overlay_file)
+            for ext in ('.gz', '.nii', '.hdr', '.img'):
+                if base.endswith(ext):
+                    base = base[:-len(ext)]
+            fname = os.path.join(self.outdir, base + '.png')
+        overlay = load_spatial_image(overlay_file)
+        work_arr = threshold_overlay(overlay, tval=self.tval,
+                                     comp=self.comp)
+        vox, loc, value = find_peak(work_arr, overlay.coordmap,
+                                    ana_xform=self.ana_xform)
+        row = dict(overlay=overlay_file, snapshot=fname,
+                   unmasked=work_arr.count(), value=value, error='')
+        row.update(zip('xyz', loc if loc is not None else [None]*3))
+        row.update(zip('ijk', vox if vox is not None else [None]*3))
+
+        raw = np.ma.masked_invalid(np.asarray(overlay))
+        if raw.count():
+            norm = (float(raw.min()), float(raw.max()))
+        else:
+            norm = (0.0, 0.0)
+        b = self.blender
+        b.set(over_cmap=self.over_cmap, over_alpha=self.over_alpha,
+              over_norm=norm, trait_change_notify=False)
+        b.over = ni_api.Image(work_arr, overlay.coordmap)
+        if loc is None:
+            # nothing survived the threshold, so cut through the center
+            loc = np.array(b.bbox, 'd').mean(axis=1)
+        planes = b.cut_image(loc)
+        title = os.path.basename(overlay_file)
+        if value is not None:
+            title += '  peak %1.3f at (%1.1f, %1.1f, %1.1f)'%(
+                (value,) + tuple(loc)
+                )
+        else:
+            title += '  (no unmasked points)'
+        fig = ortho_figure(planes, b.bbox, loc, title=title, dpi=self.dpi)
+        fig.savefig(fname, dpi=self.dpi, facecolor='k')
+        b.over = None
+        return row
+
+# -- Process pool workers -----------------------------------------------------
+# each worker process keeps its own OverlaySnapshots
+_snapshots = None
+
+def _init_worker(anatomical, kwargs):
+    global _snapshots
+    _snapshots = OverlaySnapshots(anatomical, **kwargs)
+
+def _snapshot_worker(overlay_file):
+    try:
+        return _snapshots.snapshot(overlay_file)
+    except Exception, e:
+        return dict(overlay=overlay_file, error='%s: %s'%(type(e).__name__, e))
+
+def snapshot_overlays(anatomical, overlays, outdir='.', processes=None,
+                      **kwargs):
+    """Make the snapshots of many overlays on one anatomical image.
+
+    Parameters
+    ----------
+    anatomical : str
+        the anatomical image file
+    overlays : sequence
+        the overlay image files
+    outdir : str, optional
+        the directory of the PNG files
+    processes : int, optional
+        the number of worker processes (by default, the number of CPUs).
+        If 1, the snapshots are made in this process.
+    kwargs : dict
+        other arguments of OverlaySnapshots
+
+    Returns
+    -------
+    the list of peak table rows (see OverlaySnapshots.snapshot), in the
+    order of the overlays. The rows of any overlays that failed have
+    their 'error' column set.
+    """
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    kwargs['outdir'] = outdir
+    if processes == 1:
+        _init_worker(anatomical, kwargs)
+        return map(_snapshot_worker, overlays)
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(anatomical, kwargs))
+    try:
+        rows = pool.map(_snapshot_worker, overlays, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return rows
+
+def write_peak_table(fname, rows):
+    """Write the peak table rows as tab separated columns (see
+    peak_table_columns)
+    """
+    f = open(fname, 'w')
+    try:
+        f.write('\t'.join(peak_table_columns) + '\n')
+        for row in rows:
+            vals = []
+            for col in peak_table_columns:
+                v = row.get(col, None)
+                if v is None:
+                    vals.append('')
+                elif isinstance(v, (float, np.floating)):
+                    vals.append('%1.4f'%v)
+                else:
+                    vals.append(str(v))
+            f.write('\t'.join(vals) + '\n')
+    finally:
+        f.close()
@@ -1,3 +1,4 @@
+import threading
 import numpy as np
 from nipy.core import api as ni_api
 ## from nipy.algorithms.resample import resample
@@ -5,6 +6,7 @@ from xipy.external import resample
 from nipy.core.reference.coordinate_map import drop_io_dim
 from scipy import ndimage
 from xipy.slicing import SAG, COR, AXI, xipy_ras
+import xipy.instrumentation as instr
 
 def fix_analyze_image(img, fliplr=False):
     cmap = img.coordmap
@@ -23,6 +25,38 @@ def fix_analyze_image(img, fliplr=False):
     cmap = drop_io_dim(cmap, 't')
     return ni_api.Image(arr, cmap)
 
+# the floating point type of interpolated (and spline filtered) data
+_working_precision = np.dtype(np.float32)
+
+def set_working_precision(dtype):
+    """Set the floating point type used to interpolate image data
+    (float32 by default, or float64)
+    """
+    global _working_precision
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        raise ValueError('working precision must be a floating point type')
+    _working_precision = dtype
+
+def get_working_precision():
+    return _working_precision
+
+def working_dtype(dtype, order=3):
+    """Return the data type to interpolate data of the given type with
+    a spline of the given order. Nearest neighbor interpolation (order 0)
+    keeps the input type, otherwise the working precision is used.
+
+    Examples
+    --------
+    >>> working_dtype('h', order=0)
+    dtype('int16')
+    >>> working_dtype('d')
+    dtype('float32')
+    """
+    if order == 0:
+        return np.dtype(dtype)
+    return _working_precision
+
 def voxel_size(T):
     """
     Return the edge lengths of the voxels along the (x,y,z) axes
@@ -219,9 +253,31 @@ def maximum_world_distance(limits):
     dist = ( (diffs)**2 ).sum(axis=-1)**.5
     return dist.max()
     
+@instr.timed('resample.world_grid')
 def resample_to_world_grid(img, bbox=None, grid_spacing=None, order=3,
-                           axis_permutation=None,
+                           axis_permutation=None, dtype=None,
                            **interp_kws):
+    """Resample an image onto a grid aligned with the {x,y,z} axes.
+
+    Parameters
+    ----------
+    img : a NIPY Image
+    bbox : iterable (optional)
+        the {x,y,z} limits of the new grid (by default, the box of img)
+    grid_spacing : iterable (optional)
+        the {x,y,z} voxel sizes of the new grid (by default, the voxel
+        sizes of img)
+    order : int (optional)
+        the spline order of the interpolation
+    axis_permutation : sequence (optional)
+        the array axis corresponding to each of {x,y,z}
+    dtype : numpy dtype (optional)
+        the data type of the resampled data (by default, see working_dtype)
+    interp_kws : dict
+        keyword arguments for the ndimage interpolator
+    """
+    if dtype is None:
+        dtype = working_dtype(img._data.dtype, order=order)
     cmap_ijk_xyz = img.coordmap.reordered_range(
         xipy_ras
         ).reordered_domain('ijk')
@@ -261,10 +317,238 @@ def resample_to_world_grid(img, bbox=None, grid_spacing=None, order=3,
                        img.coordmap.function_domain.coord_names)
     new_dims = np.take(new_dims, dim_ordering)
     new_img = resample.resample(img, resamp_affine, mapping.affine,
-                                tuple(new_dims), order=order, **interp_kws)
+                                tuple(new_dims), order=order,
+                                dtype=dtype, **interp_kws)
 
     return new_img
 
+def resample_binary_mask(mask, cval=True, **grid_kws):
+    """Resample a binary mask onto a grid aligned with the {x,y,z} axes,
+    by nearest neighbor interpolation of byte data (no floating point
+    copy of the mask is made).
+
+    Parameters
+    ----------
+    mask : a NIPY Image
+        the binary mask
+    cval : bool (optional)
+        the mask value outside of the mask's box
+    grid_kws : dict
+        the grid arguments of resample_to_world_grid (bbox, grid_spacing,
+        axis_permutation). Other interpolation arguments are ignored.
+
+    Returns
+    -------
+    a boolean ndarray
+    """
+    grid_kws = dict( [ (k, grid_kws[k]) for k in
+                       ('bbox', 'grid_spacing', 'axis_permutation')
+                       if k in grid_kws ] )
+    mdata = np.asarray(mask)
+    if mdata.dtype != np.uint8:
+        mdata = mdata.astype(np.uint8)
+    m_img = ni_api.Image(mdata, mask.coordmap)
+    m_resamp = resample_to_world_grid(m_img, order=0, cval=int(cval),
+                                      mode='constant', dtype=np.uint8,
+                                      **grid_kws)
+    return np.asarray(m_resamp).view(np.bool)
+
+def decimate_image(img, factor):
+    """Make a low resolution copy of a 3D image by taking every
+    factor-th voxel along each array axis (no smoothing is done).
+
+    Parameters
+    ----------
+    img : a NIPY Image
+    factor : int
+        the downsampling factor
+
+    Returns
+    -------
+    a new NIPY Image, whose voxels are factor times larger along each
+    axis, covering (about) the same world box as img
+    """
+    factor = int(factor)
+    data = np.asarray(img)
+    sub_data = data[ (slice(None, None, factor),)*3 ].copy()
+    cmap = img.coordmap
+    aff = cmap.affine.copy()
+    aff[:-1,:3] *= factor
+    sub_cmap = ni_api.AffineTransform(cmap.function_domain,
+                                      cmap.function_range, aff)
+    return ni_api.Image(sub_data, sub_cmap)
+
+class GridMap(object):
+    """A nearest neighbor lookup from the voxels of a target grid into
+    the voxels of a source grid, when the voxel-to-voxel mapping between
+    them is diagonal. The lookup tables only depend on the geometry of
+    the two grids, so one GridMap can resample any number of source
+    arrays sharing that geometry.
+    """
+
+    def __init__(self, scale, shift, src_shape, dst_shape):
+        """
+        Parameters
+        ----------
+        scale, shift : sequences
+            the target voxel (i,j,k) maps to the source voxel
+            trunc(scale*(i,j,k) + shift)
+        src_shape, dst_shape : tuples
+            the shapes of the source and target arrays
+        """
+        self.src_shape = tuple(src_shape)
+        self.dst_shape = tuple(dst_shape)
+        self.tables = []
+        valid = []
+        # the inverse tables are made on demand (see put)
+        self._inverse = None
+        for s, t, n_src, n_dst in zip(scale, shift, src_shape, dst_shape):
+            # truncate towards zero, as in resize_lookup_array()
+            table = np.trunc(np.arange(n_dst)*s + t).astype(np.intp)
+            inside = (table >= 0) & (table < n_src)
+            table[~inside] = 0
+            self.tables.append(table)
+            valid.append(inside)
+        self._valid = valid
+        # (np.ix_ would turn the boolean vectors into indices)
+        ndim = len(valid)
+        valid = [ v.reshape( (1,)*n + (-1,) + (1,)*(ndim-n-1) )
+                  for n, v in enumerate(valid) ]
+        inside = reduce(np.logical_and, valid)
+        if inside.all():
+            self.outside = None
+        else:
+            self.outside = np.logical_not(inside)
+
+    @instr.timed('resample.grid_map_take')
+    def take(self, arr, cval=0):
+        """Resample arr onto the target grid, filling target voxels
+        outside of the source grid with cval
+        """
+        if arr.shape != self.src_shape:
+            raise ValueError('array shape does not match the source grid')
+        resampled = arr[np.ix_(*self.tables)]
+        if self.outside is not None:
+            resampled[self.outside] = cval
+        return resampled
+
+    def _inverse_tables(self):
+        # for each axis, the target indices sorted by the source index
+        # they map to, and where the targets of each source index start
+        if self._inverse is None:
+            inverse = []
+            for table, inside, n_src in zip(self.tables, self._valid,
+                                            self.src_shape):
+                dst_idx = inside.nonzero()[0]
+                src_idx = table[dst_idx]
+                order = np.argsort(src_idx, kind='mergesort')
+                starts = np.searchsorted(src_idx[order], np.arange(n_src+1))
+                inverse.append( (dst_idx[order], starts) )
+            self._inverse = inverse
+        return self._inverse
+
+    def put(self, dst, src_flat_idx, values):
+        """Patch a resampled array in-place: set every voxel of dst
+        which looks up one of a few source voxels to the new value of
+        that source voxel. This costs time in proportion to the number
+        of target voxels changed, rather than the size of the grid.
+
+        Parameters
+        ----------
+        dst : ndarray
+            an array on the target grid (eg, made by take())
+        src_flat_idx : ndarray
+            (unique) flat indices into the source grid
+        values : ndarray
+            the new values of the source voxels
+
+        Returns
+        -------
+        the bounding box of the changed target voxels as a tuple of
+        slices, or None if no target voxel was changed
+        """
+        if dst.shape != self.dst_shape:
+            raise ValueError('array shape does not match the target grid')
+        src_flat_idx = np.asarray(src_flat_idx)
+        if not src_flat_idx.size:
+            return None
+        src = np.unravel_index(src_flat_idx, self.src_shape)
+        ndim = len(src)
+        dst_axes = []
+        for n, ((dst_idx, starts), c) in enumerate(zip(self._inverse_tables(),
+                                                       src)):
+            first = starts[c]
+            count = starts[c+1] - first
+            width = count.max()
+            if not width:
+                return None
+            offsets = np.arange(width)
+            pos = np.minimum(first[:,None] + offsets, len(dst_idx)-1)
+            shape = [len(c)] + [1]*ndim
+            shape[n+1] = width
+            dst_axes.append( (dst_idx[pos].reshape(shape),
+                              (offsets < count[:,None]).reshape(shape)) )
+        # each source voxel maps to a block of target voxels
+        ok = reduce(np.logical_and, [v for i, v in dst_axes])
+        values = np.asarray(values).reshape( (-1,) + (1,)*ndim )
+        arrays = np.broadcast_arrays(*([i for i, v in dst_axes] + [values, ok]))
+        ok = arrays[-1]
+        if not ok.any():
+            return None
+        dst_ijk = [a[ok] for a in arrays[:ndim]]
+        dst[tuple(dst_ijk)] = arrays[ndim][ok]
+        return tuple( [slice(i.min(), i.max()+1) for i in dst_ijk] )
+
+# GridMaps of recently seen pairs of grids, most recent last
+_grid_maps = []
+_grid_map_cache_size = 10
+_grid_map_lock = threading.Lock()
+
+def grid_map(src_affine, src_shape, dst_affine, dst_shape):
+    """Return the GridMap from a target grid into a source grid. The
+    maps are cached, so that overlays sharing the same geometry (eg,
+    the contrasts of one analysis) are all resampled with the same tables.
+
+    Parameters
+    ----------
+    src_affine, dst_affine : ndarrays
+        the voxel to world affines of the source and target grids, which
+        must map into the same world space
+    src_shape, dst_shape : tuples
+        the shapes of the source and target arrays
+    """
+    src_affine = np.asarray(src_affine, 'd')
+    dst_affine = np.asarray(dst_affine, 'd')
+    key = (src_affine.tostring(), tuple(src_shape),
+           dst_affine.tostring(), tuple(dst_shape))
+    _grid_map_lock.acquire()
+    try:
+        for n, (k, gmap) in enumerate(_grid_maps):
+            if k == key:
+                _grid_maps.append(_grid_maps.pop(n))
+                return gmap
+    finally:
+        _grid_map_lock.release()
+    vox_to_vox = np.dot(np.linalg.inv(src_affine), dst_affine)
+    ndim = len(dst_shape)
+    # this is supposed to be diagonal!!
+    gmap = GridMap(vox_to_vox.diagonal()[:ndim], vox_to_vox[:ndim,-1],
+                   src_shape, dst_shape)
+    _grid_map_lock.acquire()
+    try:
+        _grid_maps.append( (key, gmap) )
+        while len(_grid_maps) > _grid_map_cache_size:
+            _grid_maps.pop(0)
+    finally:
+        _grid_map_lock.release()
+    return gmap
+
+def clear_grid_maps():
+    _grid_map_lock.acquire()
+    try:
+        del _grid_maps[:]
+    finally:
+        _grid_map_lock.release()
 
 def find_image_threshold(arr, percentile=90., debug=False):
     nbins = 200
@@ -308,6 +592,37 @@ def find_image_threshold(arr, percentile=90., debug=False):
     
     return thresh, pval
 
+def threshold_mask(values, mode, limits, type='negative'):
+    """Evaluate a threshold condition on an array of values.
+
+    Parameters
+    ----------
+    values : ndarray
+        scalar values to test
+    mode : str
+        'mask lower', 'mask higher', 'mask between' or 'mask outside'
+        (see ThresholdMap)
+    limits : pair
+        the (lower, upper) threshold limits
+    type : str, optional
+        By default, make a MaskedArray convention mask ('negative').
+        Otherwise, set mask to True where values are unmasked ('positive')
+    """
+    map = values
+    if mode=='mask lower':
+        m = (map < limits[0]) if type=='negative' else (map >= limits[0])
+    elif mode=='mask higher':
+        m = (map > limits[1]) if type=='negative' else (map <= limits[1])
+    elif mode=='mask between':
+        m = ( (map > limits[0]) & (map < limits[1]) ) \
+            if type=='negative' \
+            else ( (map <= limits[0]) | (map >= limits[1]) )
+    else: # mask outside
+        m = ( (map < limits[0]) | (map > limits[1]) ) \
+            if type=='negative' \
+            else ( (map >= limits[0]) & (map <= limits[1]) )
+    return m
+
 def auto_brain_mask(image_arr, negative=False):
     """ Build a mask function that attempts to segment the brain image
     from the background image.
@@ -333,6 +648,125 @@ def auto_brain_mask(image_arr, negative=False):
     cc_mask = (labels==max_label)
     return np.logical_not(cc_mask) if negative else cc_mask
 
+# the number of set bits in each byte value
+_popcount = np.array([bin(n).count('1') for n in xrange(256)], np.uint8)
+
+class PackedMask(object):
+    """A 3D binary mask stored with 8 voxels per byte (packed along the
+    last array axis). Masks may be combined, counted and patched in the
+    packed form, and planes are unpacked on demand for slicing.
+    """
+
+    def __init__(self, mask):
+        """
+        Parameters
+        ----------
+        mask : ndarray
+            a 3D boolean array
+        """
+        mask = np.asarray(mask)
+        if mask.ndim != 3:
+            raise ValueError('only 3D masks are packed')
+        self.shape = mask.shape
+        self.bits = np.packbits(mask.astype(np.bool), axis=-1)
+
+    @classmethod
+    def _from_bits(klass, bits, shape):
+        pm = klass.__new__(klass)
+        pm.shape = shape
+        pm.bits = bits
+        return pm
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def unpack(self):
+        """Return the mask as a boolean array"""
+        nk = self.shape[-1]
+        return np.unpackbits(self.bits, axis=-1)[...,:nk].view(np.bool)
+
+    def plane(self, axis, idx):
+        """Return the boolean plane of the mask normal to an array axis"""
+        if axis < 2:
+            slicer = [slice(None)]*3
+            slicer[axis] = idx
+            packed = self.bits[tuple(slicer)]
+            return np.unpackbits(packed, axis=-1)[:,:self.shape[-1]].view(
+                np.bool
+                )
+        byte, bit = divmod(idx, 8)
+        return ((self.bits[:,:,byte] >> (7-bit)) & 1).view(np.bool)
+
+    def count(self):
+        """Return the number of voxels set in the mask"""
+        # (the byte counts are summed without an intp temporary)
+        return int(np.add.reduce(_popcount[self.bits].ravel(), dtype=np.intp))
+
+    def _bit_address(self, flat_idx):
+        i, j, k = np.unravel_index(flat_idx, self.shape)
+        byte, bit = np.divmod(k, 8)
+        return (i, j, byte), (1 << (7-bit)).astype(np.uint8)
+
+    def take(self, flat_idx):
+        """Return the mask values at flat indices into the unpacked mask"""
+        address, bit_vals = self._bit_address(flat_idx)
+        return (self.bits[address] & bit_vals) != 0
+
+    def put(self, flat_idx, values):
+        """Set the mask values at (unique) flat indices into the unpacked
+        mask
+        """
+        address, bit_vals = self._bit_address(flat_idx)
+        values = np.asarray(values, np.bool)
+        np.bitwise_and.at(self.bits, address, ~bit_vals)
+        np.bitwise_or.at(self.bits, address, bit_vals * values)
+
+    def __and__(self, other):
+        return PackedMask._from_bits(self.bits & other.bits, self.shape)
+
+    def __or__(self, other):
+        return PackedMask._from_bits(self.bits | other.bits, self.shape)
+
+    def __invert__(self):
+        bits = ~self.bits
+        # keep the padding bits of the last byte clear
+        pad = (-self.shape[-1]) % 8
+        if pad:
+            bits[...,-1] &= (0xff << pad) & 0xff
+        return PackedMask._from_bits(bits, self.shape)
+
+def flat_index_bbox(flat_idx, shape):
+    """
+    Find the bounding box of a set of flat array indices.
+
+    Parameters
+    ----------
+    flat_idx : sequence
+        indices into the flattened (C-order) array
+    shape : tuple
+        the array shape
+
+    Returns
+    -------
+    a tuple of slices (one per dimension) covering the indexed points,
+    or None if flat_idx is empty
+
+    Examples
+    --------
+    >>> flat_index_bbox([5, 42], (4,5,6))
+    (slice(0, 2, None), slice(0, 3, None), slice(0, 6, None))
+    """
+    flat_idx = np.asarray(flat_idx)
+    if not flat_idx.size:
+        return None
+    coords = np.unravel_index(flat_idx, shape)
+    return tuple( [slice(c.min(), c.max()+1) for c in coords] )
+
 def calc_grid_and_map(vox_indices, grid=[]):
     """
     Given a table of volume array indices, calculate the 3D grid size
@@ -365,17 +799,19 @@ def calc_grid_and_map(vox_indices, grid=[]):
     >>> img[10,2,2], img[8,5,13]
     (1.0, 1.0)
     """
-    if not grid:
+    if not len(grid):
         ni, nj, nk = vox_indices.max(axis=0) + 1
     else:
         ni, nj, nk = grid
-    strides = np.array([nj*nk, nk, 1])
-    flat_map = (vox_indices*strides).sum(axis=1)
+    flat_map = np.ravel_multi_index(tuple(np.asarray(vox_indices).T),
+                                    (ni, nj, nk))
     return (ni, nj, nk), flat_map
 
 def signal_array_to_masked_vol(sig, vox_indices,
                                grid_shape=[],
                                prior_mask=None,
+                               out=None,
+                               dtype=None,
                                **ma_kw):
     """Make a 3D array representing a mask for valid voxels locations,
     given an array of voxel indices.
@@ -392,6 +828,13 @@ def signal_array_to_masked_vol(sig, vox_indices,
     prior_mask : array-like (optional)
         an nvox length array indicating points to mask in the final volume
         (True = masked, same as MaskedArray convention)
+    out : MaskedArray (optional)
+        a C-contiguous array, shaped grid_shape + sig.shape[1:], to fill
+        in place (eg, the output of a previous call for another frame of
+        a time-resolved map). Its mask is reset, and its data are only
+        written at the map voxels.
+    dtype : numpy dtype (optional)
+        the data type of a new output array (by default, sig.dtype)
     ma_kw : dict
         Keyword arguments for np.ma.masked_array
 
@@ -403,30 +846,43 @@ def signal_array_to_masked_vol(sig, vox_indices,
         return np.ma.masked_array(np.empty((1,1,1)),
                                   mask=np.ones((1,1,1), dtype=np.bool),
                                   **ma_kw)
+    if out is not None and not len(grid_shape):
+        grid_shape = out.shape[:3]
     grid, flat_idx = calc_grid_and_map(vox_indices, grid=grid_shape)
-    ix, jx, kx = grid
-    
-    vmask = np.ones((ix,jx,kx) + sig.shape[1:], np.bool)
-    s = np.zeros((ix,jx,kx) + sig.shape[1:], sig.dtype)
+    vol_shape = tuple(grid) + sig.shape[1:]
+
+    if out is None:
+        s = np.zeros(vol_shape, dtype or sig.dtype)
+        vmask = np.ones(vol_shape, np.bool)
+        ma_kw.setdefault('copy', False)
+        out = np.ma.masked_array(s, mask=vmask, **ma_kw)
+        # (a copy may have been requested)
+        s = out.data
+        vmask = out.mask
+    else:
+        if out.shape != vol_shape:
+            raise ValueError('output array has the wrong shape: %s '\
+                             '(expected %s)'%(out.shape, vol_shape))
+        if out.mask is np.ma.nomask:
+            out.mask = np.ones(vol_shape, np.bool)
+        else:
+            out.mask.fill(True)
+        s = out.data
+        vmask = out.mask
+        if not (s.flags.c_contiguous and vmask.flags.c_contiguous):
+            raise ValueError('output array must be C-contiguous')
 
     if prior_mask is not None:
-        umsk_idx = ~prior_mask
-        i, j, k = vox_indices[umsk_idx].T
+        umsk_idx = ~np.asarray(prior_mask)
         sig = sig[umsk_idx]
         flat_idx = flat_idx[umsk_idx]
-    else:
-        i, j, k = vox_indices.T
-
-    if sig.shape[1:]:
-        # then we need to add more indices
-        vx = np.product(sig.shape[1:])
-        v = np.arange(vx)
-        flat_idx *= vx
-        flat_idx = (flat_idx[:,None] + v).reshape(-1)
-
-    np.put(s, flat_idx, sig)
-    np.put(vmask, flat_idx, False)
-    return np.ma.masked_array(s, mask=vmask, **ma_kw)
+
+    # set the measures of each voxel as rows of the flattened grid
+    # (these reshapes are views of the contiguous output arrays)
+    row_shape = (-1,) + sig.shape[1:]
+    s.reshape(row_shape)[flat_idx] = sig
+    vmask.reshape(row_shape)[flat_idx] = False
+    return out
 
 
 ## class FlatSubVolume(object):
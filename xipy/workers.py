@@ -0,0 +1,246 @@
+"""A small pool of background threads for the heavy stages of overlay
+computations (normalizing, slicing, masking, sorting, resampling), so
+that they do not run in the GUI thread.
+
+Jobs are submitted on named channels. A channel runs one job at a time,
+and a job submitted to a busy channel supersedes any job already waiting
+or running there: the waiting job is dropped, and the running job is
+abandoned at its next stage boundary, or at its next checkpoint() call
+within a stage. Each job is tagged with a generation number, counting
+the submissions to its channel. Results of finished jobs are handed to
+a delivery function, which by default calls back in the GUI thread, and
+a result is only passed to its callback if its job is still current.
+"""
+import threading
+import Queue
+import traceback
+
+class JobCancelled(Exception):
+    """Raised by checkpoint() in a job that has been cancelled"""
+    pass
+
+# the job running in each worker thread
+_current = threading.local()
+
+def checkpoint():
+    """Abandon the calling job, by raising JobCancelled, if it has been
+    cancelled or superseded. Outside of a job, this does nothing.
+    """
+    job = getattr(_current, 'job', None)
+    if job is not None and job.cancelled:
+        raise JobCancelled
+
+def gui_deliver(callback, *args):
+    """Deliver a result by calling callback(*args) in the GUI thread
+    """
+    from enthought.pyface.api import GUI
+    GUI.invoke_later(callback, *args)
+
+def direct_deliver(callback, *args):
+    """Deliver a result by calling callback(*args) in the worker thread
+    """
+    callback(*args)
+
+class Job(object):
+    """A sequence of stages to be run in a worker thread. The first stage
+    is called with the job's args, and every later stage is called with
+    the result of the stage before it.
+    """
+
+    def __init__(self, channel, stages, args=(), callback=None,
+                 generation=0, valid=None):
+        """
+        Parameters
+        ----------
+        channel : hashable
+            the channel name
+        stages : sequence of callables
+            the stages of the job
+        args : tuple, optional
+            the arguments to the first stage
+        callback : callable, optional
+            called as callback(result) with the output of the last stage
+        generation : int, optional
+            the generation tag of this job
+        valid : callable, optional
+            a predicate which returns False once the job's inputs are
+            out of date, (eg, when a newer version of them is being made)
+        """
+        self.channel = channel
+        self.stages = stages
+        self.args = args
+        self.callback = callback
+        self.generation = generation
+        self.valid = valid
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        if self._cancelled.isSet():
+            return True
+        if self.valid is not None and not self.valid():
+            self._cancelled.set()
+            return True
+        return False
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self, deliver):
+        """Run the stages, and hand the result to deliver(). Returns
+        False if the job was abandoned.
+        """
+        _current.job = self
+        try:
+            result = self.args
+            for n, stage in enumerate(self.stages):
+                checkpoint()
+                result = stage(*result) if n == 0 else stage(result)
+            checkpoint()
+        except JobCancelled:
+            return False
+        finally:
+            _current.job = None
+        if self.callback is not None:
+            deliver(self._finish, result)
+        return True
+
+    def _finish(self, result):
+        # the job may have been superseded while the result was delivered
+        if not self.cancelled:
+            self.callback(result)
+
+class WorkerPool(object):
+    """A pool of worker threads running Jobs from named channels
+    """
+
+    def __init__(self, nthreads=2, deliver=gui_deliver):
+        """
+        Parameters
+        ----------
+        nthreads : int, optional
+            the number of worker threads
+        deliver : callable, optional
+            the function deliver(callback, result) that hands a job's
+            result back to its callback (by default, in the GUI thread)
+        """
+        self.deliver = deliver
+        # counts of jobs run to completion and jobs abandoned
+        self.jobs_finished = 0
+        self.jobs_abandoned = 0
+        self._generations = dict()
+        self._queue = Queue.Queue()
+        # the latest job waiting on each channel, and the job running
+        self._pending = dict()
+        self._running = dict()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads = []
+        for n in xrange(nthreads):
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, channel, stages, args=(), callback=None, valid=None):
+        """Submit a sequence of stages to run on a channel, superseding
+        any job already waiting or running there.
+
+        Parameters
+        ----------
+        channel : hashable
+            the channel name
+        stages : sequence of callables
+            the stages of the job
+        args : tuple, optional
+            the arguments to the first stage
+        callback : callable, optional
+            called as callback(result) with the output of the last stage,
+            if the job was not superseded
+        valid : callable, optional
+            a predicate which returns False once the job is out of date
+
+        Returns
+        -------
+        the new Job
+        """
+        self._lock.acquire()
+        try:
+            generation = self._generations.get(channel, 0) + 1
+            self._generations[channel] = generation
+            job = Job(channel, stages, args=args, callback=callback,
+                      generation=generation, valid=valid)
+            old_job = self._pending.get(channel)
+            if old_job is not None:
+                old_job.cancel()
+                self.jobs_abandoned += 1
+            running_job = self._running.get(channel)
+            if running_job is not None:
+                running_job.cancel()
+            self._pending[channel] = job
+            if old_job is None and running_job is None:
+                self._queue.put(channel)
+        finally:
+            self._lock.release()
+        return job
+
+    def generation(self, channel):
+        """The generation of the latest job submitted to channel"""
+        return self._generations.get(channel, 0)
+
+    def wait(self, timeout=None):
+        """Block until all submitted jobs are finished (or cancelled).
+        Returns True if the pool is idle.
+        """
+        self._lock.acquire()
+        try:
+            if timeout is None:
+                while self._pending or self._running:
+                    self._idle.wait()
+            elif self._pending or self._running:
+                self._idle.wait(timeout)
+            return not (self._pending or self._running)
+        finally:
+            self._lock.release()
+
+    def shutdown(self):
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            channel = self._queue.get()
+            if channel is None:
+                return
+            self._lock.acquire()
+            try:
+                job = self._pending.pop(channel, None)
+                if job is not None:
+                    self._running[channel] = job
+            finally:
+                self._lock.release()
+            if job is None:
+                continue
+            finished = None
+            try:
+                finished = job.run(self.deliver)
+            except:
+                print 'error in job on channel', channel
+                traceback.print_exc()
+            self._lock.acquire()
+            try:
+                if finished:
+                    self.jobs_finished += 1
+                elif finished is not None:
+                    self.jobs_abandoned += 1
+                del self._running[channel]
+                if channel in self._pending:
+                    # a new job was submitted while this one ran
+                    self._queue.put(channel)
+                elif not (self._pending or self._running):
+                    self._idle.notifyAll()
+            finally:
+                self._lock.release()